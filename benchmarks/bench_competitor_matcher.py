@@ -0,0 +1,53 @@
+# Micro-benchmark: CompetitorMatcher cost per answer as the alias table grows
+# NER is stubbed out and only counted; the real pipeline runs it on those sentences.
+# Run: python benchmarks/bench_competitor_matcher.py
+import os
+import random
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from competitor_matcher import DEFAULT_ALIAS_TABLE, CompetitorMatcher
+
+ANSWERS = [
+    "Economy Class passengers may check in up to 30kg of baggage. Premium Economy passengers may check in up to 35kg.",
+    "Online check-in opens 48 hours before departure. You can also check in at the airport counter.",
+    "Refunds for unused tickets can be requested through Manage Booking. Fly Emirates offers a similar policy.",
+    "KrisFlyer miles can be earned on Star Alliance partners. Delta is not one of them.",
+    "Your connecting flight EK 405 departs from Terminal 1. Please allow two hours for transit.",
+]
+
+
+class _NoEntities:
+    ents = ()
+
+
+def make_table(n, rng):
+    table = dict(DEFAULT_ALIAS_TABLE)
+    letters = "ABCDEFGHIJKLMNOPQRSTUVWXYZ"
+    while len(table) < n:
+        name = "".join(rng.choice(letters.lower()) for _ in range(rng.randint(5, 9))).title()
+        table[f"{name} Airways"] = {
+            "aliases": [f"{name} Airways", f"{name} Air", f"Fly {name}"],
+            "codes": [rng.choice(letters) + rng.choice(letters + "0123456789")],
+        }
+    return table
+
+
+def main(sizes=(25, 250, 2_500), number=500):
+    rng = random.Random(0)
+    print(f"{'carriers':>9} {'aliases':>8} {'build ms':>9} {'us/answer':>10} {'NER sentences/answer':>21}")
+    for n in sizes:
+        table = make_table(n, rng)
+        build_s = timeit.timeit(lambda: CompetitorMatcher(table, nlp=lambda s: _NoEntities()), number=1)
+        matcher = CompetitorMatcher(table, nlp=lambda s: _NoEntities())
+        per_answer = timeit.timeit(lambda: [matcher.filter(a) for a in ANSWERS], number=number)
+        per_answer /= number * len(ANSWERS)
+        ner = matcher.ner_calls / (number * len(ANSWERS))
+        aliases = sum(len(e.get("aliases", [])) + len(e.get("codes", [])) + len(e.get("ambiguous", []))
+                      for e in table.values())
+        print(f"{n:9d} {aliases:8d} {build_s * 1e3:9.1f} {per_answer * 1e6:10.1f} {ner:21.2f}")
+
+
+if __name__ == "__main__":
+    main()
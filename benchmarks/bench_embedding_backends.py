@@ -0,0 +1,117 @@
+# Import time, latency and accuracy of the embedding backends
+#
+# Each EMBEDDING_BACKEND runs in a fresh interpreter. It reports the time to
+# import and build the embedding function, its first call, single-query
+# latency and batch throughput, and saves its embeddings of a fixed text set.
+# Those are compared with the sentence-transformers (torch) ones. The models
+# must be available locally: Chroma's ONNX download for "onnx", the
+# onnx_embedding.py export for "onnxruntime" / "onnxruntime-int8".
+#
+# Run: python benchmarks/bench_embedding_backends.py --threads 1 4
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+from telemetry import configure_logging
+
+BACKENDS = ["sentence-transformers", "onnx", "onnxruntime", "onnxruntime-int8"]
+QUERY = "What is the baggage allowance for Economy Class on Singapore Airlines?"
+CHUNK = ("Economy Class passengers may check in up to 30kg of baggage. Premium Economy passengers may "
+         "check in up to 35kg, and Business Class passengers up to 40kg. Excess baggage is charged per kg.")
+
+
+def child(backend, out_path, repeats):
+    start = time.perf_counter()
+    import numpy as np
+    import model_registry
+    import onnx_embedding
+    embed = model_registry.embedding_function(backend=backend)
+    import_s = time.perf_counter() - start
+
+    t = time.perf_counter()
+    embed([QUERY])
+    first_call_s = time.perf_counter() - t
+
+    single = []
+    for _ in range(repeats):
+        t = time.perf_counter()
+        embed([QUERY])
+        single.append(time.perf_counter() - t)
+    single.sort()
+
+    batch = [CHUNK] * 32
+    t = time.perf_counter()
+    for _ in range(max(1, repeats // 10)):
+        embed(batch)
+    batch_rate = len(batch) * max(1, repeats // 10) / (time.perf_counter() - t)
+
+    np.save(out_path, np.asarray(embed(onnx_embedding.SAMPLE_TEXTS), dtype=np.float32))
+    return {"import_s": import_s, "first_call_s": first_call_s, "p50_ms": statistics.median(single) * 1e3,
+            "p99_ms": single[int(0.99 * (len(single) - 1))] * 1e3, "batch_texts_per_s": batch_rate,
+            "torch_imported": "torch" in sys.modules, "chromadb_imported": "chromadb" in sys.modules}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Embedding backend import time, latency and accuracy")
+    parser.add_argument("--backends", nargs="+", default=BACKENDS, choices=BACKENDS)
+    parser.add_argument("--threads", type=int, nargs="+", default=[0],
+                        help="ONNX_INTRA_OP_THREADS values for the onnxruntime backends (0: all cores)")
+    parser.add_argument("--repeats", type=int, default=200)
+    parser.add_argument("--child", choices=BACKENDS, help=argparse.SUPPRESS)
+    parser.add_argument("--out", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    configure_logging()
+
+    if args.child:
+        print(json.dumps(child(args.child, args.out, args.repeats)))
+        return
+
+    import numpy as np
+
+    runs = []
+    for backend in args.backends:
+        threads = args.threads if backend.startswith("onnxruntime") else [None]
+        for n in threads:
+            runs.append((backend, n))
+
+    tmp_dir = tempfile.mkdtemp()
+    results = {}
+    print(f"{'backend':<22} {'import+build s':>15} {'first call s':>13} {'p50 ms':>8} {'p99 ms':>8} "
+          f"{'batch texts/s':>14} {'torch':>6} {'chroma':>7}")
+    for backend, n in runs:
+        label = backend if n is None else f"{backend} t={n}"
+        out_path = os.path.join(tmp_dir, f"{len(results)}.npy")
+        env = dict(os.environ)
+        if n is not None:
+            env["ONNX_INTRA_OP_THREADS"] = str(n)
+        out = subprocess.run([sys.executable, __file__, "--child", backend, "--out", out_path,
+                              "--repeats", str(args.repeats)],
+                             capture_output=True, text=True, cwd=ROOT, env=env)
+        if out.returncode != 0:
+            print(f"{label:<22} failed: {out.stderr.strip().splitlines()[-1]}")
+            continue
+        run = json.loads(out.stdout.strip().splitlines()[-1])
+        results[label] = np.load(out_path)
+        print(f"{label:<22} {run['import_s']:15.2f} {run['first_call_s']:13.3f} {run['p50_ms']:8.2f} "
+              f"{run['p99_ms']:8.2f} {run['batch_texts_per_s']:14.0f} {str(run['torch_imported']):>6} "
+              f"{str(run['chromadb_imported']):>7}")
+
+    reference = results.get("sentence-transformers")
+    if reference is None:
+        print("\nNo sentence-transformers run; accuracy not checked")
+        return
+    print(f"\n{'backend':<22} {'min cosine vs torch':>20} {'max abs diff':>13}")
+    for label, embeddings in results.items():
+        cosine = (reference * embeddings).sum(axis=1)
+        print(f"{label:<22} {cosine.min():20.5f} {np.abs(reference - embeddings).max():13.5f}")
+
+
+if __name__ == "__main__":
+    main()
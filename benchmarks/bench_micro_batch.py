@@ -0,0 +1,79 @@
+# Throughput and latency of concurrent model calls with and without micro-batching
+#
+# The default model is synthetic: each call costs a fixed overhead plus a
+# per-text cost and, like a forward pass that already uses every core, runs
+# one call at a time. --model embedding uses the shared embedding model
+# instead (it must already be cached locally).
+#
+# Run: python benchmarks/bench_micro_batch.py --concurrency 1 8 32
+import argparse
+import os
+import statistics
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from telemetry import configure_logging
+from micro_batch import MicroBatcher
+
+TEXT = "What is the baggage allowance for Economy Class on Singapore Airlines?"
+
+
+def synthetic_model(overhead_ms, per_item_ms):
+    busy = threading.Lock()
+
+    def run(texts):
+        with busy:
+            time.sleep((overhead_ms + per_item_ms * len(texts)) / 1000)
+        return [len(text) for text in texts]
+    return run
+
+
+def measure(call, requests, concurrency):
+    latencies = []
+
+    def one(_):
+        start = time.perf_counter()
+        call(TEXT)
+        latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(one, range(requests)))
+    elapsed = time.perf_counter() - start
+    latencies.sort()
+    return requests / elapsed, statistics.median(latencies), latencies[int(0.99 * (len(latencies) - 1))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Micro-batching throughput")
+    parser.add_argument("--model", choices=["synthetic", "embedding"], default="synthetic")
+    parser.add_argument("--overhead-ms", type=float, default=4.0, help="Synthetic per-call cost")
+    parser.add_argument("--per-item-ms", type=float, default=0.5, help="Synthetic per-text cost")
+    parser.add_argument("--requests", type=int, default=400)
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 8, 32])
+    parser.add_argument("--max-batch-size", type=int, default=32)
+    parser.add_argument("--max-wait-ms", type=float, default=5.0)
+    args = parser.parse_args()
+    configure_logging()
+
+    if args.model == "embedding":
+        import model_registry
+        model = model_registry.embedding_function()
+        model([TEXT])
+    else:
+        model = synthetic_model(args.overhead_ms, args.per_item_ms)
+    batcher = MicroBatcher(model, max_batch_size=args.max_batch_size, max_wait_ms=args.max_wait_ms)
+
+    print(f"{'concurrency':>11} {'mode':>8} {'req/s':>9} {'p50 ms':>8} {'p99 ms':>8}")
+    for concurrency in args.concurrency:
+        for mode, call in (("direct", lambda text: model([text])[0]), ("batched", batcher)):
+            rate, p50, p99 = measure(call, args.requests, concurrency)
+            print(f"{concurrency:11d} {mode:>8} {rate:9.0f} {p50 * 1e3:8.1f} {p99 * 1e3:8.1f}")
+    batcher.close()
+
+
+if __name__ == "__main__":
+    main()
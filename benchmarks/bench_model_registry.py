@@ -0,0 +1,101 @@
+# Cold start and resident memory with and without the shared model registry
+#
+# Each mode runs in a fresh interpreter that builds the same consumers the
+# client and guard server do (topic classifier, provenance filter, semantic
+# cache, retriever; optionally the Presidio analyzers of the PII guards).
+# "separate" gives every consumer its own model, as before the registry;
+# "shared" lets them share one. The models must already be cached locally.
+#
+# Run: python benchmarks/bench_model_registry.py --presidio 3
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+from telemetry import configure_logging
+
+TOPICS = ["baggage allowance", "check in", "refund", "ticket change", "krisflyer", "coding", "politics"]
+
+
+def _max_rss_mb():
+    # ru_maxrss is in KiB on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def child(mode, presidio):
+    start = time.perf_counter()
+    import model_registry
+    from provenance import LocalProvenanceFilter
+    from response_cache import SemanticCache
+    from retriever import Retriever
+    from topic_classifier import SemanticTopicClassifier
+    import_s = time.perf_counter() - start
+
+    def fresh():
+        # "separate": drop the registry so the next consumer loads its own copy
+        if mode == "separate":
+            model_registry.registry = model_registry.ModelRegistry()
+
+    consumers = []
+    fresh()
+    consumers.append(SemanticTopicClassifier(TOPICS))
+    fresh()
+    provenance = LocalProvenanceFilter()
+    provenance.split("Bags are 30kg.", ["Economy bags are 30kg."])
+    consumers.append(provenance)
+    fresh()
+    cache = SemanticCache()
+    cache.embed("warm up")
+    consumers.append(cache)
+    fresh()
+    retriever = Retriever()
+    retriever.embedding_function(["warm up"])
+    consumers.append(retriever)
+    for _ in range(presidio):
+        fresh()
+        consumers.append(model_registry.presidio_analyzer())
+
+    return {
+        "mode": mode,
+        "import_s": import_s,
+        "cold_start_s": time.perf_counter() - start,
+        "max_rss_mb": _max_rss_mb(),
+        "models_loaded": len(model_registry.registry.loaded()),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Cold start and RSS with and without the model registry")
+    parser.add_argument("--presidio", type=int, default=0,
+                        help="Presidio analyzers to build (one per DetectPII instance)")
+    parser.add_argument("--repeat", type=int, default=3, help="Fresh processes per mode")
+    parser.add_argument("--child", choices=["separate", "shared"], help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    configure_logging()
+
+    if args.child:
+        print(json.dumps(child(args.child, args.presidio)))
+        return
+
+    print(f"{'mode':>9} {'import s':>9} {'cold start s':>13} {'max RSS MB':>11} {'models':>7}")
+    for mode in ("separate", "shared"):
+        runs = []
+        for _ in range(args.repeat):
+            out = subprocess.run(
+                [sys.executable, __file__, "--child", mode, "--presidio", str(args.presidio)],
+                capture_output=True, text=True, cwd=ROOT)
+            if out.returncode != 0:
+                sys.exit(f"{mode} run failed:\n{out.stderr}")
+            runs.append(json.loads(out.stdout.strip().splitlines()[-1]))
+        best = min(runs, key=lambda r: r["cold_start_s"])
+        print(f"{mode:>9} {best['import_s']:9.2f} {best['cold_start_s']:13.2f} "
+              f"{max(r['max_rss_mb'] for r in runs):11.0f} {best['models_loaded']:7d}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+# Throughput of the PII check with and without the regex/word-list pre-screen
+#
+# "full" runs Presidio on every whole text, as DetectPII does; "prescreen" runs
+# it only on candidate sentences, as PrescreenedDetectPII does. Missed entities
+# are texts whose masked output differs from the full analyzer's. Presidio and
+# its spaCy model must be installed; --prescreen-only measures just the screen.
+#
+# Run: python benchmarks/bench_pii_prescreen.py --corpus answers.txt
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from telemetry import configure_logging
+from pii_prescreen import PIIPrescreen
+
+ENTITIES = ["PERSON", "PHONE_NUMBER"]
+
+DEFAULT_CORPUS = [
+    "Economy Class passengers may check in up to 30kg of baggage. Premium Economy passengers may check in up to 35kg.",
+    "Online check-in opens 48 hours before departure and closes 90 minutes before departure.",
+    "Refunds for unused tickets can be requested through Manage Booking. Processing takes 7 to 10 working days.",
+    "KrisFlyer members earn miles on every eligible flight. Miles are credited within 7 days of travel.",
+    "You may select your seat in advance when you book. Some seats carry a fee.",
+    "Hi, my name is John Tan and I lost my bag on SQ321.",
+    "Please call me back at +65 9123 4567 about my refund.",
+    "My colleague Priya Raj will travel with me. Can we sit together?",
+    "i am mary lee, booking ref ABC123, can i change my flight?",
+    "my name is rahul, i need a refund",
+    "Contact our service centre at 6223 8888 for assistance.",
+]
+
+
+def full_mask(analyzer, anonymizer, text):
+    results = analyzer.analyze(text=text, entities=ENTITIES, language="en")
+    return anonymizer.anonymize(text=text, analyzer_results=results).text
+
+
+def prescreen_mask(prescreen, analyzer, anonymizer, text):
+    pieces = []
+    last = 0
+    for start, end in prescreen.candidate_spans(text, ENTITIES):
+        pieces.append(text[last:start])
+        pieces.append(full_mask(analyzer, anonymizer, text[start:end]))
+        last = end
+    pieces.append(text[last:])
+    return "".join(pieces)
+
+
+def throughput(fn, texts):
+    start = time.perf_counter()
+    outputs = [fn(text) for text in texts]
+    return len(texts) / (time.perf_counter() - start), outputs
+
+
+def main():
+    parser = argparse.ArgumentParser(description="PII pre-screen throughput")
+    parser.add_argument("--corpus", help="File with one text per line (default: built-in samples)")
+    parser.add_argument("--repeat", type=int, default=20, help="Passes over the corpus")
+    parser.add_argument("--prescreen-only", action="store_true", help="Skip Presidio")
+    args = parser.parse_args()
+    configure_logging()
+
+    if args.corpus:
+        with open(args.corpus, encoding="utf-8") as f:
+            corpus = [line.strip() for line in f if line.strip()]
+    else:
+        corpus = DEFAULT_CORPUS
+    texts = corpus * args.repeat
+
+    screens = {"conservative": PIIPrescreen(conservative=True), "fast": PIIPrescreen(conservative=False)}
+    for name, prescreen in screens.items():
+        rate, spans = throughput(lambda t: prescreen.candidate_spans(t, ENTITIES), texts)
+        skipped = sum(1 for s in spans if not s) / len(spans)
+        analyzed = sum(e - s for text_spans in spans for s, e in text_spans) / sum(len(t) for t in texts)
+        print(f"screen {name:>12}: {rate:10.0f} texts/s, {skipped:6.1%} texts skipped, "
+              f"{analyzed:6.1%} of characters analyzed")
+    if args.prescreen_only:
+        return
+
+    import model_registry
+    analyzer = model_registry.presidio_analyzer()
+    anonymizer = model_registry.presidio_anonymizer()
+    full_mask(analyzer, anonymizer, "warm up")
+
+    full_rate, expected = throughput(lambda t: full_mask(analyzer, anonymizer, t), texts)
+    print(f"{'full':>19}: {full_rate:10.1f} texts/s")
+    for name, prescreen in screens.items():
+        rate, outputs = throughput(lambda t: prescreen_mask(prescreen, analyzer, anonymizer, t), texts)
+        missed = sum(1 for got, want in zip(outputs, expected) if got != want) // args.repeat
+        print(f"{'prescreen ' + name:>19}: {rate:10.1f} texts/s ({rate / full_rate:.1f}x), "
+              f"{missed} of {len(corpus)} texts masked differently from full")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,293 @@
+# End-to-end latency benchmark of pipeline.aguarded_answer, fully offline
+#
+# Guards are served by a local stub server and the LLM by FakeOpenAI, both with
+# injected latency; retrieval uses the real Chroma store under vectorstore/
+# (its embedding model must already be cached locally) or, with
+# --retrieval fake, canned chunks and a hash-based stand-in for the embedding
+# model. Requests go through the same code as production: context packing,
+# the local provenance filter in front of the hallucination guard, and
+# optionally the response cache (--cache) and the cross-encoder reranker
+# (--rerank). --speculative starts retrieval alongside the topic check;
+# --off-topic-rate makes that share of queries fail the topic check. Stage
+# timings come from the pipeline's own spans (see telemetry.span).
+#
+# Run: python benchmarks/bench_pipeline.py --requests 200 --concurrency 16
+import argparse
+import asyncio
+import json
+import os
+import sys
+import tempfile
+import time
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+# rag.py reads the key at import time; nothing is sent to OpenAI
+os.environ.setdefault("OPENAI_API_KEY", "sk-offline-benchmark")
+# Read back after the run for the per-stage timings
+SPANS_PATH = os.path.join(tempfile.mkdtemp(), "spans.jsonl")
+os.environ["TRACE_SPANS_PATH"] = SPANS_PATH
+
+import pipeline
+import rag
+from client_utils import GuardrailsClient
+from context_packing import DEFAULT_TOKEN_BUDGET
+from fake_openai import FakeOpenAI
+from provenance import LocalProvenanceFilter
+from reranker import CrossEncoderReranker
+from response_cache import SemanticCache
+from telemetry import configure_logging, metrics
+from stub_server import StubGuardrailsServer
+
+# Span names; "request" is reported as the total
+STAGES = ["topic", "cache_lookup", "retrieval", "rerank", "generation", "output_guards", "request"]
+
+OFF_TOPIC_MARKER = "[off-topic]"
+
+DEFAULT_QUERIES = [
+    "What is the baggage allowance for Singapore Airlines?",
+    "i need my money back, i wanna refund!",
+    "I need to check in for my flight",
+    "How many KrisFlyer miles do I earn on economy?",
+    "Can I change my ticket date?",
+    "What meals are served on board?",
+    "How do I report lost baggage?",
+    "Can I select my seat in advance?",
+]
+
+FAKE_CHUNKS = [
+    ("Economy Class passengers may check in up to 30kg of baggage. "
+     "Premium Economy passengers may check in up to 35kg.", {"source": "docs/sq_faq.pdf", "chunk_index": 0}),
+    ("Online check-in opens 48 hours before departure and closes 90 minutes before departure.",
+     {"source": "docs/sq_faq.pdf", "chunk_index": 1}),
+    ("Refunds for unused tickets can be requested through Manage Booking.",
+     {"source": "docs/sq_faq.pdf", "chunk_index": 2}),
+]
+
+
+def fake_embedding(texts):
+    # Same vector for the same text, so repeated queries hit the response cache
+    return [np.random.default_rng(zlib.crc32(text.lower().encode("utf-8"))).normal(size=384).astype(np.float32)
+            for text in texts]
+
+
+class FakeCrossEncoder:
+    """
+    Stand-in for the cross-encoder: word overlap scores after a fixed latency per pair
+    """
+
+    def __init__(self, latency_per_pair=0.002):
+        self.latency_per_pair = latency_per_pair
+
+    def predict(self, pairs, batch_size=32):
+        time.sleep(self.latency_per_pair * len(pairs))
+        return [float(len(set(query.lower().split()) & set(doc.lower().split()))) for query, doc in pairs]
+
+
+def percentile(values, pct):
+    # Nearest-rank percentile
+    ordered = sorted(values)
+    rank = max(1, int(round(pct / 100 * len(ordered) + 0.5)))
+    return ordered[min(rank, len(ordered)) - 1]
+
+
+def parse_latencies(spec):
+    # "topic_guard=0.05,hallucination_guard=0.5"
+    latencies = {}
+    for item in filter(None, (spec or "").split(",")):
+        name, value = item.split("=")
+        latencies[name.strip()] = float(value)
+    return latencies
+
+
+def fake_retrieve(query, k=5):
+    time.sleep(0.005)
+    return FAKE_CHUNKS[:k]
+
+
+async def load(queries, n_requests, concurrency, client, cache=None, reranker=None, speculative=False,
+               token_budget=DEFAULT_TOKEN_BUDGET):
+    semaphore = asyncio.Semaphore(concurrency)
+    errors = []
+    blocked = []
+    # Enough threads for retrieval and generation of every concurrent request
+    executor = ThreadPoolExecutor(max_workers=concurrency * 2)
+
+    async def worker(i):
+        async with semaphore:
+            query = queries[i % len(queries)]
+            try:
+                await pipeline.aguarded_answer(query, client, cache=cache, token_budget=token_budget,
+                                               reranker=reranker, speculative=speculative)
+            except ValueError:
+                # A guard rejected the query or the answer
+                blocked.append(query)
+            except Exception as e:
+                errors.append(repr(e))
+
+    asyncio.get_running_loop().set_default_executor(executor)
+    start = time.perf_counter()
+    await asyncio.gather(*(worker(i) for i in range(n_requests)))
+    elapsed = time.perf_counter() - start
+    await client.aclose()
+    return elapsed, errors, len(blocked)
+
+
+def read_timings(path=SPANS_PATH):
+    # Durations of the spans of requests that went through, by stage
+    timings = {stage: [] for stage in STAGES}
+    if not os.path.exists(path):
+        return timings
+    with open(path) as f:
+        for line in f:
+            record = json.loads(line)
+            if record["span"] in timings and record["status"] == "ok":
+                timings[record["span"]].append(record["duration_s"])
+    return timings
+
+
+def _counter(name, label):
+    counts = {}
+    for key, value in metrics.snapshot()[0].get(name, {}).items():
+        result = dict(key).get(label)
+        counts[result] = counts.get(result, 0) + value
+    return counts
+
+
+def report_speculation():
+    # Wasted retrievals are counted when their thread finishes, after the request returned
+    counters = metrics.snapshot()[0]
+    outcomes = {}
+    for key, value in counters.get("speculative_retrieval_total", {}).items():
+        result = dict(key)["result"]
+        outcomes[result] = outcomes.get(result, 0) + value
+    wasted_seconds = sum(counters.get("speculative_retrieval_wasted_seconds_total", {}).values())
+    print(f"speculative retrievals: {outcomes.get('used', 0)} used, {outcomes.get('cancelled', 0)} cancelled, "
+          f"{outcomes.get('wasted', 0)} wasted ({wasted_seconds * 1e3:.0f} ms of retrieval thrown away)")
+    return {"speculation": dict(outcomes, wasted_seconds=wasted_seconds)}
+
+
+def report_components(client, cache, reranker):
+    summary = {}
+    if client.provenance_filter is not None:
+        sentences = _counter("provenance_sentences_total", "resolved")
+        print(f"provenance filter: {sentences.get('local', 0)} sentence(s) resolved locally, "
+              f"{sentences.get('llm', 0)} sent to the hallucination guard")
+        summary["provenance"] = sentences
+    if cache is not None:
+        summary["cache"] = cache.stats()
+        print(f"response cache: {summary['cache']['hits']} hits, {summary['cache']['misses']} misses")
+    if reranker is not None:
+        summary["rerank"] = reranker.stats()
+        print(f"reranker: {summary['rerank']['fallbacks']} fallback(s) to fused order, "
+              f"{summary['rerank']['hits']} cached / {summary['rerank']['misses']} scored pairs")
+    return summary
+
+
+def report(timings, elapsed, errors, n_requests, blocked=0):
+    done = len(timings["request"])
+    print(f"\n{'stage':<15} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'mean ms':>9}")
+    summary = {}
+    for stage in STAGES:
+        values = timings[stage]
+        if not values:
+            continue
+        row = {
+            "p50": percentile(values, 50) * 1e3,
+            "p95": percentile(values, 95) * 1e3,
+            "p99": percentile(values, 99) * 1e3,
+            "mean": sum(values) / len(values) * 1e3,
+        }
+        label = "total" if stage == "request" else stage
+        summary[label] = row
+        print(f"{label:<15} {row['p50']:>9.1f} {row['p95']:>9.1f} {row['p99']:>9.1f} {row['mean']:>9.1f}")
+    throughput = done / elapsed if elapsed else 0.0
+    print(f"\n{done}/{n_requests} requests in {elapsed:.2f}s -> {throughput:.1f} req/s, "
+          f"{blocked} blocked by a guard, {len(errors)} errors")
+    for error in errors[:5]:
+        print(f"  {error}")
+    summary["throughput_rps"] = throughput
+    summary["errors"] = len(errors)
+    summary["blocked"] = blocked
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline end-to-end pipeline latency benchmark")
+    parser.add_argument("--requests", type=int, default=100)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--queries", help="File with one query per line")
+    parser.add_argument("--retrieval", choices=["chroma", "fake"], default="chroma")
+    parser.add_argument("--guard-latency", default="topic_guard=0.05,hallucination_guard=0.4,"
+                                                    "pii_guard=0.03,competitor_guard=0.03",
+                        help="Per-guard injected latency in seconds, name=seconds,...")
+    parser.add_argument("--llm-latency", type=float, default=0.8)
+    parser.add_argument("--pool-size", type=int, default=32)
+    parser.add_argument("--token-budget", type=int, default=DEFAULT_TOKEN_BUDGET)
+    parser.add_argument("--cache", action="store_true", help="Answer repeated queries from the response cache")
+    parser.add_argument("--rerank", action="store_true", help="Rerank candidates with the cross-encoder")
+    parser.add_argument("--rerank-latency", type=float, default=0.002,
+                        help="Seconds per pair of the fake cross-encoder (--retrieval fake)")
+    parser.add_argument("--no-provenance-filter", action="store_true",
+                        help="Send every answer sentence to the hallucination guard")
+    parser.add_argument("--speculative", action="store_true", help="Retrieve while the topic check runs")
+    parser.add_argument("--off-topic-rate", type=float, default=0.0,
+                        help="Share of queries the topic guard rejects")
+    parser.add_argument("--json", help="Write the summary to this file")
+    args = parser.parse_args()
+    configure_logging()
+
+    queries = DEFAULT_QUERIES
+    if args.queries:
+        with open(args.queries) as f:
+            queries = [line.strip() for line in f if line.strip()]
+    if args.off_topic_rate > 0:
+        # Mark every n-th query so the stub topic guard rejects it
+        every = max(1, round(1 / args.off_topic_rate))
+        queries = [f"{OFF_TOPIC_MARKER} {q}" if i % every == 0 else q
+                   for i, q in enumerate(queries * every)]
+
+    # The pipeline calls rag() and retrieve() itself; point them at the offline stand-ins
+    rag.openai_client = FakeOpenAI(latency=args.llm_latency)
+    embedding_function = None
+    if args.retrieval == "fake":
+        pipeline.retrieve = fake_retrieve
+        embedding_function = fake_embedding
+
+    cache = None
+    if args.cache:
+        cache = SemanticCache(embedding_function=embedding_function,
+                              db_path="vectorstore" if args.retrieval == "chroma" else None)
+    reranker = None
+    if args.rerank:
+        model = FakeCrossEncoder(args.rerank_latency) if args.retrieval == "fake" else None
+        reranker = CrossEncoderReranker(model=model)
+    provenance_filter = None
+    if not args.no_provenance_filter:
+        # As in client_utils.default_client
+        provenance_filter = LocalProvenanceFilter(embedding_function=embedding_function)
+
+    with StubGuardrailsServer(latency=parse_latencies(args.guard_latency),
+                              off_topic_marker=OFF_TOPIC_MARKER) as server:
+        client = GuardrailsClient(base_url=server.base_url, pool_size=args.pool_size,
+                                  provenance_filter=provenance_filter)
+        elapsed, errors, blocked = asyncio.run(
+            load(queries, args.requests, args.concurrency, client, cache, reranker, args.speculative,
+                 args.token_budget))
+        client.close()
+
+    summary = report(read_timings(), elapsed, errors, args.requests, blocked)
+    summary.update(report_components(client, cache, reranker))
+    if args.speculative:
+        summary.update(report_speculation())
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(summary, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
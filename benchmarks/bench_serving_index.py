@@ -0,0 +1,166 @@
+# Serving index vs. Chroma: recall@k, query latency, cold start and memory per worker
+#
+# Builds a temporary Chroma collection of clustered synthetic embeddings (or
+# uses an existing store with --db-path), exports it with
+# serving_index.export_serving_index and queries both with perturbed copies of
+# stored vectors, so no embedding model is needed. Cold start and resident
+# memory (private vs. file-backed, i.e. shareable page cache) are measured in a
+# fresh interpreter per backend.
+#
+# Run: python benchmarks/bench_serving_index.py --chunks 20000 --nprobe 4 16 64
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+from telemetry import configure_logging
+
+
+def _rss_mb():
+    # Private (anonymous) and file-backed resident memory; ru_maxrss would
+    # include the parent's peak, which survives fork and exec
+    rss = {}
+    with open("/proc/self/status") as f:
+        for line in f:
+            if line.startswith(("RssAnon:", "RssFile:")):
+                name, kib = line.split()[:2]
+                rss[name.rstrip(":")] = int(kib) / 1024
+    return rss
+
+
+def _dir_mb(path):
+    return sum(os.path.getsize(os.path.join(root, name))
+               for root, _, files in os.walk(path) for name in files) / 2 ** 20
+
+
+def make_store(db_path, collection_name, chunks, dim, seed=0):
+    import chromadb
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(max(1, chunks // 100), dim))
+    vectors = centers[rng.integers(0, len(centers), chunks)] + 0.7 * rng.normal(size=(chunks, dim))
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    collection = chromadb.PersistentClient(path=db_path).get_or_create_collection(collection_name)
+    for start in range(0, chunks, 2000):
+        stop = min(start + 2000, chunks)
+        collection.add(ids=[f"chunk-{i}" for i in range(start, stop)], embeddings=vectors[start:stop],
+                       documents=[f"Synthetic chunk {i} about baggage, refunds and check-in." for i in
+                                  range(start, stop)],
+                       metadatas=[{"source": "synthetic.pdf", "chunk_index": i} for i in range(start, stop)])
+    return collection
+
+
+def child(backend, db_path, collection_name, queries_path):
+    start = time.perf_counter()
+    queries = np.load(queries_path)
+    if backend == "chroma":
+        import chromadb
+        collection = chromadb.PersistentClient(path=db_path).get_collection(collection_name)
+    else:
+        from serving_index import ServingIndex, serving_path
+        collection = ServingIndex.load(serving_path(db_path, collection_name))
+    collection.query(query_embeddings=queries[:1], n_results=5, include=["documents", "metadatas"])
+    cold_start = time.perf_counter() - start
+    for query in queries:
+        collection.query(query_embeddings=[query], n_results=5, include=["documents", "metadatas"])
+    rss = _rss_mb()
+    return {"backend": backend, "cold_start_s": cold_start, "private_mb": rss["RssAnon"],
+            "shared_file_mb": rss["RssFile"]}
+
+
+def timed_query(collection, queries, k, **kwargs):
+    ids, seconds = [], []
+    for query in queries:
+        start = time.perf_counter()
+        ids.append(collection.query(query_embeddings=[query], n_results=k,
+                                    include=["documents", "metadatas"], **kwargs)["ids"][0])
+        seconds.append(time.perf_counter() - start)
+    return ids, float(np.median(seconds))
+
+
+def recall(found, truth):
+    return float(np.mean([len(set(f) & set(t)) / max(1, len(t)) for f, t in zip(found, truth)]))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serving index vs. Chroma")
+    parser.add_argument("--db-path", help="Existing Chroma store (default: a temporary synthetic one)")
+    parser.add_argument("--collection", default="faq")
+    parser.add_argument("--chunks", type=int, default=20000)
+    parser.add_argument("--dim", type=int, default=384)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--nprobe", type=int, nargs="+", default=[4, 16, 64])
+    parser.add_argument("--child", choices=["chroma", "serving"], help=argparse.SUPPRESS)
+    parser.add_argument("--queries-path", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    configure_logging()
+
+    if args.child:
+        print(json.dumps(child(args.child, args.db_path, args.collection, args.queries_path)))
+        return
+
+    import chromadb
+    from serving_index import ServingIndex, export_serving_index, serving_path
+
+    tmp_dir = tempfile.mkdtemp()
+    try:
+        db_path = args.db_path or os.path.join(tmp_dir, "vectorstore")
+        if args.db_path:
+            collection = chromadb.PersistentClient(path=db_path).get_collection(args.collection)
+        else:
+            collection = make_store(db_path, args.collection, args.chunks, args.dim)
+        stored = np.asarray(collection.get(include=["embeddings"])["embeddings"], dtype=np.float32)
+        rng = np.random.default_rng(1)
+        queries = stored[rng.integers(0, len(stored), args.queries)]
+        queries = queries + 0.3 * rng.normal(size=queries.shape).astype(np.float32) / np.sqrt(queries.shape[1])
+        queries_path = os.path.join(tmp_dir, "queries.npy")
+        np.save(queries_path, queries)
+
+        # Exact neighbours, for the recall of Chroma's own HNSW search
+        exact = [list(np.argsort(((stored - q) ** 2).sum(axis=1))[:args.k]) for q in queries]
+        stored_ids = collection.get(include=[])["ids"]
+        exact = [[stored_ids[i] for i in row] for row in exact]
+
+        chroma_ids, chroma_s = timed_query(collection, queries, args.k)
+        print(f"{len(stored)} chunks, {stored.shape[1]} dims, {args.queries} queries, k={args.k}\n")
+        print(f"{'backend':<22} {'recall@k vs chroma':>18} {'vs exact':>9} {'p50 ms':>8} {'disk MB':>8}")
+        print(f"{'chroma (hnsw)':<22} {1.0:18.3f} {recall(chroma_ids, exact):9.3f} {chroma_s * 1e3:8.2f} "
+              f"{_dir_mb(db_path):8.1f}")
+
+        for dtype in ("float16", "int8"):
+            export_serving_index(collection, db_path=db_path, collection_name=args.collection, dtype=dtype)
+            path = serving_path(db_path, args.collection)
+            index = ServingIndex.load(path)
+            lists = len(index.list_offsets) - 1
+            for nprobe in sorted({min(n, lists) for n in args.nprobe}):
+                ids, seconds = timed_query(index, queries, args.k, nprobe=nprobe)
+                label = f"serving {dtype} {nprobe}/{lists}"
+                print(f"{label:<22} {recall(ids, chroma_ids):18.3f} {recall(ids, exact):9.3f} "
+                      f"{seconds * 1e3:8.2f} {_dir_mb(path):8.1f}")
+
+        # Cold start and memory of one worker (the int8 export is on disk now)
+        print(f"\n{'backend':<9} {'cold start s':>13} {'private MB':>11} {'file-backed MB':>15}")
+        for backend in ("chroma", "serving"):
+            out = subprocess.run(
+                [sys.executable, __file__, "--child", backend, "--db-path", db_path,
+                 "--collection", args.collection, "--queries-path", queries_path],
+                capture_output=True, text=True, cwd=ROOT)
+            if out.returncode != 0:
+                sys.exit(f"{backend} run failed:\n{out.stderr}")
+            run = json.loads(out.stdout.strip().splitlines()[-1])
+            print(f"{backend:<9} {run['cold_start_s']:13.2f} {run['private_mb']:11.0f} "
+                  f"{run['shared_file_mb']:15.0f}")
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+# Micro-benchmark: compiled TopicMatcher vs. the per-topic re.search loop
+# Run: python benchmarks/bench_topic_matcher.py
+import os
+import random
+import re
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from topic_matcher import TopicMatcher
+
+QUERIES = [
+    "i need my money back, i wanna refund!",
+    "help me with the coding homework?",
+    "What is the baggage allowance for Singapore Airlines?",
+    "can i carry wine bottles on SQ flights?",
+    "How much luggage can I take on a transit flight to Tokyo?",
+]
+
+
+def loop_match(text, valid_topics, invalid_topics):
+    # The original CustomTopicGuard.keyword_match
+    text_lower = text.lower()
+    for topic in invalid_topics:
+        if re.search(r'\b' + re.escape(topic) + r'\b', text_lower):
+            return topic
+    for topic in valid_topics:
+        if re.search(r'\b' + re.escape(topic) + r'\b', text_lower):
+            return topic
+    return None
+
+
+def make_topics(n, rng):
+    words = ["baggage", "refund", "flight", "seat", "meal", "lounge", "upgrade",
+             "transit", "visa", "fare", "cabin", "ticket", "booking", "miles"]
+    topics = set()
+    while len(topics) < n:
+        topics.add(f"{rng.choice(words)} {rng.choice(words)}{rng.randint(0, n)}")
+    topics = sorted(topics)
+    split = max(1, n // 3)
+    valid = topics[split:] + ["refund", "luggage", "baggage allowance", "transit"]
+    invalid = topics[:split] + ["coding", "politics"]
+    return valid, invalid
+
+
+def main(sizes=(30, 1_000, 10_000), number=200):
+    rng = random.Random(0)
+    print(f"{'topics':>8} {'loop us/query':>15} {'matcher us/query':>18} {'build ms':>10} {'speedup':>9}")
+    for n in sizes:
+        valid, invalid = make_topics(n, rng)
+        valid_lower = [t.lower() for t in valid]
+        invalid_lower = [t.lower() for t in invalid]
+
+        build_s = timeit.timeit(lambda: TopicMatcher(valid, invalid), number=1)
+        matcher = TopicMatcher(valid, invalid)
+
+        for q in QUERIES:
+            expected = loop_match(q, valid_lower, invalid_lower)
+            got = matcher.match(q)
+            # Same decision as the loop; the topic itself may differ when several match
+            assert (got is None) == (expected is None), (q, expected, got)
+            assert got is None or got.invalid == (expected in invalid_lower), (q, expected, got)
+
+        # The loop relies on re's internal pattern cache, which holds 512 entries
+        loop_n = max(1, number // max(1, n // 100))
+        loop_s = timeit.timeit(
+            lambda: [loop_match(q, valid_lower, invalid_lower) for q in QUERIES], number=loop_n)
+        matcher_s = timeit.timeit(lambda: [matcher.match(q) for q in QUERIES], number=number)
+
+        loop_us = loop_s / (loop_n * len(QUERIES)) * 1e6
+        matcher_us = matcher_s / (number * len(QUERIES)) * 1e6
+        print(f"{n:>8} {loop_us:>15.1f} {matcher_us:>18.1f} {build_s * 1e3:>10.1f} {loop_us / matcher_us:>8.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,54 @@
+# Offline stand-in for the OpenAI client used by rag.rag / rag.rag_stream
+import time
+from types import SimpleNamespace
+
+
+class _Completions:
+    def __init__(self, owner):
+        self._owner = owner
+
+    def create(self, model=None, messages=None, stream=False, **kwargs):
+        owner = self._owner
+        # Answer with the first sentences of the supplied information, like the verbatim prompt asks
+        user = next((m["content"] for m in reversed(messages or []) if m["role"] == "user"), "")
+        information = user.split("Information:", 1)[-1]
+        words = information.split()[:owner.answer_words] or ["No", "information."]
+        answer = " ".join(words)
+        owner.calls += 1
+
+        if not stream:
+            time.sleep(owner.latency)
+            return SimpleNamespace(
+                choices=[SimpleNamespace(message=SimpleNamespace(role="assistant", content=answer))],
+                usage=SimpleNamespace(prompt_tokens=len(user.split()), completion_tokens=len(words)),
+            )
+        return self._stream(words)
+
+    def _stream(self, words):
+        owner = self._owner
+        time.sleep(owner.first_token_latency)
+        per_word = max(owner.latency - owner.first_token_latency, 0.0) / len(words)
+        for i, word in enumerate(words):
+            if i:
+                time.sleep(per_word)
+            yield SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=word + " "))])
+
+
+class FakeOpenAI:
+    """
+    Duck-typed OpenAI() exposing chat.completions.create with fixed latency.
+    Pass it as rag(..., client=FakeOpenAI()).
+    """
+
+    def __init__(self, latency=0.8, first_token_latency=0.2, answer_words=40):
+        """
+        Args:
+            latency: Seconds for a full (non-streamed) completion
+            first_token_latency: Seconds before the first streamed token
+            answer_words: Length of the generated answer in words
+        """
+        self.latency = latency
+        self.first_token_latency = first_token_latency
+        self.answer_words = answer_words
+        self.calls = 0
+        self.chat = SimpleNamespace(completions=_Completions(self))
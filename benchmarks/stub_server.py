@@ -0,0 +1,129 @@
+# Local stand-in for the guardrails server, for offline benchmarks
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive, like the real server
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+        # /guards/<name>/validate or /guards/<name>/openai/v1/chat/completions
+        parts = self.path.strip("/").split("/")
+        if len(parts) < 3 or parts[0] != "guards":
+            return self._send(404, {"detail": f"Unknown path {self.path}"})
+        guard = parts[1]
+
+        time.sleep(self.server.latency.get(guard, self.server.default_latency))
+        self.server.count(guard)
+
+        if parts[2:] == ["validate"] and guard == "answer_guard":
+            # Every answer passes every check unchanged
+            reports = [{"passed": True, "output": item["text"],
+                        "validators": {"competitor": {"outcome": "pass"}, "pii": {"outcome": "pass"},
+                                       "provenance": {"outcome": "pass" if item.get("provenance_text")
+                                                      else "skipped"}}}
+                       for item in json.loads(body.get("llmOutput") or "[]")]
+            output = json.dumps(reports)
+            return self._send(200, {
+                "callId": "stub",
+                "rawLlmOutput": output,
+                "validatedOutput": output,
+                "validationPassed": True,
+            })
+        if parts[2:] == ["validate"]:
+            text = body.get("llmOutput")
+            if text is None:
+                text = " ".join(m.get("content", "") for m in body.get("messages", []))
+            return self._send(200, {
+                "callId": "stub",
+                "rawLlmOutput": text,
+                "validatedOutput": text,
+                "validationPassed": True,
+            })
+        if parts[2:] == ["openai", "v1", "chat", "completions"]:
+            text = " ".join(m.get("content", "") for m in body.get("messages", []))
+            marker = self.server.off_topic_marker
+            passed = not (guard == "topic_guard" and marker and marker in text)
+            return self._send(200, {
+                "id": "stub",
+                "object": "chat.completion",
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": text},
+                             "finish_reason": "stop"}],
+                "guardrails": {"validation_passed": passed},
+                "validation_passed": passed,
+            })
+        return self._send(404, {"detail": f"Unknown path {self.path}"})
+
+    def _send(self, status, payload):
+        data = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class StubGuardrailsServer(ThreadingHTTPServer):
+    """
+    Mimics the guard endpoints of `guardrails start`: every guard passes and
+    echoes its input after an injected latency, except that the topic guard
+    rejects queries containing off_topic_marker.
+
+    Usage:
+        with StubGuardrailsServer(latency={"hallucination_guard": 0.5}) as server:
+            client = GuardrailsClient(base_url=server.base_url)
+    """
+    daemon_threads = True
+    # The default backlog of 5 drops connects under load and adds 1s SYN retries
+    request_queue_size = 256
+
+    def __init__(self, host="127.0.0.1", port=0, latency=None, default_latency=0.0, off_topic_marker=None):
+        """
+        Args:
+            latency: Seconds to sleep per guard name before answering
+            default_latency: Seconds to sleep for guards not listed in latency
+            off_topic_marker: Substring that makes the topic guard reject a query
+        """
+        super().__init__((host, port), _Handler)
+        self.latency = dict(latency or {})
+        self.default_latency = default_latency
+        self.off_topic_marker = off_topic_marker
+        self.requests = {}
+        self._count_lock = threading.Lock()
+        self._thread = None
+
+    @property
+    def base_url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}/guards"
+
+    def count(self, guard):
+        with self._count_lock:
+            self.requests[guard] = self.requests.get(guard, 0) + 1
+
+    def start(self):
+        self._thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+if __name__ == "__main__":
+    server = StubGuardrailsServer(port=8000)
+    print(f"Stub guardrails server on {server.base_url}")
+    server.serve_forever()
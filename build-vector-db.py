@@ -1,31 +1,52 @@
 # Refer from https://learn.deeplearning.ai/courses/advanced-retrieval-for-ai/lesson/ukzj4/overview-of-embeddings-based-retrieval
+import hashlib
 import os
+from concurrent.futures import ProcessPoolExecutor
 from pypdf import PdfReader
 from langchain.text_splitter import RecursiveCharacterTextSplitter, SentenceTransformersTokenTextSplitter
 import chromadb
-from chromadb.utils.embedding_functions import SentenceTransformerEmbeddingFunction
 from dotenv import load_dotenv
 from helper_utils import word_wrap
+from model_registry import embedding_function as shared_embedding_function
+from lexical_index import build_lexical_index
+from serving_index import export_serving_index
+from telemetry import configure_logging
 load_dotenv()
 
+PAGES_PER_TASK = 16
 
-def ingest_pdf(pdf_path, db_path="vectorstore", collection_name="faq"):
-    # 1. Document Loading
-    # reader = PdfReader("microsoft_annual_report_2022.pdf")
-    reader = PdfReader(pdf_path)
-    # pdf_texts = [p.extract_text().strip() for p in reader.pages]
-    # pdf_texts = [text for text in pdf_texts if text]
 
-    pdf_texts = []
-    page_numbers = []
-    for i, page in enumerate(reader.pages):
-        text = page.extract_text()
+def _extract_page_range(pdf_path, start, stop):
+    # Runs in a worker process; returns (page_number, text) for non-empty pages
+    reader = PdfReader(pdf_path)
+    pages = []
+    for i in range(start, stop):
+        text = reader.pages[i].extract_text()
         if text and text.strip():
-            pdf_texts.append(text.strip())
-            page_numbers.append(i + 1)  # store actual page number
-
-    print(word_wrap(pdf_texts[0]))
-
+            pages.append((i + 1, text.strip()))  # store actual page number
+    return pages
+
+
+def extract_pdfs(pdf_paths, max_workers=None):
+    """
+    Extract the text of every page of every PDF in a process pool.
+    Returns {pdf_path: [page_text, ...]} with empty pages dropped.
+    """
+    tasks = []
+    for pdf_path in pdf_paths:
+        n_pages = len(PdfReader(pdf_path).pages)
+        for start in range(0, n_pages, PAGES_PER_TASK):
+            tasks.append((pdf_path, start, min(start + PAGES_PER_TASK, n_pages)))
+
+    texts = {pdf_path: [] for pdf_path in pdf_paths}
+    with ProcessPoolExecutor(max_workers=max_workers) as pool:
+        futures = [pool.submit(_extract_page_range, *task) for task in tasks]
+        for (pdf_path, _, _), future in zip(tasks, futures):
+            texts[pdf_path] += [text for _, text in future.result()]
+    return texts
+
+
+def chunk_texts(pdf_texts):
     # 2. Splitting and chunking
     character_splitter = RecursiveCharacterTextSplitter(
         separators=["\n\n", "\n", ". ", " ", ""],
@@ -39,38 +60,128 @@ def ingest_pdf(pdf_path, db_path="vectorstore", collection_name="faq"):
     token_split_texts = []
     for text in character_split_texts:
         token_split_texts += token_splitter.split_text(text)
-
-    print(word_wrap(token_split_texts[0]))
-    print(f"\nTotal chunks: {len(token_split_texts)}")
+    return token_split_texts
+
+
+def chunk_id(source, text, occurrence=0):
+    """
+    Content-hash ID: stays the same as long as the chunk text does, so re-ingesting
+    an unchanged document touches nothing. occurrence separates repeated chunks.
+    """
+    return hashlib.sha256(f"{source}\0{occurrence}\0{text}".encode("utf-8")).hexdigest()[:32]
+
+
+def _document_chunks(source, chunks):
+    ids, metadatas = [], []
+    seen = {}
+    for i, text in enumerate(chunks):
+        occurrence = seen.get(text, 0)
+        seen[text] = occurrence + 1
+        ids.append(chunk_id(source, text, occurrence))
+        # Metadata: attach filename + chunk index
+        metadatas.append({"source": source, "chunk_index": i})
+    return ids, metadatas
+
+
+def ingest_pdfs(pdf_paths, db_path="vectorstore", collection_name="faq", batch_size=64,
+                prune=False, max_workers=None, serving_dtype="int8"):
+    """
+    Incrementally sync PDFs into the Chroma collection.
+
+    New chunks are embedded in batches of batch_size and upserted; chunks already
+    stored under the same content hash are skipped (only a shifted chunk_index is
+    updated). Stale chunks of the given PDFs are deleted, and with prune=True so
+    is every chunk whose source is not among pdf_paths. The BM25 index under
+    <db_path>/bm25/ and the serving index under <db_path>/serving/ (quantized to
+    serving_dtype) are then rebuilt from the whole collection.
+    """
+    # 1. Document Loading
+    texts = extract_pdfs(pdf_paths, max_workers=max_workers)
 
     #3. Vector Database
-    embedding_function = SentenceTransformerEmbeddingFunction()
-    print(embedding_function([token_split_texts[0]]))
-
+    embedding_function = shared_embedding_function()
     chroma_client = chromadb.PersistentClient(path=db_path)
-    chroma_collection = chroma_client.create_collection(collection_name,
-                                                        embedding_function=embedding_function)
-
-    ids = [str(i) for i in range(len(token_split_texts))]
-
-    # Metadata: attach filename + chunk index
-    metadatas = [
-        {
-            "source":pdf_path,
-            "chunk_index": i,
-        }
-        for i in range(len(token_split_texts))
+    # Chunks are embedded below, so the collection is not tied to one EMBEDDING_BACKEND
+    chroma_collection = chroma_client.get_or_create_collection(collection_name)
+
+    existing = chroma_collection.get(include=["metadatas"])
+    existing_meta = dict(zip(existing["ids"], existing["metadatas"]))
+
+    new_ids, new_docs, new_metas = [], [], []
+    moved_ids, moved_metas = [], []
+    keep_ids = set()
+    for pdf_path in pdf_paths:
+        if not texts[pdf_path]:
+            print(f"No text extracted from {pdf_path}")
+            continue
+        chunks = chunk_texts(texts[pdf_path])
+        ids, metadatas = _document_chunks(pdf_path, chunks)
+        keep_ids.update(ids)
+        for id_, doc, meta in zip(ids, chunks, metadatas):
+            if id_ not in existing_meta:
+                new_ids.append(id_)
+                new_docs.append(doc)
+                new_metas.append(meta)
+            elif existing_meta[id_] != meta:
+                moved_ids.append(id_)
+                moved_metas.append(meta)
+
+    sources = set(pdf_paths)
+    stale_ids = [
+        id_ for id_, meta in existing_meta.items()
+        if id_ not in keep_ids and (prune or (meta or {}).get("source") in sources)
     ]
-    chroma_collection.add(ids=ids, documents=token_split_texts, metadatas=metadatas)
-    chroma_collection.count()
-    print(chroma_collection.count())
 
+    if stale_ids:
+        chroma_collection.delete(ids=stale_ids)
+    if moved_ids:
+        chroma_collection.update(ids=moved_ids, metadatas=moved_metas)
+    for start in range(0, len(new_ids), batch_size):
+        batch = slice(start, start + batch_size)
+        embeddings = embedding_function(new_docs[batch])
+        chroma_collection.upsert(ids=new_ids[batch], embeddings=embeddings,
+                                 documents=new_docs[batch], metadatas=new_metas[batch])
+
+    if new_docs:
+        print(word_wrap(new_docs[0]))
+    print(f"Added {len(new_ids)}, re-indexed {len(moved_ids)}, deleted {len(stale_ids)}, "
+          f"unchanged {len(keep_ids) - len(new_ids) - len(moved_ids)} chunks")
+    print(f"Collection {collection_name} now holds {chroma_collection.count()} chunks")
+
+    # 4. Lexical index over the same chunks, for hybrid retrieval
+    lexical_index = build_lexical_index(chroma_collection, db_path=db_path, collection_name=collection_name)
+    print(f"BM25 index holds {len(lexical_index.vocab)} terms")
+
+    # 5. Compact read-only export for RETRIEVAL_BACKEND=serving
+    serving_index = export_serving_index(chroma_collection, db_path=db_path, collection_name=collection_name,
+                                         dtype=serving_dtype)
+    if serving_index is not None:
+        print(f"Serving index holds {serving_index.count()} {serving_dtype} vectors "
+              f"in {len(serving_index.list_offsets) - 1} lists")
+    return chroma_collection
+
+
+def ingest_pdf(pdf_path, db_path="vectorstore", collection_name="faq", batch_size=64):
+    return ingest_pdfs([pdf_path], db_path=db_path, collection_name=collection_name,
+                       batch_size=batch_size)
+
+
+def ingest_directory(docs_dir, db_path="vectorstore", collection_name="faq", batch_size=64,
+                     max_workers=None):
+    """
+    Sync every PDF under docs_dir into the collection; chunks of PDFs that were
+    removed from the directory are deleted
+    """
+    pdf_paths = sorted(
+        os.path.join(root, name)
+        for root, _, files in os.walk(docs_dir)
+        for name in files
+        if name.lower().endswith(".pdf")
+    )
+    return ingest_pdfs(pdf_paths, db_path=db_path, collection_name=collection_name,
+                       batch_size=batch_size, prune=True, max_workers=max_workers)
 
-    print(f"Ingested {len(token_split_texts)} chunks into {collection_name}")
 
 if __name__ == "__main__":
-    ingest_pdf("docs/sq_faq.pdf")
-
-
-
-
+    configure_logging()
+    ingest_directory("docs")
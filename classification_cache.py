@@ -0,0 +1,252 @@
+# classification_cache.py
+import asyncio
+import atexit
+import hashlib
+import queue
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+from typing import Awaitable, Callable, List, Optional
+
+from telemetry import get_logger
+
+logger = get_logger(__name__)
+
+_MISSING = object()
+
+
+class _Abandoned(Exception):
+    """
+    Set on an in-flight Future whose owner was cancelled; waiters retry the lookup
+    """
+
+
+def normalize_query(text: str) -> str:
+    """
+    Lowercase, drop punctuation and collapse whitespace, so trivially different
+    spellings of a question share one cache entry
+    """
+    return re.sub(r"\s+", " ", re.sub(r"[^\w\s]", " ", text.lower())).strip()
+
+
+def topics_hash(topics: List[str]) -> str:
+    return hashlib.sha1("\n".join(topics).encode("utf-8")).hexdigest()[:16]
+
+
+class ClassificationCache:
+    """
+    Memoizes LLM topic classifications.
+
+    Keys are the normalized text plus a hash of the topic list, so changing the
+    topics never serves stale labels. Entries live for ttl seconds in a bounded
+    LRU and can be persisted to a SQLite file to survive server restarts; the
+    file is written behind by a background thread, never under the lock.
+    Concurrent misses for the same key share one in-flight LLM call.
+    """
+
+    def __init__(self, max_entries: int = 10000, ttl: Optional[float] = 7 * 24 * 3600,
+                 persist_path: Optional[str] = None):
+        """
+        Args:
+            max_entries: LRU capacity
+            ttl: Seconds a classification stays valid, None for no expiry
+            persist_path: Optional SQLite file to persist classifications to
+        """
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()  # key -> (topic, created_at)
+        self._inflight = {}  # key -> Future
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.shared = 0
+        self.errors = 0
+
+        self._conn = None
+        if persist_path:
+            self._conn = sqlite3.connect(persist_path, check_same_thread=False)
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS classifications "
+                "(key TEXT PRIMARY KEY, topic TEXT, created_at REAL NOT NULL)")
+            self._conn.commit()
+            self._load()
+            self._writes = queue.Queue()
+            threading.Thread(target=self._write_behind, name="classification-cache-writer",
+                             daemon=True).start()
+            atexit.register(self.flush)
+
+    def _load(self):
+        rows = self._conn.execute(
+            "SELECT key, topic, created_at FROM classifications ORDER BY created_at DESC LIMIT ?",
+            (self.max_entries,)).fetchall()
+        for key, topic, created_at in reversed(rows):
+            if not self._expired(created_at):
+                self._entries[key] = (topic, created_at)
+
+    def _expired(self, created_at):
+        return self.ttl is not None and time.time() - created_at > self.ttl
+
+    @staticmethod
+    def key(text: str, topics: List[str]) -> str:
+        return f"{topics_hash(topics)}:{normalize_query(text)}"
+
+    def _lookup(self, key):
+        # Must hold the lock
+        entry = self._entries.get(key)
+        if entry is None:
+            return _MISSING
+        topic, created_at = entry
+        if self._expired(created_at):
+            del self._entries[key]
+            return _MISSING
+        self._entries.move_to_end(key)
+        return topic
+
+    def _store(self, key, topic):
+        # Must hold the lock; the SQLite writes are only queued here
+        now = time.time()
+        self._entries[key] = (topic, now)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            evicted, _ = self._entries.popitem(last=False)
+            if self._conn is not None:
+                self._writes.put(("DELETE FROM classifications WHERE key = ?", (evicted,)))
+        if self._conn is not None:
+            self._writes.put((
+                "INSERT OR REPLACE INTO classifications (key, topic, created_at) VALUES (?, ?, ?)",
+                (key, topic, now)))
+
+    def _write_behind(self):
+        while True:
+            batch = [self._writes.get()]
+            while True:
+                try:
+                    batch.append(self._writes.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                for statement in batch:
+                    self._conn.execute(*statement)
+                self._conn.commit()
+            except sqlite3.Error as e:
+                # The in-memory entries are still served; only persistence is lost
+                logger.warning("Could not persist %d classification cache write(s): %s", len(batch), e)
+            finally:
+                for _ in batch:
+                    self._writes.task_done()
+
+    def flush(self):
+        """
+        Blocks until queued writes are persisted
+        """
+        if self._conn is not None:
+            self._writes.join()
+
+    def _begin(self, key):
+        """
+        Returns (cached topic or _MISSING, in-flight Future, whether this caller owns it)
+        """
+        with self._lock:
+            topic = self._lookup(key)
+            if topic is not _MISSING:
+                self.hits += 1
+                return topic, None, False
+            future = self._inflight.get(key)
+            if future is not None:
+                self.shared += 1
+                return _MISSING, future, False
+            self.misses += 1
+            future = self._inflight[key] = Future()
+            # Running futures cannot be cancelled, so a cancelled async waiter
+            # (asyncio.wrap_future) leaves it to the owner and the other waiters
+            future.set_running_or_notify_cancel()
+            return _MISSING, future, True
+
+    def _fail(self, key, future, error):
+        with self._lock:
+            self.errors += 1
+            del self._inflight[key]
+        future.set_exception(error)
+
+    def _abandon(self, key, future):
+        # The owner was cancelled: release the key so a waiter re-runs the classification
+        with self._lock:
+            del self._inflight[key]
+        future.set_exception(_Abandoned())
+
+    def _finish(self, key, future, topic):
+        with self._lock:
+            self._store(key, topic)
+            del self._inflight[key]
+        future.set_result(topic)
+
+    def get_or_compute(self, text: str, topics: List[str], compute: Callable[[], Optional[str]]):
+        """
+        Returns the cached classification, or runs compute() once for all
+        concurrent callers with the same key. Exceptions are not cached.
+        """
+        key = self.key(text, topics)
+        while True:
+            topic, future, owner = self._begin(key)
+            if topic is not _MISSING:
+                return topic
+            if owner:
+                break
+            try:
+                return future.result()
+            except _Abandoned:
+                continue
+
+        try:
+            topic = compute()
+        except Exception as e:
+            self._fail(key, future, e)
+            raise
+        except BaseException:
+            self._abandon(key, future)
+            raise
+        self._finish(key, future, topic)
+        return topic
+
+    async def aget_or_compute(self, text: str, topics: List[str],
+                              compute: Callable[[], Awaitable[Optional[str]]]):
+        """
+        Async get_or_compute: compute() returns an awaitable. Sync and async
+        callers share the same in-flight calls.
+        """
+        key = self.key(text, topics)
+        while True:
+            topic, future, owner = self._begin(key)
+            if topic is not _MISSING:
+                return topic
+            if owner:
+                break
+            try:
+                return await asyncio.wrap_future(future)
+            except _Abandoned:
+                continue
+
+        try:
+            topic = await compute()
+        except Exception as e:
+            self._fail(key, future, e)
+            raise
+        except BaseException:
+            # e.g. asyncio.CancelledError
+            self._abandon(key, future)
+            raise
+        self._finish(key, future, topic)
+        return topic
+
+    def stats(self):
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "shared_inflight": self.shared,
+            "errors": self.errors,
+            "entries": len(self._entries),
+        }
@@ -1,117 +1,420 @@
 # client_utils.py
+import asyncio
+import json
+
+import httpx
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from provenance import LocalProvenanceFilter
+from telemetry import get_logger, metrics, span
+
+logger = get_logger(__name__)
 
 GUARDRAILS_BASE = "http://127.0.0.1:8000/guards"
 
-def validate_on_topic(query):
-    try:
-        resp = requests.post(
-            f"{GUARDRAILS_BASE}/topic_guard/openai/v1/chat/completions",
-            json={"model": "gpt-3.5-turbo", "messages":[{"role": "user","content": query}]},
-            timeout=60
-        )
-        print(f"Topic Guard Status: {resp.status_code}")
-        # print(f"Response: {resp.json()}")
-        resp.raise_for_status()
-        data = resp.json()
-        print("Topic guard:", data)
+# Seconds to wait for each guard; the hallucination guard calls an LLM per sentence
+DEFAULT_TIMEOUTS = {
+    "topic_guard": 60,
+    "hallucination_guard": 120,
+    "pii_guard": 10,
+    "competitor_guard": 10,
+    # One call checks a whole batch of answers
+    "answer_guard": 300,
+}
+
+# Answers per answer_guard request in validate_answers
+ANSWER_BATCH_SIZE = 100
+
+# answer_guard check -> the guard it replaces, for the outcome metrics
+_ANSWER_CHECKS = {
+    "competitor": "competitor_guard",
+    "pii": "pii_guard",
+    "provenance": "hallucination_guard",
+}
+
+RETRY_STATUSES = (500, 502, 503, 504)
+
+
+def _chat_payload(text):
+    return {
+        "model": "gpt-3.5-turbo",
+        "messages": [
+            {"role": "user", "content": text}
+        ]
+    }
+
 
-        if not data.get("guardrails", {}).get("validation_passed", False):
-            raise ValueError("[BLOCKED] Query off-topic.")
-        return True
+def _outcome(guard, outcome):
+    metrics.increment("guard_outcomes_total", guard=guard, outcome=outcome)
 
-    except requests.exceptions.HTTPError as e:
+
+def _handle_on_topic(resp):
+    logger.debug("Topic guard status: %s", resp.status_code)
+    if resp.status_code >= 400:
+        _outcome("topic_guard", "fail")
         # Catch server error and show to user
         try:
-            error_data = e.response.json()
-            error_msg = error_data.get("detail", "Unknown error")
+            error_msg = resp.json().get("detail")
+        except ValueError:
+            error_msg = None
+        if error_msg:
             raise ValueError(f" {error_msg}")
-        except:
-            raise ValueError(" I can only answer questions about Singapore Airlines.")
+        raise ValueError(" I can only answer questions about Singapore Airlines.")
 
-def validate_hallucination(answer, sources):
+    data = resp.json()
+    logger.debug("Topic guard: %s", data)
+
+    if not data.get("guardrails", {}).get("validation_passed", False):
+        _outcome("topic_guard", "fail")
+        raise ValueError("[BLOCKED] Query off-topic.")
+    _outcome("topic_guard", "pass")
+    return True
+
+
+def _hallucination_payload(answer, sources):
     # print("doc for doc: ", [doc for doc, _ in sources])
     source_texts = [doc for doc, _ in sources]
-    # print(f"Sources type: {type(sources)}")
-    # print(f"Source texts: {source_texts}")
-    payload = {
+    return {
         "llmOutput": answer,
         "metadata": {
             "sources": source_texts
         }
     }
-    # payload = {"llmOutput": answer,
-    #            "metadata": {"sources": [doc for doc, _ in sources]}}
-    # print(f"Payload: {payload}")
-
-    resp = requests.post(
-        f"{GUARDRAILS_BASE}/hallucination_guard/validate",
-        json=payload,
-        timeout=120
-    )
+
+
+def _handle_hallucination(resp):
     data = resp.json()
-    print("Hallucination Guard: ", data)
+    logger.debug("Hallucination guard: %s", data)
 
     if not data.get("validationPassed", False):
-        print(f"Hallucination detected: {data}")
+        _outcome("hallucination_guard", "fail")
+        logger.info("Hallucination detected: %s", data)
         raise ValueError("Output blocked by hallucination guard")
+    _outcome("hallucination_guard", "pass")
     return True
 
 
-def validate_pii(text):
-    # payload = {"text": text}
-    payload = {
-            "model": "gpt-3.5-turbo",
-            "messages": [
-                {"role": "user", "content": text}
-            ]
-        }
-    resp = requests.post(
-        f"{GUARDRAILS_BASE}/pii_guard/validate", json=payload, timeout=10)
-
+def _handle_pii(resp, text):
     resp.raise_for_status()
     data = resp.json()
-    print("PII Guard: ", data)
+    logger.debug("PII guard: %s", data)
     # masked_text = data.get("message", {}).get("content", text)
     masked_text = data.get("validatedOutput", text)
-    print(f"Original: {text}")
-    print(f"Masked: {masked_text}")
     if not data.get("validationPassed", False):
+        _outcome("pii_guard", "fail")
         raise ValueError("Output blocked by PII guard")
+    if masked_text != text:
+        logger.info("PII masked: %r -> %r", text, masked_text)
+    _outcome("pii_guard", "fix" if masked_text != text else "pass")
     return masked_text
 
-def validate_competitor(text):
-    # payload = {"text": text}
-    payload = {
-            "model": "gpt-3.5-turbo",
-            "messages": [
-                {"role": "user", "content": text}
-            ]
-        }
-    resp = requests.post(
-        f"{GUARDRAILS_BASE}/competitor_guard/openai/v1/chat/completions",
-        json=payload,
-        timeout=10
-    )
+
+def _competitor_free(resp):
+    # Non-blocking: whether the text is free of competitor mentions
     resp.raise_for_status()
     data = resp.json()
-    print("Competitor Guard: ", data)
+    logger.debug("Competitor guard: %s", data)
     if not data.get("validation_passed", False):
         # raise ValueError("Output blocked by competitor guard")
-        print("Sorry, I cannot provide information about competitor airlines. I’m here to help with Singapore Airlines questions only.")
+        _outcome("competitor_guard", "filter")
+        logger.warning("Sorry, I cannot provide information about competitor airlines. I’m here to help with Singapore Airlines questions only.")
+        return False
+    _outcome("competitor_guard", "pass")
+    return True
+
+
+def _handle_competitor(resp):
+    # Non-blocking: a mention is only logged, so this always returns True
+    _competitor_free(resp)
     return True
 
-    # except requests.exceptions.HTTPError as e:
-    #     # Catch the 400 error from server
-    #     try:
-    #         error_data = e.response.json()
-    #         error_msg = error_data.get("detail", "")
-    #
-    #         if "competitors" in error_msg.lower():
-    #             raise ValueError(
-    #                 " I cannot provide information about competitors. I'm here to help with Singapore Airlines questions only.")
-    #         else:
-    #             raise ValueError(f" {error_msg}")
-    #     except:
-    #         raise ValueError(
-    #             "I cannot provide information about competitors. I'm here to help with Singapore Airlines questions only.")
\ No newline at end of file
+
+def _answer_payload(items):
+    return {"llmOutput": json.dumps(items)}
+
+
+def _handle_answers(resp):
+    """
+    Returns the answer_guard reports: per answer {"passed", "output", "validators"}
+    """
+    resp.raise_for_status()
+    data = resp.json()
+    logger.debug("Answer guard: %s", data)
+    if not data.get("validationPassed", False):
+        raise ValueError("Output blocked by answer guard")
+    reports = json.loads(data["validatedOutput"])
+    for report in reports:
+        for check, result in report["validators"].items():
+            if result["outcome"] != "skipped":
+                _outcome(_ANSWER_CHECKS.get(check, check), result["outcome"])
+    return reports
+
+
+def _handle_answer(report):
+    # Same contract as the separate guards: None if filtered, error if not grounded
+    validators = report["validators"]
+    if validators["competitor"]["outcome"] == "filter":
+        logger.warning("Sorry, I cannot provide information about competitor airlines. I’m here to help with Singapore Airlines questions only.")
+        return None
+    if validators.get("pii", {}).get("outcome") == "fix":
+        logger.info("PII masked: %r", report["output"])
+    if validators["provenance"]["outcome"] == "fail":
+        logger.info("Hallucination detected: %s", validators["provenance"])
+        raise ValueError("Output blocked by hallucination guard")
+    return report["output"]
+
+
+class GuardrailsClient:
+    """
+    Client for the guardrails server that keeps connections alive between calls.
+
+    Sync validators share one pooled requests.Session and async validators share
+    one httpx.AsyncClient. Connection errors and 5xx responses are retried with
+    exponential backoff; 4xx responses (e.g. a guard rejecting the input) are not.
+    """
+
+    def __init__(
+            self,
+            base_url=GUARDRAILS_BASE,
+            pool_size=10,
+            timeouts=None,
+            retries=3,
+            backoff_factor=0.5,
+            provenance_filter=None,
+    ):
+        """
+        Args:
+            base_url: Guards endpoint of the guardrails server
+            pool_size: Maximum number of kept-alive connections to the server
+            timeouts: Per-guard timeout overrides in seconds, e.g. {"pii_guard": 5}
+            retries: Retries after the first attempt on connection errors and 5xx
+            backoff_factor: Sleep backoff_factor * 2 ** attempt seconds between retries
+            provenance_filter: Optional LocalProvenanceFilter; answer sentences it supports
+                               locally are not sent to the hallucination guard
+        """
+        self.base_url = base_url.rstrip("/")
+        self.pool_size = pool_size
+        self.timeouts = {**DEFAULT_TIMEOUTS, **(timeouts or {})}
+        self.retries = retries
+        self.backoff_factor = backoff_factor
+        self.provenance_filter = provenance_filter
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(
+            pool_connections=pool_size,
+            pool_maxsize=pool_size,
+            max_retries=Retry(
+                total=retries,
+                # A read timeout means the guard is still working; retrying it
+                # would multiply the wait. Only connection errors and 5xx retry.
+                read=0,
+                backoff_factor=backoff_factor,
+                status_forcelist=RETRY_STATUSES,
+                # Guard validation has no side effects, so POST is safe to retry
+                allowed_methods=frozenset({"POST"}),
+                raise_on_status=False,
+            ),
+        )
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self._async_client = None
+
+    # ---- transport ----
+
+    def _post(self, guard, path, payload):
+        with span(f"guard.{guard}"):
+            return self.session.post(
+                f"{self.base_url}/{guard}/{path}", json=payload, timeout=self.timeouts[guard])
+
+    @property
+    def async_client(self):
+        if self._async_client is None:
+            self._async_client = httpx.AsyncClient(
+                limits=httpx.Limits(
+                    max_connections=self.pool_size,
+                    max_keepalive_connections=self.pool_size,
+                ),
+            )
+        return self._async_client
+
+    async def _apost(self, guard, path, payload):
+        with span(f"guard.{guard}"):
+            return await self._apost_with_retries(guard, path, payload)
+
+    async def _apost_with_retries(self, guard, path, payload):
+        for attempt in range(self.retries + 1):
+            last_attempt = attempt == self.retries
+            try:
+                resp = await self.async_client.post(
+                    f"{self.base_url}/{guard}/{path}", json=payload, timeout=self.timeouts[guard])
+            except (httpx.ConnectError, httpx.ConnectTimeout):
+                # Not read timeouts, as on the sync path
+                if last_attempt:
+                    raise
+            else:
+                if resp.status_code not in RETRY_STATUSES or last_attempt:
+                    return resp
+            metrics.increment("guard_retries_total", guard=guard)
+            await asyncio.sleep(self.backoff_factor * 2 ** attempt)
+
+    def close(self):
+        self.session.close()
+
+    async def aclose(self):
+        # Only the async client is bound to the running event loop
+        if self._async_client is not None:
+            await self._async_client.aclose()
+            self._async_client = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.aclose()
+        self.close()
+
+    # ---- sync validators ----
+
+    def validate_on_topic(self, query):
+        resp = self._post("topic_guard", "openai/v1/chat/completions", _chat_payload(query))
+        return _handle_on_topic(resp)
+
+    def _prefilter_hallucination(self, answer, sources):
+        """
+        Returns the part of the answer that still needs the LLM provenance check, or None
+        """
+        if self.provenance_filter is None:
+            return answer
+        split = self.provenance_filter.split(answer, [doc for doc, _ in sources])
+        logger.info("Provenance: %d sentence(s) resolved locally, %d sent to hallucination guard",
+                    len(split.supported), len(split.uncertain))
+        metrics.increment("provenance_sentences_total", len(split.supported), resolved="local")
+        metrics.increment("provenance_sentences_total", len(split.uncertain), resolved="llm")
+        if not split.uncertain:
+            _outcome("hallucination_guard", "pass_local")
+            return None
+        return " ".join(split.uncertain)
+
+    def _answer_item(self, answer, sources):
+        return {
+            "text": answer,
+            "sources": [doc for doc, _ in sources],
+            "provenance_text": self._prefilter_hallucination(answer, sources),
+        }
+
+    def validate_hallucination(self, answer, sources):
+        answer = self._prefilter_hallucination(answer, sources)
+        if answer is None:
+            return True
+        resp = self._post("hallucination_guard", "validate", _hallucination_payload(answer, sources))
+        return _handle_hallucination(resp)
+
+    def validate_pii(self, text):
+        resp = self._post("pii_guard", "validate", _chat_payload(text))
+        return _handle_pii(resp, text)
+
+    def validate_competitor(self, text):
+        resp = self._post("competitor_guard", "openai/v1/chat/completions", _chat_payload(text))
+        return _handle_competitor(resp)
+
+    def competitor_free(self, text):
+        """
+        Same check as validate_competitor, but returns False if the text
+        mentions a competitor (e.g. to drop a streamed sentence)
+        """
+        resp = self._post("competitor_guard", "openai/v1/chat/completions", _chat_payload(text))
+        return _competitor_free(resp)
+
+    def validate_answer(self, answer, sources):
+        """
+        Competitor, PII and provenance checks in one request. Returns the answer
+        with PII masked, None if it mentions a competitor, and raises ValueError
+        if it is not grounded in sources.
+        """
+        resp = self._post("answer_guard", "validate", _answer_payload([self._answer_item(answer, sources)]))
+        return _handle_answer(_handle_answers(resp)[0])
+
+    def validate_answers(self, answers, batch_size=ANSWER_BATCH_SIZE):
+        """
+        Check many (answer, sources) pairs, batch_size answers per request, e.g.
+        for offline evaluation. Returns one report per answer:
+        {"passed", "output", "validators": {check: {"outcome", ...}}}
+        """
+        items = [self._answer_item(answer, sources) for answer, sources in answers]
+        reports = []
+        for start in range(0, len(items), batch_size):
+            resp = self._post("answer_guard", "validate", _answer_payload(items[start:start + batch_size]))
+            reports += _handle_answers(resp)
+        return reports
+
+    # ---- async validators ----
+
+    async def avalidate_on_topic(self, query):
+        resp = await self._apost("topic_guard", "openai/v1/chat/completions", _chat_payload(query))
+        return _handle_on_topic(resp)
+
+    async def avalidate_hallucination(self, answer, sources):
+        answer = await asyncio.to_thread(self._prefilter_hallucination, answer, sources)
+        if answer is None:
+            return True
+        resp = await self._apost("hallucination_guard", "validate", _hallucination_payload(answer, sources))
+        return _handle_hallucination(resp)
+
+    async def avalidate_pii(self, text):
+        resp = await self._apost("pii_guard", "validate", _chat_payload(text))
+        return _handle_pii(resp, text)
+
+    async def avalidate_competitor(self, text):
+        resp = await self._apost("competitor_guard", "openai/v1/chat/completions", _chat_payload(text))
+        return _handle_competitor(resp)
+
+    async def avalidate_answer(self, answer, sources):
+        item = await asyncio.to_thread(self._answer_item, answer, sources)
+        resp = await self._apost("answer_guard", "validate", _answer_payload([item]))
+        return _handle_answer(_handle_answers(resp)[0])
+
+    async def avalidate_answers(self, answers, batch_size=ANSWER_BATCH_SIZE):
+        items = await asyncio.to_thread(
+            lambda: [self._answer_item(answer, sources) for answer, sources in answers])
+        batches = [items[start:start + batch_size] for start in range(0, len(items), batch_size)]
+        # Batches are sent concurrently, up to pool_size at a time
+        responses = await asyncio.gather(
+            *(self._apost("answer_guard", "validate", _answer_payload(batch)) for batch in batches))
+        return [report for resp in responses for report in _handle_answers(resp)]
+
+
+# Shared by the module-level helpers below so repeated calls reuse connections
+default_client = GuardrailsClient(provenance_filter=LocalProvenanceFilter())
+metrics.register_gauges("provenance_filter", default_client.provenance_filter.stats)
+
+
+def validate_on_topic(query):
+    return default_client.validate_on_topic(query)
+
+
+def validate_hallucination(answer, sources):
+    return default_client.validate_hallucination(answer, sources)
+
+
+def validate_pii(text):
+    return default_client.validate_pii(text)
+
+
+def validate_competitor(text):
+    return default_client.validate_competitor(text)
+
+
+def validate_answer(answer, sources):
+    return default_client.validate_answer(answer, sources)
+
+
+def validate_answers(answers, batch_size=ANSWER_BATCH_SIZE):
+    return default_client.validate_answers(answers, batch_size=batch_size)
@@ -0,0 +1,201 @@
+# competitor_matcher.py
+import json
+import re
+from typing import Callable, Dict, List, NamedTuple, Optional, Tuple
+
+from text_utils import sentence_spans
+from topic_matcher import build_trie_pattern
+
+# competitor -> aliases (matched in any case, except short all-caps ones such as
+# "THY" that would otherwise match ordinary words), IATA codes (matched
+# case-sensitively) and ambiguous aliases that are also ordinary words, which
+# NER has to confirm
+DEFAULT_ALIAS_TABLE = {
+    "Emirates": {"aliases": ["Emirates", "Emirates Airline", "Fly Emirates"], "codes": ["EK"]},
+    "Qatar Airways": {"aliases": ["Qatar Airways"], "codes": ["QR"], "ambiguous": ["Qatar"]},
+    "Etihad Airways": {"aliases": ["Etihad", "Etihad Airways"], "codes": ["EY"]},
+    "Cathay Pacific": {"aliases": ["Cathay Pacific", "Cathay"], "codes": ["CX"]},
+    "Qantas": {"aliases": ["Qantas", "Qantas Airways"], "codes": ["QF"]},
+    "Malaysia Airlines": {"aliases": ["Malaysia Airlines", "Malaysian Airline System"], "codes": ["MH"],
+                          "ambiguous": ["MAS"]},
+    "Thai Airways": {"aliases": ["Thai Airways", "Thai Airways International"], "codes": ["TG"]},
+    "Garuda Indonesia": {"aliases": ["Garuda Indonesia", "Garuda"], "codes": ["GA"]},
+    "Vietnam Airlines": {"aliases": ["Vietnam Airlines"], "codes": ["VN"]},
+    "Philippine Airlines": {"aliases": ["Philippine Airlines"], "codes": ["PR"]},
+    "AirAsia": {"aliases": ["AirAsia", "Air Asia", "AirAsia X"], "codes": ["AK", "D7"]},
+    "Jetstar": {"aliases": ["Jetstar", "Jetstar Asia"], "codes": ["JQ", "3K"]},
+    "Turkish Airlines": {"aliases": ["Turkish Airlines", "THY"], "codes": ["TK"]},
+    "Lufthansa": {"aliases": ["Lufthansa"], "codes": ["LH"]},
+    "British Airways": {"aliases": ["British Airways"], "codes": ["BA"]},
+    "Air France": {"aliases": ["Air France"], "codes": ["AF"]},
+    "KLM": {"aliases": ["KLM", "KLM Royal Dutch Airlines"], "codes": ["KL"]},
+    "Japan Airlines": {"aliases": ["Japan Airlines", "JAL"], "codes": ["JL"]},
+    "All Nippon Airways": {"aliases": ["All Nippon Airways"], "codes": ["NH"], "ambiguous": ["ANA"]},
+    "Korean Air": {"aliases": ["Korean Air"], "codes": ["KE"]},
+    "United Airlines": {"aliases": ["United Airlines"], "codes": ["UA"], "ambiguous": ["United"]},
+    "Delta Air Lines": {"aliases": ["Delta Air Lines", "Delta Airlines"], "codes": ["DL"], "ambiguous": ["Delta"]},
+    "American Airlines": {"aliases": ["American Airlines"], "codes": ["AA"]},
+    "oneworld": {"aliases": ["oneworld", "oneworld alliance"]},
+    "SkyTeam": {"aliases": ["SkyTeam", "SkyTeam alliance"]},
+}
+
+# Entity labels that confirm an ambiguous alias refers to the airline
+NER_LABELS = ("ORG",)
+
+# All-caps aliases up to this long are matched case-sensitively, like codes
+ACRONYM_MAX_LENGTH = 4
+
+
+def _is_acronym(alias: str) -> bool:
+    return alias.isupper() and len(alias) <= ACRONYM_MAX_LENGTH
+
+
+def load_alias_table(path: str) -> Dict[str, Dict[str, List[str]]]:
+    """
+    JSON file in the DEFAULT_ALIAS_TABLE format
+    """
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+class CompetitorMention(NamedTuple):
+    competitor: str
+    start: int
+    end: int
+    ambiguous: bool
+
+
+class CompetitorMatcher:
+    """
+    Finds competitor mentions with compiled trie-factored regexes built once
+    from an alias table: one for names (any case), one for short all-caps
+    aliases and one for IATA codes (both exact case). Scanning costs about the
+    same however many carriers are listed.
+
+    Unambiguous names, and codes followed by a flight number (EK 405), count
+    straight away. Ambiguous aliases and bare codes only count when NER tags
+    them as an organisation; NER runs on those sentences only.
+    """
+
+    def __init__(self, alias_table: Optional[Dict[str, Dict[str, List[str]]]] = None,
+                 nlp: Optional[Callable] = None, spacy_model: str = "en_core_web_trf",
+                 ner_labels=NER_LABELS, batched_ner: bool = False):
+        """
+        Args:
+            alias_table: competitor -> {"aliases", "codes", "ambiguous"}; DEFAULT_ALIAS_TABLE if None
+            nlp: spaCy-style callable returning a doc with .ents; loaded lazily if None
+            spacy_model: Model for the lazy NER pipeline, shared through model_registry
+            ner_labels: Entity labels that confirm an ambiguous mention
+            batched_ner: Micro-batch the lazy pipeline's calls with other threads'
+        """
+        alias_table = DEFAULT_ALIAS_TABLE if alias_table is None else alias_table
+        self.competitors = list(alias_table)
+        self._nlp = nlp
+        self.spacy_model = spacy_model
+        self.ner_labels = set(ner_labels)
+        self.batched_ner = batched_ner
+
+        self._names = {}  # lowercased alias -> (competitor, ambiguous)
+        self._acronyms = {}  # all-caps alias -> (competitor, ambiguous)
+        self._codes = {}  # code -> competitor
+        for competitor, entry in alias_table.items():
+            for alias in [competitor] + list(entry.get("aliases", [])):
+                if _is_acronym(alias):
+                    self._acronyms[alias] = (competitor, False)
+                else:
+                    self._names[alias.lower()] = (competitor, False)
+            for alias in entry.get("ambiguous", []):
+                if _is_acronym(alias):
+                    self._acronyms.setdefault(alias, (competitor, True))
+                else:
+                    self._names.setdefault(alias.lower(), (competitor, True))
+            for code in entry.get("codes", []):
+                self._codes[code] = competitor
+
+        self._name_pattern = re.compile(
+            r"\b(" + build_trie_pattern(self._names) + r")\b", re.IGNORECASE) if self._names else None
+        # "THY" but not "thy"
+        self._acronym_pattern = re.compile(
+            r"\b(" + build_trie_pattern(self._acronyms) + r")\b") if self._acronyms else None
+        # A flight number after the code makes it unambiguous
+        self._code_pattern = re.compile(
+            r"\b(" + build_trie_pattern(self._codes) + r")(\s?\d{1,4})?\b") if self._codes else None
+
+        self.ner_calls = 0
+
+    @property
+    def nlp(self):
+        if self._nlp is None:
+            import model_registry
+            if self.batched_ner:
+                self._nlp = model_registry.batched_spacy_model(self.spacy_model)
+            else:
+                self._nlp = model_registry.spacy_model(self.spacy_model)
+        return self._nlp
+
+    def mentions(self, text: str) -> List[CompetitorMention]:
+        """
+        Every alias or code match, before any NER check
+        """
+        found = []
+        if self._name_pattern is not None:
+            for m in self._name_pattern.finditer(text):
+                competitor, ambiguous = self._names[m.group(1).lower()]
+                found.append(CompetitorMention(competitor, m.start(1), m.end(1), ambiguous))
+        if self._acronym_pattern is not None:
+            for m in self._acronym_pattern.finditer(text):
+                competitor, ambiguous = self._acronyms[m.group(1)]
+                found.append(CompetitorMention(competitor, m.start(1), m.end(1), ambiguous))
+        if self._code_pattern is not None:
+            for m in self._code_pattern.finditer(text):
+                found.append(CompetitorMention(self._codes[m.group(1)], m.start(1), m.end(1), m.group(2) is None))
+        return sorted(found, key=lambda mention: mention.start)
+
+    def _confirmed(self, sentence: str, mentions: List[CompetitorMention]) -> List[str]:
+        # Ambiguous mentions (offsets relative to sentence) that NER tags as an organisation
+        self.ner_calls += 1
+        entities = [(ent.start_char, ent.end_char) for ent in self.nlp(sentence).ents
+                    if ent.label_ in self.ner_labels]
+        return [m.competitor for m in mentions
+                if any(start < m.end and m.start < end for start, end in entities)]
+
+    def flagged_sentences(self, text: str) -> List[Tuple[int, int, List[str]]]:
+        """
+        (start, end, competitors) for each sentence that mentions a competitor
+        """
+        mentions = self.mentions(text)
+        if not mentions:
+            return []
+        flagged = []
+        for start, end in sentence_spans(text):
+            inside = [m for m in mentions if start <= m.start < end]
+            if not inside:
+                continue
+            competitors = [m.competitor for m in inside if not m.ambiguous]
+            ambiguous = [m._replace(start=m.start - start, end=m.end - start) for m in inside if m.ambiguous]
+            if ambiguous and not competitors:
+                competitors = self._confirmed(text[start:end], ambiguous)
+            if competitors:
+                flagged.append((start, end, list(dict.fromkeys(competitors))))
+        return flagged
+
+    def filter(self, text: str) -> Tuple[str, List[str]]:
+        """
+        Returns the text without the sentences that mention competitors, and
+        the competitors found
+        """
+        flagged = self.flagged_sentences(text)
+        if not flagged:
+            return text, []
+        pieces = []
+        last = 0
+        for start, end, _ in flagged:
+            pieces.append(text[last:start])
+            # Drop the whitespace that followed the removed sentence as well
+            last = end
+            while last < len(text) and text[last].isspace():
+                last += 1
+        pieces.append(text[last:])
+        kept = "".join(pieces).strip()
+        competitors = list(dict.fromkeys(c for _, _, found in flagged for c in found))
+        return kept, competitors
@@ -1,15 +1,18 @@
 # guardrails start --config config.py
 # Import Guard and Validator
 from typing import Any, Dict
+import asyncio
+import json
 import os
 from dotenv import load_dotenv
-from openai import OpenAI
+from openai import AsyncOpenAI, OpenAI
 
 load_dotenv()
 
 assert os.getenv("OPENAI_API_KEY"), "OPENAI_API_KEY not loaded!"
 # Initialize OpenAI client
 openai_client = OpenAI()
+async_openai_client = AsyncOpenAI()
 
 # OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
 # OPENAI_KEY = os.environ.get("OPENAI_API_KEY") # Guardrails read env itself, so no need to set
@@ -40,7 +43,6 @@ except ImportError:
 
     from guardrails.hub import ProvenanceLLM, DetectPII, RestrictToTopic, CompetitorCheck
 
-import re
 from typing import Any, Dict, List, Optional
 from guardrails.validator_base import (
     FailResult,
@@ -49,13 +51,28 @@ from guardrails.validator_base import (
     Validator,
     register_validator,
 )
+import model_registry
+from classification_cache import ClassificationCache
+from competitor_matcher import CompetitorMatcher, load_alias_table
+from pii_prescreen import PIIPrescreen
+from topic_classifier import ACCEPT, AMBIGUOUS, SemanticTopicClassifier
+from telemetry import get_logger, metrics, span, start_exporter
+from topic_matcher import TopicMatcher
+
+logger = get_logger(__name__)
+
+# Concurrent validations share model calls: up to MICRO_BATCH_MAX_SIZE texts
+# arriving within MICRO_BATCH_MAX_WAIT_MS run as one batch. MICRO_BATCH=0 disables it.
+MICRO_BATCH = os.getenv("MICRO_BATCH", "1") != "0"
+
+metrics.register_gauges("model_registry", model_registry.registry.stats)
 
 
 @register_validator(name="custom_topic_guard", data_type="string")
 class CustomTopicGuard(Validator):
     """
     Custom topic guard that classifies text against valid/invalid topics
-    using keyword matching and optional LLM classification
+    using keyword matching, optional embedding similarity and optional LLM classification
     """
 
     def __init__(
@@ -64,6 +81,15 @@ class CustomTopicGuard(Validator):
             invalid_topics: List[str],
             use_llm: bool = False,
             llm_callable=None,
+            use_semantic: bool = False,
+            topic_examples: Optional[Dict[str, List[str]]] = None,
+            semantic_accept_threshold: float = 0.6,
+            semantic_reject_threshold: float = 0.3,
+            classification_cache: Optional[ClassificationCache] = None,
+            async_llm_callable=None,
+            llm_concurrency: int = 8,
+            llm_timeout: float = 10.0,
+            semantic_embedding_function=None,
             **kwargs
     ):
         """
@@ -72,16 +98,47 @@ class CustomTopicGuard(Validator):
             invalid_topics: List of forbidden topics
             use_llm: Whether to use LLM for classification
             llm_callable: Function to call LLM (if use_llm=True)
+            use_semantic: Whether to classify keyword misses locally with embeddings first
+            topic_examples: Example phrasings per topic for the semantic classifier
+            semantic_accept_threshold: Similarity at or above which the semantic topic is trusted
+            semantic_reject_threshold: Similarity below which the text matches no topic;
+                                       scores in between are sent to the LLM
+            classification_cache: Optional cache memoizing LLM classifications
+            async_llm_callable: Coroutine function used for the LLM on the async path;
+                                without it the async path runs llm_callable in a thread
+            llm_concurrency: Maximum concurrent async LLM calls per validator
+            llm_timeout: Seconds before an async LLM call is abandoned
+            semantic_embedding_function: Embedding function for the semantic classifier;
+                                         the shared model_registry one if None
         """
         self.valid_topics = valid_topics
         self.invalid_topics = invalid_topics
         self.use_llm = use_llm
         self.llm_callable = llm_callable
+        self.use_semantic = use_semantic
+        self.classification_cache = classification_cache
+        self.async_llm_callable = async_llm_callable
+        self.llm_timeout = llm_timeout
+        self._llm_semaphore = asyncio.Semaphore(llm_concurrency)
 
         # Create lowercase versions for case-insensitive matching
         self.valid_topics_lower = [t.lower() for t in valid_topics]
         self.invalid_topics_lower = [t.lower() for t in invalid_topics]
 
+        # Compiled once; scans the input a single time for all topics
+        self.topic_matcher = TopicMatcher(valid_topics, invalid_topics)
+
+        # Topic embeddings are computed once here, not per request
+        self.semantic_classifier = None
+        if use_semantic:
+            self.semantic_classifier = SemanticTopicClassifier(
+                valid_topics + invalid_topics,
+                examples=topic_examples,
+                embedding_function=semantic_embedding_function,
+                accept_threshold=semantic_accept_threshold,
+                reject_threshold=semantic_reject_threshold,
+            )
+
         super().__init__(**kwargs)
 
     def keyword_match(self, text: str) -> Optional[str]:
@@ -89,20 +146,8 @@ class CustomTopicGuard(Validator):
         Match text against topics using keywords
         Returns the matched topic or None
         """
-        text_lower = text.lower()
-
-        # Check for invalid topics first (highest priority)
-        for topic in self.invalid_topics_lower:
-            # Use word boundaries for whole word matching
-            if re.search(r'\b' + re.escape(topic) + r'\b', text_lower):
-                return topic
-
-        # Check for valid topics
-        for topic in self.valid_topics_lower:
-            if re.search(r'\b' + re.escape(topic) + r'\b', text_lower):
-                return topic
-
-        return None
+        match = self.topic_matcher.match(text)
+        return match.topic if match else None
 
     def llm_classification(self, text: str) -> Optional[str]:
         """
@@ -114,81 +159,391 @@ class CustomTopicGuard(Validator):
 
         try:
             all_topics = self.valid_topics + self.invalid_topics
-            result = self.llm_callable(text, all_topics)
-
-            # Normalize result
-            result_lower = result.lower().strip()
+            if self.classification_cache is None:
+                return self._llm_topic(text, all_topics)
+            return self.classification_cache.get_or_compute(
+                text, all_topics, lambda: self._llm_topic(text, all_topics))
+        except Exception as e:
+            logger.warning("LLM classification error: %s", e)
+            metrics.increment("topic_llm_errors_total")
+            return None
 
-            # Check if result matches any topic
-            for topic in all_topics:
-                if result_lower == topic.lower():
-                    return topic
+    async def allm_classification(self, text: str) -> Optional[str]:
+        """
+        Async version of llm_classification; at most llm_concurrency calls are
+        in flight and each is abandoned after llm_timeout seconds
+        """
+        if not self.async_llm_callable:
+            # Sync fallback, kept off the event loop
+            return await asyncio.to_thread(self.llm_classification, text)
 
+        try:
+            all_topics = self.valid_topics + self.invalid_topics
+            if self.classification_cache is None:
+                return await self._allm_topic(text, all_topics)
+            return await self.classification_cache.aget_or_compute(
+                text, all_topics, lambda: self._allm_topic(text, all_topics))
+        except asyncio.TimeoutError:
+            logger.warning("LLM classification timed out after %ss", self.llm_timeout)
+            metrics.increment("topic_llm_errors_total", reason="timeout")
             return None
         except Exception as e:
-            print(f"LLM classification error: {e}")
+            logger.warning("LLM classification error: %s", e)
+            metrics.increment("topic_llm_errors_total")
             return None
 
-    def _validate(
-            self,
-            value: str,
-            metadata: Optional[Dict[str, Any]] = None
-    ) -> ValidationResult:
+    async def _allm_topic(self, text: str, all_topics: List[str]) -> Optional[str]:
+        async with self._llm_semaphore:
+            result = await asyncio.wait_for(self.async_llm_callable(text, all_topics), self.llm_timeout)
+        return self._match_llm_result(result, all_topics)
+
+    def _llm_topic(self, text: str, all_topics: List[str]) -> Optional[str]:
+        return self._match_llm_result(self.llm_callable(text, all_topics), all_topics)
+
+    @staticmethod
+    def _match_llm_result(result: str, all_topics: List[str]) -> Optional[str]:
+        # Normalize result
+        result_lower = result.lower().strip()
+
+        # Check if result matches any topic
+        for topic in all_topics:
+            if result_lower == topic.lower():
+                return topic
+
+        return None
+
+    def _classify_locally(self, value: str):
         """
-        Main validation method
+        Keyword and semantic steps; returns (matched_topic, needs_llm, path)
         """
         # Step 1: Try keyword matching first (fast)
-        matched_topic = self.keyword_match(value)
-        print("Matched Topic: ",matched_topic )
-
-        # Step 2: If no match, try LLM classification (if enabled)
-        if not matched_topic and self.use_llm:
-            matched_topic = self.llm_classification(value)
-            print("LLM Classified Topic: ", matched_topic)
-
-        # Step 3: Check if matched topic is invalid
+        with span("topic.keyword"):
+            match = self.topic_matcher.match(value)
+        matched_topic = match.topic if match else None
+        path = "keyword"
+        logger.debug("Matched topic: %s %s", matched_topic, (match.start, match.end) if match else "")
+
+        # Step 2: If no match, try the local semantic classifier (if enabled)
+        needs_llm = not matched_topic
+        if not matched_topic and self.semantic_classifier:
+            with span("topic.semantic"):
+                classification = self.semantic_classifier.classify(value)
+            logger.debug("Semantic classified topic: %s", classification)
+            path = "semantic"
+            if classification.decision == ACCEPT:
+                matched_topic = classification.topic
+            # Only the ambiguous band is worth an LLM round trip
+            needs_llm = classification.decision == AMBIGUOUS
+
+        return matched_topic, needs_llm and self.use_llm, path
+
+    def _decide(self, matched_topic: Optional[str], path: str) -> ValidationResult:
+        # Step 4: Check if matched topic is invalid
         if matched_topic and matched_topic.lower() in self.invalid_topics_lower:
+            metrics.increment("topic_guard_decisions_total", path=path, result="invalid_topic")
             return FailResult(
                 error_message=f"Topic '{matched_topic}' is not allowed. Please ask about Singapore Airlines services instead."
             )
 
-        # Step 4: If no valid topic matched
+        # Step 5: If no valid topic matched
         if not matched_topic:
+            metrics.increment("topic_guard_decisions_total", path=path, result="no_topic")
             return FailResult(
                 error_message="Your question doesn't match any supported Singapore Airlines topics. Please ask about: flight booking, baggage, refunds, check-in, etc."
             )
 
-        # Step 5: Valid topic found
-        print("Valid topic verified: ", matched_topic)
+        # Step 6: Valid topic found
+        metrics.increment("topic_guard_decisions_total", path=path, result="pass")
+        logger.debug("Valid topic verified: %s", matched_topic)
         return PassResult(message=f"Topic verified: {matched_topic}")
 
-# hallucination_guard = AsyncGuard(name="hallucination_guard").use(ProvenanceLLM, validation_method="full", llm_callable='gpt-4o-mini', on_fail=OnFailAction.EXCEPTION)
-hallucination_guard = AsyncGuard(name="hallucination_guard").use(
-    ProvenanceLLM, validation_method="sentence", llm_callable='gpt-4o-mini', on_fail=OnFailAction.EXCEPTION)
+    def _validate(
+            self,
+            value: str,
+            metadata: Optional[Dict[str, Any]] = None
+    ) -> ValidationResult:
+        """
+        Main validation method (sync)
+        """
+        matched_topic, needs_llm, path = self._classify_locally(value)
+
+        # Step 3: If still undecided, try LLM classification (if enabled)
+        if needs_llm:
+            metrics.increment("topic_llm_fallbacks_total")
+            with span("topic.llm"):
+                matched_topic = self.llm_classification(value)
+            logger.debug("LLM classified topic: %s", matched_topic)
+            path = "llm"
+
+        return self._decide(matched_topic, path)
+
+    async def async_validate(
+            self,
+            value: str,
+            metadata: Optional[Dict[str, Any]] = None
+    ) -> ValidationResult:
+        """
+        Main validation method (async), used by AsyncGuard on the server.
+        The LLM round trip is awaited, so concurrent topic checks overlap
+        instead of blocking the event loop.
+        """
+        # Embedding the query is CPU work, keep it off the event loop
+        matched_topic, needs_llm, path = await asyncio.to_thread(self._classify_locally, value)
+
+        # Step 3: If still undecided, try LLM classification (if enabled)
+        if needs_llm:
+            metrics.increment("topic_llm_fallbacks_total")
+            with span("topic.llm"):
+                matched_topic = await self.allm_classification(value)
+            logger.debug("LLM classified topic: %s", matched_topic)
+            path = "llm"
+
+        return self._decide(matched_topic, path)
 
 
+@register_validator(name="composite_answer_guard", data_type="string")
+class CompositeAnswerGuard(Validator):
+    """
+    Runs the competitor, PII and provenance checks on one or many answers in a
+    single guard call.
+
+    The input is a JSON list of {"text", "sources", "provenance_text"} items
+    ("provenance_text" is the part of the answer that still needs the provenance
+    check, null to skip it). The output is a JSON list with, per answer, each
+    check's outcome and the final fixed text (null if the answer was filtered).
+    """
+
+    def __init__(
+            self,
+            pii_validator: Validator,
+            competitor_validator: Validator,
+            provenance_validator: Validator,
+            concurrency: int = 8,
+            **kwargs
+    ):
+        """
+        Args:
+            pii_validator: Masks PII; its fix_value becomes the output text
+            competitor_validator: A failure filters the answer out
+            provenance_validator: A failure marks the answer as not passed
+            concurrency: Answers of one batch checked in parallel on the async path
+        """
+        self.pii_validator = pii_validator
+        self.competitor_validator = competitor_validator
+        self.provenance_validator = provenance_validator
+        self.concurrency = concurrency
+        super().__init__(**kwargs)
+
+    @staticmethod
+    def _outcome(result: ValidationResult):
+        if isinstance(result, FailResult):
+            return {"outcome": "fail", "message": result.error_message}
+        return {"outcome": "pass"}
+
+    def _check(self, item: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Checks one answer; returns {"passed", "output", "validators"}
+        """
+        text = item["text"]
+        validators = {}
+
+        #1. Competitor mention filters the whole answer
+        with span("answer_guard.competitor"):
+            result = self.competitor_validator.validate(text, {})
+        validators["competitor"] = self._outcome(result)
+        if isinstance(result, FailResult):
+            validators["competitor"]["outcome"] = "filter"
+            metrics.increment("answer_guard_checks_total", check="competitor", outcome="filter")
+            return {"passed": False, "output": None, "validators": validators}
+        metrics.increment("answer_guard_checks_total", check="competitor", outcome="pass")
+
+        #2. PII is masked rather than blocked
+        with span("answer_guard.pii"):
+            result = self.pii_validator.validate(text, {})
+        validators["pii"] = self._outcome(result)
+        if isinstance(result, FailResult) and result.fix_value is not None:
+            validators["pii"]["outcome"] = "fix"
+            text = result.fix_value
+        metrics.increment("answer_guard_checks_total", check="pii", outcome=validators["pii"]["outcome"])
+
+        #3. Provenance of whatever the client could not resolve locally
+        provenance_text = item.get("provenance_text")
+        if provenance_text:
+            with span("answer_guard.provenance"):
+                result = self.provenance_validator.validate(provenance_text, {"sources": item.get("sources", [])})
+            validators["provenance"] = self._outcome(result)
+        else:
+            validators["provenance"] = {"outcome": "skipped"}
+        metrics.increment("answer_guard_checks_total", check="provenance",
+                          outcome=validators["provenance"]["outcome"])
+
+        passed = all(v["outcome"] in ("pass", "fix", "skipped") for v in validators.values())
+        return {"passed": passed, "output": text, "validators": validators}
+
+    def _validate(
+            self,
+            value: str,
+            metadata: Optional[Dict[str, Any]] = None
+    ) -> ValidationResult:
+        """
+        Main validation method (sync)
+        """
+        items = json.loads(value)
+        return PassResult(value_override=json.dumps([self._check(item) for item in items]))
+
+    async def async_validate(
+            self,
+            value: str,
+            metadata: Optional[Dict[str, Any]] = None
+    ) -> ValidationResult:
+        """
+        Main validation method (async); the answers of a batch are checked
+        concurrency at a time in worker threads
+        """
+        items = json.loads(value)
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        async def _bounded(item):
+            async with semaphore:
+                return await asyncio.to_thread(self._check, item)
+
+        reports = await asyncio.gather(*(_bounded(item) for item in items))
+        return PassResult(value_override=json.dumps(list(reports)))
+
+@register_validator(name="prescreened_detect_pii", data_type="string")
+class PrescreenedDetectPII(DetectPII):
+    """
+    DetectPII that runs Presidio only on the sentences a cheap regex/word-list
+    pre-screen flags; text with no candidates passes without NER
+    """
+
+    def __init__(
+            self,
+            pii_entities: Optional[List[str]] = None,
+            prescreen: Optional[PIIPrescreen] = None,
+            analyzer=None,
+            anonymizer=None,
+            on_fail=None,
+            **kwargs
+    ):
+        """
+        Args:
+            pii_entities: Presidio entities to detect
+            prescreen: Candidate finder; defaults to a conservative PIIPrescreen
+            analyzer: Presidio AnalyzerEngine; the shared model_registry one
+                      (micro-batched with MICRO_BATCH) if None
+            anonymizer: Presidio AnonymizerEngine; the shared model_registry one if None
+            on_fail: As for DetectPII
+        """
+        # Not DetectPII.__init__: it would build (and load spaCy for) its own
+        # engines per instance. The rest of what it sets up is repeated here.
+        Validator.__init__(self, on_fail, pii_entities=pii_entities, **kwargs)
+        self.pii_entities = pii_entities
+        if analyzer is None:
+            analyzer = model_registry.batched_presidio_analyzer() if MICRO_BATCH else model_registry.presidio_analyzer()
+        self.pii_analyzer = analyzer
+        self.pii_anonymizer = anonymizer or model_registry.presidio_anonymizer()
+        self.prescreen = prescreen or PIIPrescreen(conservative=True)
+
+    def get_anonymized_text(self, text: str, entities: List[str]) -> str:
+        with span("pii.prescreen"):
+            spans = self.prescreen.candidate_spans(text, entities)
+        if not spans:
+            metrics.increment("pii_prescreen_total", result="skipped")
+            return text
+
+        metrics.increment("pii_prescreen_total", result="analyzed")
+        metrics.increment("pii_prescreen_chars_total", sum(end - start for start, end in spans), part="analyzed")
+        metrics.increment("pii_prescreen_chars_total", len(text), part="total")
+        pieces = []
+        last = 0
+        for start, end in spans:
+            pieces.append(text[last:start])
+            pieces.append(super().get_anonymized_text(text=text[start:end], entities=entities))
+            last = end
+        pieces.append(text[last:])
+        return "".join(pieces)
+
+
+@register_validator(name="competitor_alias_check", data_type="string")
+class CompetitorAliasCheck(Validator):
+    """
+    Competitor check driven by an alias table (names, IATA codes, alliances).
+    Aliases are matched with one compiled regex; spaCy NER only runs on
+    sentences whose only mentions are ambiguous. The fix value is the text
+    with the offending sentences removed, as with CompetitorCheck.
+    """
+
+    def __init__(
+            self,
+            alias_table: Optional[Dict[str, Dict[str, List[str]]]] = None,
+            spacy_model: str = "en_core_web_trf",
+            batched_ner: bool = False,
+            **kwargs
+    ):
+        """
+        Args:
+            alias_table: competitor -> {"aliases", "codes", "ambiguous"};
+                         competitor_matcher.DEFAULT_ALIAS_TABLE if None
+            spacy_model: NER model confirming ambiguous mentions
+            batched_ner: Micro-batch NER calls across concurrent validations
+        """
+        self.matcher = CompetitorMatcher(alias_table, spacy_model=spacy_model, batched_ner=batched_ner)
+        super().__init__(**kwargs)
+
+    def _validate(
+            self,
+            value: str,
+            metadata: Optional[Dict[str, Any]] = None
+    ) -> ValidationResult:
+        with span("competitor.match"):
+            filtered, competitors = self.matcher.filter(value)
+        if not competitors:
+            metrics.increment("competitor_checks_total", result="pass")
+            return PassResult()
+
+        metrics.increment("competitor_checks_total", result="filter")
+        return FailResult(
+            error_message=f"Found the following competitors: {competitors}. Please avoid naming those competitors next time",
+            fix_value=filtered,
+        )
+
+
+# hallucination_guard = AsyncGuard(name="hallucination_guard").use(ProvenanceLLM, validation_method="full", llm_callable='gpt-4o-mini', on_fail=OnFailAction.EXCEPTION)
+provenance_validator = ProvenanceLLM(
+    validation_method="sentence", llm_callable='gpt-4o-mini', on_fail=OnFailAction.EXCEPTION)
+hallucination_guard = AsyncGuard(name="hallucination_guard").use(provenance_validator)
+
+
+# Presidio only sees sentences with phone-like or name-like tokens. The default
+# conservative mode also sends sentence-initial capitalised words, long digit
+# runs and words after "my name is"/"I am"; PII_PRESCREEN_MODE=fast skips those.
+pii_prescreen = PIIPrescreen(conservative=os.getenv("PII_PRESCREEN_MODE", "conservative") == "conservative")
+output_pii_validator = PrescreenedDetectPII(
+    pii_entities=['PERSON', 'PHONE_NUMBER'],
+    prescreen=pii_prescreen,
+    on_fail="fix"
+)
 pii_guard = AsyncGuard(name="pii_guard").use(
-    DetectPII(
+    PrescreenedDetectPII(
         pii_entities=['PERSON', 'PHONE_NUMBER',],
+        prescreen=pii_prescreen,
         # on_fail="exception" #on_fail="refrain"
         # on_fail=OnFailAction.EXCEPTION
         on_fail=OnFailAction.FIX
     ),
     on="messages"
 ).use(
-    DetectPII(
-        pii_entities=['PERSON', 'PHONE_NUMBER'],
-        on_fail="fix"
-    ),
+    output_pii_validator,
     on="output"
 )
 
 
-def llm_callable(text: str, topics: list) -> str:
-    """LLM callable for custom topic guard"""
+def topic_classification_request(text: str, topics: list) -> dict:
+    """Chat completion arguments shared by llm_callable and async_llm_callable"""
     topics_str = ", ".join(topics)
 
-    response = openai_client.chat.completions.create(
+    return dict(
         model="gpt-3.5-turbo",
         messages=[
             {
@@ -203,6 +558,16 @@ def llm_callable(text: str, topics: list) -> str:
         temperature=0.1
     )
 
+def llm_callable(text: str, topics: list) -> str:
+    """LLM callable for custom topic guard"""
+    response = openai_client.chat.completions.create(**topic_classification_request(text, topics))
+
+    return response.choices[0].message.content.strip()
+
+async def async_llm_callable(text: str, topics: list) -> str:
+    """Async LLM callable for custom topic guard"""
+    response = await async_openai_client.chat.completions.create(**topic_classification_request(text, topics))
+
     return response.choices[0].message.content.strip()
 
 # def llm_callable(text: str, topics: list) -> str:
@@ -268,6 +633,26 @@ def llm_callable(text: str, topics: list) -> str:
 #     return result
 
 
+# Example phrasings embedded alongside the topic names for the semantic classifier
+TOPIC_EXAMPLES = {
+    "baggage allowance": ["how much luggage can I take", "what is the weight limit for my bags"],
+    "check in": ["what time should I arrive at the airport", "how do I check in online"],
+    "refund": ["i want my money back", "can I cancel and get reimbursed"],
+    "ticket change": ["can I change my flight date", "rebook my flight"],
+    "seat selection": ["can I choose where I sit", "I want a window seat"],
+    "inflight meals": ["what food is served on board", "can I request a vegetarian meal"],
+    "krisflyer": ["how do I earn miles", "frequent flyer points"],
+    "school homework": ["solve this maths problem for me", "write my essay"],
+    "coding": ["fix my python code", "how do I write a for loop"],
+}
+# Memoizes LLM topic labels; set TOPIC_CACHE_PATH="" to keep them in memory only
+topic_classification_cache = ClassificationCache(
+    max_entries=10000,
+    ttl=7 * 24 * 3600,
+    persist_path=os.getenv("TOPIC_CACHE_PATH", "topic_cache.sqlite3") or None,
+)
+metrics.register_gauges("topic_classification_cache", topic_classification_cache.stats)
+
 topic_guard = AsyncGuard(
     name="topic_guard",
    ).use(
@@ -306,6 +691,15 @@ topic_guard = AsyncGuard(
             "history"
         ],
         llm_callable=llm_callable,
+        # Off, as before the semantic classifier: True sends its ambiguous band to the LLM
+        use_llm=False,
+        use_semantic=True,
+        topic_examples=TOPIC_EXAMPLES,
+        classification_cache=topic_classification_cache,
+        async_llm_callable=async_llm_callable,
+        llm_concurrency=16,
+        llm_timeout=10.0,
+        semantic_embedding_function=model_registry.batched_embedding_function() if MICRO_BATCH else None,
         # llm_model="gpt-3.5-turbo",
         # disable_classifier=False,
         # disable_llm=True,
@@ -317,9 +711,37 @@ topic_guard = AsyncGuard(
 )
 
 
-competitor_guard = AsyncGuard(name="competitor_guard").use(CompetitorCheck(
-    competitors=["Emirates"],
+# Carriers, aliases and codes to filter; COMPETITOR_ALIASES_PATH points to a JSON table
+# in the competitor_matcher.DEFAULT_ALIAS_TABLE format to replace the built-in one
+competitor_validator = CompetitorAliasCheck(
+    alias_table=load_alias_table(os.environ["COMPETITOR_ALIASES_PATH"])
+    if os.getenv("COMPETITOR_ALIASES_PATH") else None,
+    batched_ner=MICRO_BATCH,
     on_fail=OnFailAction.FILTER
     )
+competitor_guard = AsyncGuard(name="competitor_guard").use(competitor_validator)
+
+
+# PII, competitor and provenance checks for one or many answers in one round trip
+answer_guard = AsyncGuard(name="answer_guard").use(
+    CompositeAnswerGuard(
+        pii_validator=output_pii_validator,
+        competitor_validator=competitor_validator,
+        provenance_validator=provenance_validator,
+        concurrency=8,
+        on_fail=OnFailAction.EXCEPTION
+    )
 )
 
+
+# Export server-side metrics, e.g. METRICS_EXPORT_PATH=/var/lib/node_exporter/guardrails.prom
+if os.getenv("METRICS_EXPORT_PATH"):
+    start_exporter(
+        os.environ["METRICS_EXPORT_PATH"],
+        interval=float(os.getenv("METRICS_EXPORT_INTERVAL", "15")),
+        fmt=os.getenv("METRICS_EXPORT_FORMAT", "prometheus"),
+    )
+
+# Load models before the first request, e.g. MODEL_WARMUP=embedding,presidio,spacy:en_core_web_trf
+if os.getenv("MODEL_WARMUP"):
+    model_registry.warm_up(os.environ["MODEL_WARMUP"].split(","))
@@ -0,0 +1,160 @@
+# context_packing.py
+import re
+from typing import Callable, List, Optional
+
+try:
+    import tiktoken
+except ImportError:
+    tiktoken = None
+
+from telemetry import get_logger
+from text_utils import sentence_spans
+
+logger = get_logger(__name__)
+
+# Fits k=5 chunks of up to 256 tokens once overlaps and duplicates are removed
+DEFAULT_TOKEN_BUDGET = 1024
+
+_encoding = None
+_encoding_failed = False
+
+
+def count_tokens(text: str) -> int:
+    """
+    Token count with the gpt-3.5/4 tokenizer (tiktoken, cached locally after the
+    first load), or ~4 characters per token when it is unavailable
+    """
+    global _encoding, _encoding_failed
+    if _encoding is None and tiktoken is not None and not _encoding_failed:
+        try:
+            _encoding = tiktoken.get_encoding("cl100k_base")
+        except Exception as e:
+            logger.warning("tiktoken encoding unavailable, approximating token counts: %s", e)
+            _encoding_failed = True
+    if _encoding is None:
+        return max(1, len(text) // 4)
+    return len(_encoding.encode(text))
+
+
+def format_passage(doc: str, meta: dict) -> str:
+    """
+    A passage as rag.py puts it into the prompt
+    """
+    return f"[Source: {meta.get('source', 'unknown')}] {doc}"
+
+
+def _truncate(doc: str, meta: dict, budget: int, count: Callable[[str], int]) -> Optional[str]:
+    # The leading whole sentences of doc that fit budget with their source prefix, or None
+    fitting = None
+    for _, end in sentence_spans(doc):
+        if count(format_passage(doc[:end], meta)) > budget:
+            break
+        fitting = doc[:end]
+    return fitting
+
+
+def _merge_overlap(a: str, b: str, min_overlap: int = 5, max_overlap: int = 400) -> str:
+    # Drop the longest suffix of a that b starts with (the ingest chunk overlap)
+    for k in range(min(len(a), len(b), max_overlap), min_overlap - 1, -1):
+        if a.endswith(b[:k]):
+            return a + b[k:]
+    return a + "\n" + b
+
+
+def _words(text: str) -> set:
+    return set(re.findall(r"\w+", text.lower()))
+
+
+def _normalized(text: str) -> str:
+    return " ".join(re.findall(r"\w+", text.lower()))
+
+
+class _Passage:
+    def __init__(self, doc, meta, rank):
+        self.doc = doc
+        self.meta = dict(meta or {})
+        self.rank = rank
+
+
+def pack_context(
+        retrieved,
+        token_budget: Optional[int] = DEFAULT_TOKEN_BUDGET,
+        count: Callable[[str], int] = count_tokens,
+        near_duplicate_threshold: float = 0.9,
+) -> List[tuple]:
+    """
+    Assemble retrieved chunks into a compact prompt context.
+
+    1. Merge chunks that are adjacent in the same source (consecutive chunk_index),
+       removing the overlap the splitter added between them.
+    2. Drop passages that are contained in, or near-duplicates of (word Jaccard
+       >= near_duplicate_threshold), a better-ranked passage.
+    3. Rank by position in retrieved (a merged run takes its best chunk's
+       position). Not by distance: hybrid fusion and reranking already put the
+       best first, and chunks found only by BM25 have no distance.
+    4. Greedily keep passages that fit the token budget, counting the
+       "[Source: ...]" prefix rag.py adds; a passage that does not fit is cut
+       to the leading sentences that do (and marked "truncated").
+
+    Args:
+        retrieved: (document, metadata, ...) tuples, best first; further fields are ignored
+        token_budget: Maximum tokens of context, None for no limit
+        count: Token counter
+    Returns:
+        (document, metadata) tuples, best first
+    """
+    passages = []
+    for rank, item in enumerate(retrieved):
+        passages.append(_Passage(item[0], item[1], rank))
+
+    # 1. Merge runs of adjacent chunks from the same source
+    merged = [p for p in passages if "chunk_index" not in p.meta or "source" not in p.meta]
+    indexed = sorted((p for p in passages if p not in merged),
+                     key=lambda p: (str(p.meta["source"]), p.meta["chunk_index"]))
+    run = None
+    for p in indexed:
+        if (run is not None and run.meta["source"] == p.meta["source"]
+                and p.meta["chunk_index"] == run.last_index + 1):
+            run.doc = _merge_overlap(run.doc, p.doc)
+            run.last_index = p.meta["chunk_index"]
+            run.rank = min(run.rank, p.rank)
+        else:
+            run = p
+            run.last_index = p.meta["chunk_index"]
+            merged.append(run)
+
+    # 2./3. Rank, then drop anything a better passage already covers
+    kept = []
+    for p in sorted(merged, key=lambda p: p.rank):
+        norm, words = _normalized(p.doc), _words(p.doc)
+        duplicate = False
+        for q in kept:
+            if norm in q.norm:
+                duplicate = True
+                break
+            union = words | q.words
+            if union and len(words & q.words) / len(union) >= near_duplicate_threshold:
+                duplicate = True
+                break
+        if not duplicate:
+            p.norm, p.words = norm, words
+            kept.append(p)
+
+    # 4. Pack into the token budget
+    packed = []
+    used = 0
+    for p in kept:
+        doc, meta = p.doc, p.meta
+        tokens = count(format_passage(doc, meta))
+        if token_budget is not None and used + tokens > token_budget:
+            doc = _truncate(doc, meta, token_budget - used, count)
+            if doc is None:
+                continue
+            tokens = count(format_passage(doc, meta))
+            meta["truncated"] = True
+        used += tokens
+        if getattr(p, "last_index", None) not in (None, meta.get("chunk_index")):
+            # Merged passage covers chunk_index..last_chunk_index
+            meta["last_chunk_index"] = p.last_index
+        packed.append((doc, meta))
+    return packed
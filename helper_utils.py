@@ -5,6 +5,8 @@ import numpy as np
 from pypdf import PdfReader
 from tqdm import tqdm
 
+import model_registry
+
 
 def _read_pdf(filename):
     reader = PdfReader(filename)
@@ -33,7 +35,9 @@ def _chunk_texts(texts):
     return token_split_texts
 
 
-def load_chroma(filename, collection_name, embedding_function):
+def load_chroma(filename, collection_name, embedding_function=None):
+    if embedding_function is None:
+        embedding_function = model_registry.embedding_function()
     texts = _read_pdf(filename)
     chunks = _chunk_texts(texts)
 
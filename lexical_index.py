@@ -0,0 +1,137 @@
+# lexical_index.py
+import json
+import os
+import re
+import shutil
+from collections import Counter
+from typing import List, Tuple
+
+import numpy as np
+
+_TOKEN = re.compile(r"\w+")
+
+
+def tokenize(text: str) -> List[str]:
+    # Keeps exact terms like "krisflyer", fare codes and "30kg" intact
+    return _TOKEN.findall(text.lower())
+
+
+def index_path(db_path="vectorstore", collection_name="faq"):
+    return os.path.join(db_path, "bm25", collection_name)
+
+
+class BM25Index:
+    """
+    Okapi BM25 over the chunks of a collection, stored as flat NumPy arrays
+    (CSR-style postings per term) that are memory-mapped on load.
+    """
+
+    FILES = ("term_offsets.npy", "postings_docs.npy", "postings_tf.npy", "idf.npy", "doc_lengths.npy")
+
+    def __init__(self, vocab, ids, term_offsets, postings_docs, postings_tf, idf, doc_lengths,
+                 k1=1.5, b=0.75):
+        self.vocab = vocab
+        self.ids = ids
+        self.term_offsets = term_offsets
+        self.postings_docs = postings_docs
+        self.postings_tf = postings_tf
+        self.idf = idf
+        self.doc_lengths = doc_lengths
+        self.k1 = k1
+        self.b = b
+        self.avgdl = float(doc_lengths.mean()) if len(doc_lengths) else 0.0
+
+    @classmethod
+    def build(cls, ids: List[str], documents: List[str], k1=1.5, b=0.75) -> "BM25Index":
+        vocab = {}
+        postings = []  # term_id -> [(doc, tf), ...]
+        doc_lengths = np.zeros(len(documents), dtype=np.float32)
+        for doc_idx, text in enumerate(documents):
+            tokens = tokenize(text)
+            doc_lengths[doc_idx] = len(tokens)
+            for term, tf in Counter(tokens).items():
+                term_id = vocab.setdefault(term, len(vocab))
+                if term_id == len(postings):
+                    postings.append([])
+                postings[term_id].append((doc_idx, tf))
+
+        term_offsets = np.zeros(len(vocab) + 1, dtype=np.int64)
+        term_offsets[1:] = np.cumsum([len(p) for p in postings])
+        postings_docs = np.fromiter((d for p in postings for d, _ in p), dtype=np.int32,
+                                    count=int(term_offsets[-1]))
+        postings_tf = np.fromiter((tf for p in postings for _, tf in p), dtype=np.float32,
+                                  count=int(term_offsets[-1]))
+        n_docs = len(documents)
+        df = np.diff(term_offsets).astype(np.float32)
+        idf = np.log1p((n_docs - df + 0.5) / (df + 0.5)).astype(np.float32)
+        return cls(vocab, list(ids), term_offsets, postings_docs, postings_tf, idf, doc_lengths, k1, b)
+
+    def save(self, path):
+        """
+        Write the index to path, replacing any previous index there
+        """
+        tmp_path = path + ".tmp"
+        shutil.rmtree(tmp_path, ignore_errors=True)
+        os.makedirs(tmp_path)
+        for name, array in zip(self.FILES, (self.term_offsets, self.postings_docs, self.postings_tf,
+                                            self.idf, self.doc_lengths)):
+            np.save(os.path.join(tmp_path, name), array)
+        with open(os.path.join(tmp_path, "meta.json"), "w") as f:
+            json.dump({"k1": self.k1, "b": self.b, "vocab": self.vocab, "ids": self.ids}, f)
+
+        # Open readers keep their memory maps of the old files
+        old_path = path + ".old"
+        shutil.rmtree(old_path, ignore_errors=True)
+        if os.path.exists(path):
+            os.replace(path, old_path)
+        os.replace(tmp_path, path)
+        shutil.rmtree(old_path, ignore_errors=True)
+
+    @classmethod
+    def load(cls, path) -> "BM25Index":
+        with open(os.path.join(path, "meta.json")) as f:
+            meta = json.load(f)
+        arrays = [np.load(os.path.join(path, name), mmap_mode="r") for name in cls.FILES]
+        return cls(meta["vocab"], meta["ids"], *arrays, k1=meta["k1"], b=meta["b"])
+
+    def search(self, query: str, k: int = 20) -> List[Tuple[str, float]]:
+        """
+        Returns up to k (chunk id, score) pairs, best first
+        """
+        scores = np.zeros(len(self.ids), dtype=np.float32)
+        for term in set(tokenize(query)):
+            term_id = self.vocab.get(term)
+            if term_id is None:
+                continue
+            start, end = self.term_offsets[term_id], self.term_offsets[term_id + 1]
+            docs = self.postings_docs[start:end]
+            tf = self.postings_tf[start:end]
+            norm = self.k1 * (1 - self.b + self.b * self.doc_lengths[docs] / self.avgdl)
+            scores[docs] += self.idf[term_id] * tf * (self.k1 + 1) / (tf + norm)
+
+        hits = np.flatnonzero(scores)
+        if len(hits) > k:
+            hits = hits[np.argpartition(-scores[hits], k)[:k]]
+        hits = hits[np.argsort(-scores[hits], kind="stable")]
+        return [(self.ids[i], float(scores[i])) for i in hits]
+
+
+def build_lexical_index(collection, db_path="vectorstore", collection_name="faq"):
+    """
+    Rebuild the BM25 index for every chunk currently in the Chroma collection
+    """
+    chunks = collection.get(include=["documents"])
+    index = BM25Index.build(chunks["ids"], chunks["documents"])
+    index.save(index_path(db_path, collection_name))
+    return index
+
+
+def reciprocal_rank_fusion(rankings: List[List[str]], k: int = 60) -> List[str]:
+    """
+    Fuse ranked id lists: score(id) = sum over lists of 1 / (k + rank)
+    """
+    scores = {}
+    for ranking in rankings:
+        for rank, id_ in enumerate(ranking, start=1):
+            scores[id_] = scores.get(id_, 0.0) + 1.0 / (k + rank)
+    return sorted(scores, key=scores.get, reverse=True)
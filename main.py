@@ -1,21 +1,13 @@
-from retriever import retrieve
-from rag import rag
 import os
-from helper_utils import word_wrap
-import chromadb
-import requests
-from client_utils import (
-    validate_on_topic,
-    validate_hallucination,
-    validate_pii,
-    validate_competitor
-)
+from pipeline import guarded_answer
+from telemetry import configure_logging
 
 os.environ["LANGCHAIN_TRACING_V2"] = "true"
 os.environ["LANGCHAIN_ENDPOINT"] = "https://api.langchain.plus"
 
 
 if __name__ == "__main__":
+    configure_logging()
     # query = input("Ask your question:\n> ")
     # query = "can i carry wine bottles on SQ flights?" # topic guard: no valid topic matched 400: Your question doesn't match any supported Singapore Airlines topics. Please ask about: flight booking, baggage, refunds, check-in, etc.
     # query = "i need my money back, i wanna refund!" #legit
@@ -26,28 +18,5 @@ if __name__ == "__main__":
     # query = "What is the baggage allowance for Singapore Airlines?"
     # query = "I need to check in for my flight"
 
-    #1. On-topic guard
-    validate_on_topic(query)
-    # query = validate_pii(query)
-    #2. Retrieve documents
-    retrieved = retrieve(query)
-
-    # print("\n Retrieved Documents:")
-    # for doc, meta in retrieved:
-    #     print(f"- Source: {meta.get('source', 'unknown')}, Chunk: {meta.get('chunk_index', '?')}")
-    #     # print(f"  Text: {doc[:200]}...\n")  # show first 200 chars
-    #     print(word_wrap(doc))
-    #     print('')
-
-    # 3. Generate answer using RAG before guardrails
-    answer = rag(query, retrieved)
-    print("\n Answer from rag: ", answer)
-    # 4. Validate answer against guards
-    validate_hallucination(answer, retrieved)
-    validate_pii(answer)
-    validate_competitor(answer)
+    answer = guarded_answer(query)
     print("\n Answer after guardrails: ", answer)
-
-
-
-
@@ -0,0 +1,183 @@
+# micro_batch.py
+import asyncio
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import Callable, List, Sequence
+
+from telemetry import get_logger, metrics
+
+logger = get_logger(__name__)
+
+BATCH_SIZE_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128, 256)
+metrics.define_histogram("micro_batch_size", BATCH_SIZE_BUCKETS)
+
+_STOP = object()
+
+
+class MicroBatcher:
+    """
+    Collects single-item requests from many threads and runs them through a
+    batch function together.
+
+    A dispatcher thread takes the first waiting item, then gathers more for up
+    to max_wait_ms or until max_batch_size, calls batch_fn once on the whole
+    batch and hands each caller its own result (or the batch's exception).
+    While a batch runs, new requests queue up for the next one.
+    """
+
+    def __init__(self, batch_fn: Callable[[List], Sequence], max_batch_size: int = 32,
+                 max_wait_ms: float = 5.0, name: str = "batch"):
+        """
+        Args:
+            batch_fn: Maps a list of items to a list of results in the same order
+            max_batch_size: Most items per batch_fn call
+            max_wait_ms: Longest a request waits for others to join its batch
+            name: Label for the micro_batch_size histogram
+        """
+        self.batch_fn = batch_fn
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self.name = name
+        self._queue = queue.Queue()
+        self._thread = None
+        self._start_lock = threading.Lock()
+
+    def _ensure_started(self):
+        if self._thread is None:
+            with self._start_lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._run, name=f"micro-batch-{self.name}",
+                                                    daemon=True)
+                    self._thread.start()
+
+    def submit(self, item) -> Future:
+        self._ensure_started()
+        future = Future()
+        self._queue.put((item, future))
+        return future
+
+    def __call__(self, item):
+        return self.submit(item).result()
+
+    async def asubmit(self, item):
+        return await asyncio.wrap_future(self.submit(item))
+
+    def map(self, items) -> list:
+        futures = [self.submit(item) for item in items]
+        return [future.result() for future in futures]
+
+    def _run(self):
+        while True:
+            first = self._queue.get()
+            if first is _STOP:
+                return
+            batch = [first]
+            deadline = time.monotonic() + self.max_wait
+            while len(batch) < self.max_batch_size:
+                timeout = deadline - time.monotonic()
+                try:
+                    entry = self._queue.get(timeout=timeout) if timeout > 0 else self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if entry is _STOP:
+                    self._dispatch(batch)
+                    return
+                batch.append(entry)
+            self._dispatch(batch)
+
+    def _dispatch(self, batch):
+        batch = [(item, future) for item, future in batch if future.set_running_or_notify_cancel()]
+        if not batch:
+            return
+        metrics.observe("micro_batch_size", len(batch), batcher=self.name)
+        try:
+            results = self.batch_fn([item for item, _ in batch])
+            if len(results) != len(batch):
+                raise RuntimeError(f"{self.name}: batch_fn returned {len(results)} results for {len(batch)} items")
+        except BaseException as e:
+            logger.warning("Micro-batch %s of %d failed: %s", self.name, len(batch), e)
+            for _, future in batch:
+                future.set_exception(e)
+            return
+        for (_, future), result in zip(batch, results):
+            future.set_result(result)
+
+    def close(self):
+        if self._thread is not None:
+            self._queue.put(_STOP)
+            self._thread.join()
+            self._thread = None
+
+
+class BatchedEmbeddingFunction:
+    """
+    Chroma-style embedding function whose texts are embedded together with
+    those of concurrent callers
+    """
+
+    def __init__(self, embedding_function, **batcher_kwargs):
+        self.embedding_function = embedding_function
+        self.batcher = MicroBatcher(lambda texts: list(embedding_function(texts)),
+                                    name="embedding", **batcher_kwargs)
+
+    def __call__(self, input):
+        return self.batcher.map(input)
+
+
+class BatchedNLP:
+    """
+    Stands in for a spaCy Language: nlp(text) calls from concurrent threads run
+    as one nlp.pipe batch. Everything else is passed through.
+    """
+
+    def __init__(self, nlp, **batcher_kwargs):
+        self._nlp = nlp
+        self.batcher = MicroBatcher(lambda texts: list(nlp.pipe(texts, batch_size=len(texts))),
+                                    name="spacy", **batcher_kwargs)
+
+    def __call__(self, text, **kwargs):
+        if kwargs:
+            return self._nlp(text, **kwargs)
+        return self.batcher(text)
+
+    def __getattr__(self, name):
+        return getattr(self._nlp, name)
+
+
+class BatchedAnalyzer:
+    """
+    Stands in for a Presidio AnalyzerEngine: analyze() calls from concurrent
+    threads run through BatchAnalyzerEngine, so spaCy processes them as one
+    batch. Calls with extra analyze() options are passed through unbatched.
+    """
+
+    def __init__(self, analyzer, **batcher_kwargs):
+        from presidio_analyzer import BatchAnalyzerEngine
+        self._analyzer = analyzer
+        self._batch_engine = BatchAnalyzerEngine(analyzer_engine=analyzer)
+        self.batcher = MicroBatcher(self._analyze_batch, name="presidio", **batcher_kwargs)
+
+    def analyze(self, text, language, entities=None, **kwargs):
+        if kwargs:
+            return self._analyzer.analyze(text=text, language=language, entities=entities, **kwargs)
+        return self.batcher((text, language, tuple(entities) if entities else None))
+
+    def _analyze_batch(self, items):
+        # One BatchAnalyzerEngine pass per (language, entities) combination
+        groups = {}
+        for i, (_, language, entities) in enumerate(items):
+            groups.setdefault((language, entities), []).append(i)
+        results = [None] * len(items)
+        for (language, entities), indices in groups.items():
+            texts = [items[i][0] for i in indices]
+            analyzed = self._batch_engine.analyze_iterator(
+                texts, language=language, batch_size=len(texts),
+                entities=list(entities) if entities else None)
+            for i, result in zip(indices, analyzed):
+                results[i] = result
+        return results
+
+    def __getattr__(self, name):
+        return getattr(self._analyzer, name)
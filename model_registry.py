@@ -0,0 +1,178 @@
+# model_registry.py
+import os
+import threading
+import time
+from typing import Callable, Dict, Iterable, Optional
+
+from telemetry import get_logger, metrics
+
+logger = get_logger(__name__)
+
+EMBEDDING_MODEL = "all-MiniLM-L6-v2"
+CROSS_ENCODER_MODEL = "cross-encoder/ms-marco-MiniLM-L-6-v2"
+
+# "onnx": Chroma's ONNX build of all-MiniLM-L6-v2 (no torch import);
+# "onnxruntime" / "onnxruntime-int8": our own export of it (onnx_embedding.py),
+# float32 or dynamically quantized, without importing torch or chromadb;
+# "sentence-transformers": the same model through torch
+EMBEDDING_BACKEND = os.getenv("EMBEDDING_BACKEND", "onnx")
+
+# Micro-batching of concurrent model calls (see micro_batch.py)
+MICRO_BATCH_MAX_SIZE = int(os.getenv("MICRO_BATCH_MAX_SIZE", "32"))
+MICRO_BATCH_MAX_WAIT_MS = float(os.getenv("MICRO_BATCH_MAX_WAIT_MS", "5"))
+
+
+class ModelRegistry:
+    """
+    Process-wide cache of heavy models.
+
+    Each model is built by its factory on first use, exactly once even when
+    several threads ask for it at the same time, and then shared by every caller.
+    """
+
+    def __init__(self):
+        self._models = {}
+        self._key_locks = {}
+        self._lock = threading.Lock()
+        self.load_seconds = {}
+
+    def get(self, key, factory: Callable[[], object]):
+        model = self._models.get(key)
+        if model is not None:
+            return model
+        with self._lock:
+            key_lock = self._key_locks.setdefault(key, threading.Lock())
+        # Per-key lock: loading one model does not block lookups of the others
+        with key_lock:
+            model = self._models.get(key)
+            if model is None:
+                start = time.perf_counter()
+                model = factory()
+                duration = time.perf_counter() - start
+                self._models[key] = model
+                self.load_seconds[key] = duration
+                metrics.observe("model_load_seconds", duration, model=str(key))
+                logger.info("Loaded model %s in %.2fs", key, duration)
+        return model
+
+    def loaded(self):
+        return list(self._models)
+
+    def stats(self):
+        return {
+            "models": len(self._models),
+            "load_seconds_total": sum(self.load_seconds.values()),
+        }
+
+
+registry = ModelRegistry()
+
+
+def embedding_function(model_name: str = EMBEDDING_MODEL, backend: Optional[str] = None):
+    """
+    Shared Chroma-compatible embedding function (texts -> vectors)
+    """
+    backend = backend or EMBEDDING_BACKEND
+
+    def _load():
+        if backend == "onnx":
+            if model_name != EMBEDDING_MODEL:
+                raise ValueError(f"The onnx backend only provides {EMBEDDING_MODEL}")
+            from chromadb.utils.embedding_functions import DefaultEmbeddingFunction
+            return DefaultEmbeddingFunction()
+        if backend in ("onnxruntime", "onnxruntime-int8"):
+            if model_name != EMBEDDING_MODEL:
+                raise ValueError(f"The {backend} backend only provides {EMBEDDING_MODEL}")
+            from onnx_embedding import OnnxEmbedder
+            return OnnxEmbedder(quantized=backend == "onnxruntime-int8")
+        if backend == "sentence-transformers":
+            from chromadb.utils.embedding_functions import SentenceTransformerEmbeddingFunction
+            return SentenceTransformerEmbeddingFunction(model_name=model_name, device="cpu")
+        raise ValueError(f"Unknown embedding backend {backend!r}")
+
+    return registry.get(("embedding", backend, model_name), _load)
+
+
+def cross_encoder(model_name: str = CROSS_ENCODER_MODEL):
+    def _load():
+        from sentence_transformers import CrossEncoder
+        return CrossEncoder(model_name, device="cpu")
+
+    return registry.get(("cross_encoder", model_name), _load)
+
+
+def spacy_model(name: str):
+    def _load():
+        import spacy
+        return spacy.load(name)
+
+    return registry.get(("spacy", name), _load)
+
+
+def presidio_analyzer():
+    def _load():
+        from presidio_analyzer import AnalyzerEngine
+        return AnalyzerEngine()
+
+    return registry.get(("presidio", "analyzer"), _load)
+
+
+def presidio_anonymizer():
+    def _load():
+        from presidio_anonymizer import AnonymizerEngine
+        return AnonymizerEngine()
+
+    return registry.get(("presidio", "anonymizer"), _load)
+
+
+def _batcher_kwargs():
+    return {"max_batch_size": MICRO_BATCH_MAX_SIZE, "max_wait_ms": MICRO_BATCH_MAX_WAIT_MS}
+
+
+def batched_embedding_function(model_name: str = EMBEDDING_MODEL, backend: Optional[str] = None):
+    """
+    Shared embedding function that micro-batches concurrent callers
+    """
+    from micro_batch import BatchedEmbeddingFunction
+    backend = backend or EMBEDDING_BACKEND
+    return registry.get(("batched_embedding", backend, model_name), lambda: BatchedEmbeddingFunction(
+        embedding_function(model_name, backend), **_batcher_kwargs()))
+
+
+def batched_spacy_model(name: str):
+    from micro_batch import BatchedNLP
+    return registry.get(("batched_spacy", name), lambda: BatchedNLP(spacy_model(name), **_batcher_kwargs()))
+
+
+def batched_presidio_analyzer():
+    from micro_batch import BatchedAnalyzer
+    return registry.get(("batched_presidio", "analyzer"),
+                        lambda: BatchedAnalyzer(presidio_analyzer(), **_batcher_kwargs()))
+
+
+# Names accepted by warm_up / MODEL_WARMUP
+_WARMERS: Dict[str, Callable[[], object]] = {
+    "embedding": lambda: embedding_function()(["warm up"]),
+    "cross_encoder": lambda: cross_encoder().predict([("warm up", "warm up")]),
+    "presidio": lambda: presidio_analyzer().analyze(text="warm up", language="en"),
+}
+
+
+def warm_up(names: Iterable[str]):
+    """
+    Load models (and run one tiny inference) before the first request,
+    e.g. MODEL_WARMUP=embedding,presidio,spacy:en_core_web_trf
+    """
+    for name in names:
+        name = name.strip()
+        if not name:
+            continue
+        start = time.perf_counter()
+        if name.startswith("spacy:"):
+            spacy_model(name.split(":", 1)[1])("warm up")
+        elif name in _WARMERS:
+            _WARMERS[name]()
+        else:
+            logger.warning("Unknown model %r in warm-up list", name)
+            continue
+        logger.info("Warmed up %s in %.2fs", name, time.perf_counter() - start)
@@ -0,0 +1,270 @@
+# onnx_embedding.py
+import argparse
+import os
+import threading
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from telemetry import configure_logging, get_logger
+
+logger = get_logger(__name__)
+
+HF_MODEL = "sentence-transformers/all-MiniLM-L6-v2"
+DEFAULT_MODEL_DIR = os.getenv("ONNX_EMBEDDING_DIR", os.path.join("models", "all-MiniLM-L6-v2-onnx"))
+MODEL_FILE = "model.onnx"
+QUANTIZED_MODEL_FILE = "model.int8.onnx"
+TOKENIZER_FILE = "tokenizer.json"
+
+# sentence-transformers truncates this model at 256 tokens
+MAX_LENGTH = 256
+# 0 lets onnxruntime use every physical core; with several workers per node
+# set it to cores / workers
+INTRA_OP_THREADS = int(os.getenv("ONNX_INTRA_OP_THREADS", "0"))
+
+SAMPLE_TEXTS = [
+    "What is the baggage allowance for Economy Class?",
+    "Online check-in opens 48 hours before departure and closes 90 minutes before departure.",
+    "Refunds for unused tickets can be requested through Manage Booking.",
+    "KrisFlyer miles can be redeemed for upgrades on Singapore Airlines flights.",
+    "help me with the coding homework?",
+    "Passengers travelling with infants may bring a collapsible stroller to the aircraft door.",
+]
+
+
+def export_onnx(output_dir: str = DEFAULT_MODEL_DIR, model_name: str = HF_MODEL, opset: int = 14) -> str:
+    """
+    Export the transformer of model_name (without the pooling, which
+    OnnxEmbedder does in NumPy) and its fast tokenizer to output_dir.
+    Needs torch and transformers, at export time only.
+    """
+    import torch
+    from transformers import AutoModel, AutoTokenizer
+
+    os.makedirs(output_dir, exist_ok=True)
+    tokenizer = AutoTokenizer.from_pretrained(model_name)
+    model = AutoModel.from_pretrained(model_name).eval()
+    sample = tokenizer(SAMPLE_TEXTS[:2], padding=True, return_tensors="pt")
+    input_names = ["input_ids", "attention_mask", "token_type_ids"]
+    dynamic = {0: "batch", 1: "sequence"}
+    path = os.path.join(output_dir, MODEL_FILE)
+    with torch.no_grad():
+        torch.onnx.export(model, tuple(sample[name] for name in input_names), path,
+                          input_names=input_names, output_names=["last_hidden_state"],
+                          dynamic_axes={name: dynamic for name in input_names + ["last_hidden_state"]},
+                          opset_version=opset)
+    # Writes tokenizer.json, which the tokenizers package loads without transformers
+    tokenizer.save_pretrained(output_dir)
+    logger.info("Exported %s to %s", model_name, path)
+    return path
+
+
+def quantize_onnx(model_dir: str = DEFAULT_MODEL_DIR) -> str:
+    """
+    Dynamic int8 quantization of the exported model: weights are stored as
+    int8, activations are quantized on the fly. Needs the onnx package.
+    """
+    from onnxruntime.quantization import QuantType, quantize_dynamic
+
+    path = os.path.join(model_dir, QUANTIZED_MODEL_FILE)
+    quantize_dynamic(os.path.join(model_dir, MODEL_FILE), path, weight_type=QuantType.QInt8)
+    logger.info("Quantized %s", path)
+    return path
+
+
+def mean_pool(last_hidden_state: np.ndarray, attention_mask: np.ndarray, normalize: bool = True) -> np.ndarray:
+    """
+    sentence-transformers' pooling for this model: mean over the real tokens,
+    then L2 normalization
+    """
+    mask = attention_mask[:, :, None].astype(np.float32)
+    summed = (last_hidden_state * mask).sum(axis=1)
+    pooled = summed / np.clip(mask.sum(axis=1), 1e-9, None)
+    if normalize:
+        pooled /= np.clip(np.linalg.norm(pooled, axis=1, keepdims=True), 1e-12, None)
+    return pooled.astype(np.float32)
+
+
+class OnnxEmbedder:
+    """
+    all-MiniLM-L6-v2 on onnxruntime, without torch or sentence-transformers.
+
+    Texts are tokenized with the tokenizers package and padded only to the
+    longest text in each batch, so a single short query runs on a handful of
+    tokens. The session is created on first use.
+    """
+
+    def __init__(self, model_dir: str = DEFAULT_MODEL_DIR, quantized: bool = False,
+                 intra_op_threads: int = INTRA_OP_THREADS, max_length: int = MAX_LENGTH,
+                 batch_size: int = 32):
+        """
+        Args:
+            model_dir: Directory written by export_onnx (and quantize_onnx)
+            quantized: Use the int8 model instead of the float32 one
+            intra_op_threads: Threads per inference; 0 for onnxruntime's default
+            max_length: Tokens per text before truncation
+            batch_size: Texts per inference call
+        """
+        self.model_dir = model_dir
+        self.quantized = quantized
+        self.intra_op_threads = intra_op_threads
+        self.max_length = max_length
+        self.batch_size = batch_size
+        self._session = None
+        self._tokenizer = None
+        self._input_names = None
+        self._lock = threading.Lock()
+
+    @property
+    def model_path(self):
+        return os.path.join(self.model_dir, QUANTIZED_MODEL_FILE if self.quantized else MODEL_FILE)
+
+    def _load(self):
+        import onnxruntime as ort
+        from tokenizers import Tokenizer
+
+        if not os.path.exists(self.model_path):
+            flag = " --quantize" if self.quantized else ""
+            raise FileNotFoundError(f"No ONNX model at {self.model_path}; run "
+                                    f"python onnx_embedding.py export --output {self.model_dir}{flag}")
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        options.execution_mode = ort.ExecutionMode.ORT_SEQUENTIAL
+        options.intra_op_num_threads = self.intra_op_threads
+        # Concurrent requests already run in parallel; one inter-op thread each
+        options.inter_op_num_threads = 1
+        options.log_severity_level = 3
+        session = ort.InferenceSession(self.model_path, options, providers=["CPUExecutionProvider"])
+
+        tokenizer = Tokenizer.from_file(os.path.join(self.model_dir, TOKENIZER_FILE))
+        tokenizer.enable_truncation(max_length=self.max_length)
+        pad_id = tokenizer.token_to_id("[PAD]") or 0
+        tokenizer.enable_padding(pad_id=pad_id, pad_token="[PAD]")  # to the longest text in the batch
+
+        self._input_names = {i.name for i in session.get_inputs()}
+        self._tokenizer = tokenizer
+        self._session = session
+
+    def _ensure_loaded(self):
+        if self._session is None:
+            with self._lock:
+                if self._session is None:
+                    self._load()
+
+    def embed(self, texts: List[str]) -> np.ndarray:
+        """
+        Returns a (len(texts), 384) float32 array of normalized embeddings
+        """
+        self._ensure_loaded()
+        batches = []
+        for start in range(0, len(texts), self.batch_size):
+            encoded = self._tokenizer.encode_batch(list(texts[start:start + self.batch_size]))
+            input_ids = np.array([e.ids for e in encoded], dtype=np.int64)
+            attention_mask = np.array([e.attention_mask for e in encoded], dtype=np.int64)
+            feed = {"input_ids": input_ids, "attention_mask": attention_mask,
+                    "token_type_ids": np.zeros_like(input_ids)}
+            outputs = self._session.run(None, {name: feed[name] for name in self._input_names})
+            batches.append(mean_pool(outputs[0], attention_mask))
+        if not batches:
+            return np.zeros((0, 384), dtype=np.float32)
+        return np.concatenate(batches)
+
+    def __call__(self, input: List[str]) -> List[np.ndarray]:
+        # Same call signature and return type as a Chroma embedding function
+        return list(self.embed(input))
+
+    def config(self) -> Dict[str, object]:
+        return {"model_dir": self.model_dir, "quantized": self.quantized,
+                "intra_op_threads": self.intra_op_threads, "max_length": self.max_length,
+                "batch_size": self.batch_size}
+
+
+_chroma_class = None
+
+
+def _make_chroma_class():
+    # Importing chromadb takes seconds; only done when the class is asked for
+    from chromadb.api.types import EmbeddingFunction
+    from chromadb.utils.embedding_functions import register_embedding_function
+
+    @register_embedding_function
+    class OnnxEmbeddingFunction(EmbeddingFunction):
+        """
+        Chroma embedding function backed by OnnxEmbedder. Its vectors match the
+        sentence-transformers all-MiniLM-L6-v2 ones, so it can query (and add to)
+        collections built with either.
+        """
+
+        def __init__(self, model_dir: str = DEFAULT_MODEL_DIR, quantized: bool = False,
+                     intra_op_threads: int = INTRA_OP_THREADS, max_length: int = MAX_LENGTH,
+                     batch_size: int = 32, embedder: Optional[OnnxEmbedder] = None):
+            self.embedder = embedder or OnnxEmbedder(model_dir, quantized, intra_op_threads, max_length,
+                                                     batch_size)
+
+        def __call__(self, input):
+            return list(self.embedder.embed(input))
+
+        @staticmethod
+        def name() -> str:
+            return "onnxruntime_minilm"
+
+        def get_config(self):
+            return self.embedder.config()
+
+        @staticmethod
+        def build_from_config(config):
+            return OnnxEmbeddingFunction(**config)
+
+    return OnnxEmbeddingFunction
+
+
+def __getattr__(name):
+    # onnx_embedding.OnnxEmbeddingFunction is created on first access
+    global _chroma_class
+    if name == "OnnxEmbeddingFunction":
+        if _chroma_class is None:
+            _chroma_class = _make_chroma_class()
+        return _chroma_class
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def check_accuracy(embedder: OnnxEmbedder, texts: List[str] = SAMPLE_TEXTS, model_name: str = HF_MODEL):
+    """
+    Cosine similarity between embedder's vectors and sentence-transformers'
+    (torch) ones for the same texts, and whether both rank the texts in the
+    same order against the first one. Needs sentence-transformers.
+    """
+    from sentence_transformers import SentenceTransformer
+
+    reference = SentenceTransformer(model_name, device="cpu").encode(texts, normalize_embeddings=True)
+    candidate = embedder.embed(texts)
+    cosine = (reference * candidate).sum(axis=1)
+    same_ranking = bool(np.array_equal(np.argsort(-(reference @ reference[0])),
+                                       np.argsort(-(candidate @ candidate[0]))))
+    return {"min_cosine": float(cosine.min()), "mean_cosine": float(cosine.mean()),
+            "max_abs_diff": float(np.abs(reference - candidate).max()), "same_ranking": same_ranking}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export all-MiniLM-L6-v2 to ONNX and check it against torch")
+    sub = parser.add_subparsers(dest="command", required=True)
+    export = sub.add_parser("export", help="Export (and optionally quantize) the model")
+    export.add_argument("--output", default=DEFAULT_MODEL_DIR)
+    export.add_argument("--quantize", action="store_true", help="Also write the dynamic int8 model")
+    check = sub.add_parser("check", help="Compare the ONNX embeddings with sentence-transformers'")
+    check.add_argument("--model-dir", default=DEFAULT_MODEL_DIR)
+    check.add_argument("--quantized", action="store_true")
+    args = parser.parse_args()
+    configure_logging()
+
+    if args.command == "export":
+        print(export_onnx(args.output))
+        if args.quantize:
+            print(quantize_onnx(args.output))
+    else:
+        result = check_accuracy(OnnxEmbedder(args.model_dir, quantized=args.quantized))
+        print(result)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,137 @@
+# pii_prescreen.py
+import re
+from typing import Iterable, List, Optional, Sequence, Tuple
+
+from text_utils import sentence_spans
+from topic_matcher import build_trie_pattern
+
+# Entities the pre-screen can rule out; with any other entity requested the whole text is analyzed
+SUPPORTED_ENTITIES = {"PERSON", "PHONE_NUMBER"}
+
+PHONE_PATTERNS = (
+    r"\+\d{1,3}[\s.-]?\(?\d{1,4}\)?(?:[\s.-]?\d{2,5}){1,4}",  # international, e.g. +65 6223 8888
+    r"\(?\b\d{3}\)?[\s.-]?\d{3}[\s.-]?\d{4}\b",  # North American
+    r"\b[3689]\d{3}[\s-]?\d{4}\b",  # Singapore
+)
+# Conservative mode: any run of 7+ digits, allowing separators in between
+_DIGIT_RUN = r"\d(?:[\s().-]{0,2}\d){6,}"
+
+_PHONE = re.compile("|".join(f"(?:{p})" for p in PHONE_PATTERNS))
+_PHONE_CONSERVATIVE = re.compile("|".join(f"(?:{p})" for p in PHONE_PATTERNS + (_DIGIT_RUN,)))
+_CAPITALISED = re.compile(r"\b[A-Z][\w'’-]*")
+
+# Capitalised words that are never names, even at the start of a sentence
+# (so not "May" or "Will")
+COMMON_WORDS = frozenset("""
+A About After All Also An And Any Are As At Be Before But By Can Do Does Each For From He Her His
+How However I If In Is It Its Most My No Not Note Of On Once Only Or Our Please She So Some
+That The Their There These They This Those To We What When Where Which While Who Why With
+Without Yes You Your
+""".split())
+
+# Conservative mode: the word after one of these is a name unless it is a
+# known non-name word, whatever its case ("my name is rahul")
+_NAME_CUE = re.compile(r"\b(?:my name is|name is|name's|call me|this is|i am|i'm|i’m|im)\s+([^\W\d_][\w'’-]*)",
+                       re.IGNORECASE)
+# Lower-case words that commonly follow a cue phrase
+NON_NAME_WORDS = frozenset("""
+a an the not no so very just also still here there now later back from in on at with for to about
+going travelling traveling flying looking trying planning wondering calling writing asking booking
+sure able unable interested unhappy happy glad sorry afraid late early waiting checking done
+member passenger customer
+""".split()) | frozenset(word.lower() for word in COMMON_WORDS)
+
+# Capitalised FAQ vocabulary that is never a name
+DOMAIN_TERMS = frozenset("""
+Singapore Airlines SIA SQ Scoot KrisFlyer KrisShop KrisWorld PPS Club Elite Gold Silver Economy
+Premium Business First Suites Class Changi Airport Terminal Manage Booking Check Online Mobile
+App Baggage Refund Refunds Passengers Passenger Star Alliance Lounge SilverKris
+""".split())
+
+# Common given names and surnames, matched case-insensitively ("my name is john tan")
+DEFAULT_NAME_GAZETTEER = (
+    "ahmad", "aisha", "ali", "anna", "chen", "chan", "david", "fatimah", "goh", "hassan", "james",
+    "john", "kumar", "lee", "li", "lim", "maria", "mary", "michael", "mohamed", "muhammad", "ng",
+    "nur", "ong", "peter", "priya", "raj", "sarah", "siti", "tan", "teo", "wang", "wei", "wong",
+)
+
+
+def load_gazetteer(path: str) -> List[str]:
+    """
+    One name per line; blank lines and # comments are ignored
+    """
+    with open(path, encoding="utf-8") as f:
+        return [line.strip() for line in f if line.strip() and not line.startswith("#")]
+
+
+class PIIPrescreen:
+    """
+    Cheap regex and word-list screen in front of the Presidio analyzer.
+
+    A sentence is a candidate when it contains something phone-like (PHONE_NUMBER),
+    a gazetteer name, or a capitalised word that is not a common word (PERSON).
+    Only candidate sentences need NER; text without any can skip it entirely.
+
+    conservative=True trades skip rate for recall: sentence-initial capitalised
+    words count as candidates too, and so does any run of seven or more digits
+    and any word after a cue phrase such as "my name is" or "I am" that is not
+    a known non-name word. conservative=False skips those. Neither mode can
+    promise no misses: a lower-case name with no cue and no gazetteer entry is
+    only caught by the full analyzer.
+    """
+
+    def __init__(self, gazetteer: Optional[Iterable[str]] = DEFAULT_NAME_GAZETTEER,
+                 allowlist: Iterable[str] = DOMAIN_TERMS, conservative: bool = True):
+        """
+        Args:
+            gazetteer: Names flagged in any case
+            allowlist: Capitalised words that are not names
+            conservative: Prefer extra NER calls over missed entities
+        """
+        self.conservative = conservative
+        self.allowlist = frozenset(allowlist) | COMMON_WORDS
+        self._phone = _PHONE_CONSERVATIVE if conservative else _PHONE
+        names = sorted({name.lower() for name in gazetteer or ()})
+        self._names = re.compile(r"\b(?:" + build_trie_pattern(names) + r")\b", re.IGNORECASE) if names else None
+
+    def _has_name(self, sentence: str) -> bool:
+        if self._names is not None and self._names.search(sentence):
+            return True
+        if self.conservative:
+            for m in _NAME_CUE.finditer(sentence):
+                if m.group(1).lower() not in NON_NAME_WORDS:
+                    return True
+        for m in _CAPITALISED.finditer(sentence):
+            word = m.group()
+            if word in self.allowlist:
+                continue
+            # Outside conservative mode the first word's capital says nothing
+            if not self.conservative and not sentence[:m.start()].strip(" \"'“‘(["):
+                continue
+            return True
+        return False
+
+    def is_candidate(self, sentence: str, entities: Sequence[str] = ("PERSON", "PHONE_NUMBER")) -> bool:
+        if not SUPPORTED_ENTITIES.issuperset(entities):
+            return True
+        if "PHONE_NUMBER" in entities and self._phone.search(sentence):
+            return True
+        return "PERSON" in entities and self._has_name(sentence)
+
+    def candidate_spans(self, text: str,
+                        entities: Sequence[str] = ("PERSON", "PHONE_NUMBER")) -> List[Tuple[int, int]]:
+        """
+        (start, end) offsets of the stretches of text that need the analyzer;
+        consecutive candidate sentences are merged into one span
+        """
+        if not SUPPORTED_ENTITIES.issuperset(entities):
+            return [(0, len(text))] if text else []
+        spans = []
+        for start, end in sentence_spans(text):
+            if not self.is_candidate(text[start:end], entities):
+                continue
+            if spans and not text[spans[-1][1]:start].strip():
+                spans[-1] = (spans[-1][0], end)
+            else:
+                spans.append((start, end))
+        return spans
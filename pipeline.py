@@ -0,0 +1,282 @@
+# pipeline.py
+import asyncio
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+from client_utils import default_client
+from context_packing import DEFAULT_TOKEN_BUDGET, pack_context
+from rag import rag, rag_stream
+from retriever import retrieve
+from telemetry import get_logger, metrics, span
+from text_utils import SentenceBuffer
+
+logger = get_logger(__name__)
+
+# Start retrieval alongside the topic check instead of after it
+SPECULATIVE_RETRIEVAL = os.getenv("SPECULATIVE_RETRIEVAL", "0") == "1"
+
+_speculation_pool = ThreadPoolExecutor(max_workers=16, thread_name_prefix="speculative-retrieval")
+
+
+async def run_output_guards(answer, retrieved, client=default_client):
+    """
+    Run the hallucination, PII and competitor guards on the answer concurrently.
+
+    Returns the answer with the PII guard's masking applied. If a blocking guard
+    fails, the remaining guard requests are cancelled and its error is raised
+    straight away instead of waiting for the slowest guard.
+    """
+    hallucination = asyncio.create_task(client.avalidate_hallucination(answer, retrieved))
+    pii = asyncio.create_task(client.avalidate_pii(answer))
+    competitor = asyncio.create_task(client.avalidate_competitor(answer))
+    tasks = [hallucination, pii, competitor]
+
+    done, pending = await asyncio.wait(tasks, return_when=asyncio.FIRST_EXCEPTION)
+    for task in done:
+        if task.exception() is not None:
+            for other in pending:
+                other.cancel()
+            await asyncio.gather(*pending, return_exceptions=True)
+            raise task.exception()
+
+    return pii.result()
+
+
+def _retrieve(query, reranker=None, k=5, discarded=None):
+    # With a reranker, over-fetch candidates and keep the k it scores best
+    if reranker is None:
+        return retrieve(query, k=k)
+    retrieved = retrieve(query, k=reranker.candidates)
+    # The cross-encoder is the expensive part; skip it once nobody wants the result
+    if discarded is not None and discarded.is_set():
+        return retrieved
+    return reranker.rerank(query, retrieved, k=k)
+
+
+class SpeculativeRetrieval:
+    """
+    Retrieval started before the topic check has passed.
+
+    Unless its result is taken with result()/aresult(), discard() has to drop it
+    (the callers do so in a finally block: on a rejected query, a cache hit, an
+    error or cancellation). Retrieval that has not started yet is cancelled, and
+    a running one skips its reranking step. The outcome is counted in
+    speculative_retrieval_total{result=used|cancelled|wasted}, and the seconds
+    spent on discarded retrievals in speculative_retrieval_wasted_seconds_total.
+    """
+
+    def __init__(self, query, reranker=None, k=5, executor=None):
+        self._discarded = threading.Event()
+        self.used = False
+        self.seconds = 0.0
+        self.future = (executor or _speculation_pool).submit(self._run, query, reranker, k)
+
+    def _run(self, query, reranker, k):
+        start = time.perf_counter()
+        try:
+            return _retrieve(query, reranker, k, discarded=self._discarded)
+        finally:
+            self.seconds = time.perf_counter() - start
+
+    def result(self):
+        retrieved = self.future.result()
+        self.used = True
+        metrics.increment("speculative_retrieval_total", result="used")
+        return retrieved
+
+    async def aresult(self):
+        retrieved = await asyncio.wrap_future(self.future)
+        self.used = True
+        metrics.increment("speculative_retrieval_total", result="used")
+        return retrieved
+
+    def discard(self, reason):
+        if self.used:
+            return
+        self._discarded.set()
+        if self.future.cancel():
+            metrics.increment("speculative_retrieval_total", result="cancelled", reason=reason)
+            return
+
+        def _wasted(_):
+            metrics.increment("speculative_retrieval_total", result="wasted", reason=reason)
+            metrics.increment("speculative_retrieval_wasted_seconds_total", self.seconds, reason=reason)
+
+        # Counted once the retrieval thread finishes; the caller does not wait for it
+        self.future.add_done_callback(_wasted)
+
+
+async def aguarded_answer(query, client=default_client, cache=None, token_budget=DEFAULT_TOKEN_BUDGET,
+                          reranker=None, speculative=None):
+    """
+    Topic check -> retrieval -> RAG -> concurrent output guards
+
+    With a response_cache.SemanticCache, a near-duplicate of an earlier query is
+    answered from the cache right after the topic check, skipping retrieval, the
+    LLM and the output guards. Only answers that passed every guard are cached.
+
+    Retrieved chunks are optionally reordered by a reranker.CrossEncoderReranker,
+    then packed into token_budget tokens (see context_packing) before they reach
+    the LLM and the hallucination guard.
+
+    With speculative=True (default: SPECULATIVE_RETRIEVAL) retrieval runs while
+    the topic check is in flight and is discarded if the request ends without
+    using it (rejected query, cache hit, error or cancellation).
+    """
+    if speculative is None:
+        speculative = SPECULATIVE_RETRIEVAL
+    speculation = SpeculativeRetrieval(query, reranker) if speculative else None
+    # Why the speculative retrieval goes unused, if it does
+    outcome = "error"
+
+    try:
+        with span("request"):
+            #1. On-topic guard
+            try:
+                with span("topic"):
+                    await client.avalidate_on_topic(query)
+            except ValueError:
+                outcome = "topic_failed"
+                raise
+
+            if cache is not None:
+                with span("cache_lookup"):
+                    embedding = await asyncio.to_thread(cache.embed, query)
+                    cached = await asyncio.to_thread(cache.get, query, embedding)
+                if cached is not None:
+                    outcome = "cache_hit"
+                    metrics.increment("response_cache_total", result="hit")
+                    logger.info("Answer from cache: %s", cached)
+                    return cached
+                metrics.increment("response_cache_total", result="miss")
+
+            #2. Retrieve documents (only the part not already overlapped with the checks above)
+            with span("retrieval"):
+                if speculation is not None:
+                    retrieved = await speculation.aresult()
+                else:
+                    retrieved = await asyncio.to_thread(_retrieve, query, reranker)
+                retrieved = pack_context(retrieved, token_budget)
+            # 3. Generate answer using RAG before guardrails
+            with span("generation"):
+                answer = await asyncio.to_thread(rag, query, retrieved)
+            logger.info("Answer from rag: %s", answer)
+            # 4. Validate answer against guards
+            with span("output_guards"):
+                answer = await run_output_guards(answer, retrieved, client)
+    except asyncio.CancelledError:
+        outcome = "cancelled"
+        raise
+    finally:
+        # No-op once the result was used
+        if speculation is not None:
+            speculation.discard(outcome)
+
+    if cache is not None:
+        await asyncio.to_thread(cache.put, query, answer, embedding)
+    return answer
+
+
+def guarded_answer(query, client=default_client, cache=None, token_budget=DEFAULT_TOKEN_BUDGET,
+                   reranker=None, speculative=None):
+    """
+    Sync entry point for aguarded_answer
+    """
+    async def _run():
+        try:
+            return await aguarded_answer(query, client, cache, token_budget, reranker, speculative)
+        finally:
+            # The async HTTP client belongs to this call's event loop
+            await client.aclose()
+
+    return asyncio.run(_run())
+
+
+def guard_sentence(sentence, retrieved, client=default_client):
+    """
+    Run the competitor, PII and provenance checks on one answer sentence.
+    Returns the sentence (with its surrounding whitespace) with PII masked, or
+    None if it has to be filtered out. A sentence whose guard requests fail
+    (timeouts, HTTP errors) is filtered out rather than failing the stream.
+    """
+    text = sentence.strip()
+    try:
+        if not client.competitor_free(text):
+            return None
+        masked = client.validate_pii(text)
+        client.validate_hallucination(text, retrieved)
+    except requests.RequestException as e:
+        logger.warning("Sentence filtered, guard request failed: %s", e)
+        metrics.increment("stream_sentences_total", result="guard_error")
+        return None
+    except ValueError as e:
+        logger.info("Sentence filtered: %s", e)
+        metrics.increment("stream_sentences_total", result="filtered")
+        return None
+    return sentence.replace(text, masked, 1)
+
+
+def guarded_stream(query, client=default_client, max_workers=4, token_budget=DEFAULT_TOKEN_BUDGET,
+                   reranker=None, speculative=None):
+    """
+    Stream a guarded answer sentence by sentence.
+
+    Tokens from rag_stream are cut into sentences; each finished sentence is
+    validated in a worker thread while the model keeps generating. Sentences
+    are yielded in answer order as soon as they pass, and dropped if they fail;
+    each keeps the whitespace that followed it, so they can be written out as is.
+    speculative works as in aguarded_answer.
+    """
+    start = time.perf_counter()
+    if speculative is None:
+        speculative = SPECULATIVE_RETRIEVAL
+    speculation = SpeculativeRetrieval(query, reranker) if speculative else None
+    outcome = "error"
+    try:
+        try:
+            with span("topic"):
+                client.validate_on_topic(query)
+        except ValueError:
+            outcome = "topic_failed"
+            raise
+        with span("retrieval"):
+            retrieved = speculation.result() if speculation is not None else _retrieve(query, reranker)
+            retrieved = pack_context(retrieved, token_budget)
+    finally:
+        # No-op once the result was used
+        if speculation is not None:
+            speculation.discard(outcome)
+
+    first = True
+
+    def _emit(checked):
+        nonlocal first
+        if first:
+            metrics.observe("stream_first_sentence_seconds", time.perf_counter() - start)
+            first = False
+        metrics.increment("stream_sentences_total", result="passed")
+        return checked
+
+    buffer = SentenceBuffer()
+    pending = deque()
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        for token in rag_stream(query, retrieved):
+            for sentence in buffer.feed(token):
+                pending.append(pool.submit(guard_sentence, sentence, retrieved, client))
+            # Hand over whatever is already validated without waiting on the rest
+            while pending and pending[0].done():
+                checked = pending.popleft().result()
+                if checked:
+                    yield _emit(checked)
+
+        for sentence in buffer.flush():
+            pending.append(pool.submit(guard_sentence, sentence, retrieved, client))
+        while pending:
+            checked = pending.popleft().result()
+            if checked:
+                yield _emit(checked)
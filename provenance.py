@@ -0,0 +1,127 @@
+# provenance.py
+import re
+import threading
+from collections import OrderedDict
+from typing import Callable, List, NamedTuple, Optional
+
+import numpy as np
+
+import model_registry
+from text_utils import split_sentences
+
+
+class ProvenanceSplit(NamedTuple):
+    supported: List[str]
+    uncertain: List[str]
+
+
+def _normalize(text: str) -> str:
+    return re.sub(r"\s+", " ", re.sub(r"[^\w\s]", " ", text.lower())).strip()
+
+
+class LocalProvenanceFilter:
+    """
+    Cheap local provenance check run before ProvenanceLLM.
+
+    A sentence is supported locally if it appears verbatim (ignoring case,
+    punctuation and whitespace) as a run of whole tokens in a source chunk and
+    has at least `min_tokens` tokens, or if its embedding is at least
+    `threshold` cosine-similar to one. Only the remaining sentences need
+    the LLM-based check.
+
+    Source embeddings are cached by text (LRU, `max_cached_sources`), so the
+    chunks retrieved for a streamed answer are embedded once, not per sentence.
+    """
+
+    def __init__(self, embedding_function: Optional[Callable] = None, threshold: float = 0.85,
+                 min_tokens: int = 4, max_cached_sources: int = 1024):
+        self._embedding_function = embedding_function
+        self.threshold = threshold
+        # Shorter sentences ("Yes.", "No refund.") are too easy to find verbatim
+        self.min_tokens = min_tokens
+        self._lock = threading.Lock()
+        self.sentences_total = 0
+        self.sentences_local = 0
+        self.max_cached_sources = max_cached_sources
+        self._source_cache = OrderedDict()
+        self.source_hits = 0
+        self.source_misses = 0
+
+    @property
+    def embedding_function(self):
+        # Loaded on first use so importing the client stays cheap
+        if self._embedding_function is None:
+            self._embedding_function = model_registry.embedding_function()
+        return self._embedding_function
+
+    def _embed(self, texts):
+        vectors = np.asarray(self.embedding_function(texts), dtype=np.float32)
+        return vectors / np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+
+    def _embed_sources(self, sources):
+        with self._lock:
+            cached = {}
+            for source in sources:
+                if source in self._source_cache:
+                    self._source_cache.move_to_end(source)
+                    cached[source] = self._source_cache[source]
+            missing = list(dict.fromkeys(s for s in sources if s not in cached))
+            self.source_hits += len(sources) - len(missing)
+            self.source_misses += len(missing)
+        if missing:
+            # Embedded outside the lock; a concurrent miss on the same text just embeds it twice
+            for source, vector in zip(missing, self._embed(missing)):
+                cached[source] = vector
+            with self._lock:
+                for source in missing:
+                    self._source_cache[source] = cached[source]
+                while len(self._source_cache) > self.max_cached_sources:
+                    self._source_cache.popitem(last=False)
+        return np.stack([cached[source] for source in sources])
+
+    def split(self, answer: str, sources: List[str], source_embeddings=None) -> ProvenanceSplit:
+        """
+        Args:
+            answer: Generated answer
+            sources: Retrieved chunk texts
+            source_embeddings: Optional embeddings of sources (e.g. from retrieve), to skip re-embedding them
+        """
+        sentences = split_sentences(answer)
+        # Padded with spaces so only whole tokens match
+        normalized_sources = [f" {_normalize(s)} " for s in sources]
+
+        supported, rest = [], []
+        for sentence in sentences:
+            norm = _normalize(sentence)
+            if not norm or (len(norm.split()) >= self.min_tokens
+                            and any(f" {norm} " in source for source in normalized_sources)):
+                supported.append(sentence)
+            else:
+                rest.append(sentence)
+
+        uncertain = rest
+        if rest and sources:
+            if source_embeddings is None:
+                source_matrix = self._embed_sources(sources)
+            else:
+                source_matrix = np.asarray(source_embeddings, dtype=np.float32)
+                source_matrix = source_matrix / np.maximum(
+                    np.linalg.norm(source_matrix, axis=1, keepdims=True), 1e-12)
+            best = (self._embed(rest) @ source_matrix.T).max(axis=1)
+            supported += [s for s, score in zip(rest, best) if score >= self.threshold]
+            uncertain = [s for s, score in zip(rest, best) if score < self.threshold]
+
+        with self._lock:
+            self.sentences_total += len(sentences)
+            self.sentences_local += len(sentences) - len(uncertain)
+        return ProvenanceSplit(supported, uncertain)
+
+    def stats(self):
+        return {
+            "sentences_total": self.sentences_total,
+            "sentences_local": self.sentences_local,
+            "sentences_llm": self.sentences_total - self.sentences_local,
+            "source_embedding_hits": self.source_hits,
+            "source_embedding_misses": self.source_misses,
+            "cached_sources": len(self._source_cache),
+        }
@@ -4,6 +4,8 @@ from openai import OpenAI
 from dotenv import load_dotenv
 import requests
 
+from context_packing import format_passage
+
 # from dotenv import load_dotenv, find_dotenv
 # _ = load_dotenv(find_dotenv()) # read local .env file
 
@@ -14,14 +16,11 @@ openai.api_key = os.environ['OPENAI_API_KEY']
 
 openai_client = OpenAI()
 
-def rag(query, retrieved_documents, model="gpt-3.5-turbo"):
+def _build_messages(query, retrieved_documents):
     # information = "\n\n".join(retrieved_documents)
-    information = "\n\n".join(
-        f"[Source: {meta.get('source', 'unknown')}] {doc}"
-        for doc, meta in retrieved_documents
-    )
+    information = "\n\n".join(format_passage(doc, meta) for doc, meta in retrieved_documents)
 
-    messages = [
+    return [
         {
             "role": "system",
             "content": f"""
@@ -37,7 +36,11 @@ def rag(query, retrieved_documents, model="gpt-3.5-turbo"):
         {"role": "user", "content": f"Question: {query}. \n Information: {information}"}
     ]
 
-    response = openai_client.chat.completions.create(
+
+def rag(query, retrieved_documents, model="gpt-3.5-turbo", client=None):
+    messages = _build_messages(query, retrieved_documents)
+
+    response = (client or openai_client).chat.completions.create(
         model=model,
         messages=messages,
     )
@@ -45,4 +48,20 @@ def rag(query, retrieved_documents, model="gpt-3.5-turbo"):
     # print("answer from rag:", answer)
     return answer
     # return content
-    # return response
\ No newline at end of file
+    # return response
+
+
+def rag_stream(query, retrieved_documents, model="gpt-3.5-turbo", client=None):
+    """
+    Same as rag() but yields the answer text piece by piece as the model produces it
+    """
+    messages = _build_messages(query, retrieved_documents)
+
+    stream = (client or openai_client).chat.completions.create(
+        model=model,
+        messages=messages,
+        stream=True,
+    )
+    for chunk in stream:
+        if chunk.choices and chunk.choices[0].delta.content:
+            yield chunk.choices[0].delta.content
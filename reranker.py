@@ -0,0 +1,155 @@
+# reranker.py
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, TimeoutError
+from typing import List, Optional
+
+import model_registry
+from telemetry import get_logger, metrics, span
+
+logger = get_logger(__name__)
+
+DEFAULT_MODEL = model_registry.CROSS_ENCODER_MODEL
+
+
+def _pair_key(query, doc):
+    return query, hashlib.sha1(doc.encode("utf-8")).digest()
+
+
+class CrossEncoderReranker:
+    """
+    Reorders over-fetched retrieval candidates by cross-encoder relevance.
+
+    All uncached (query, chunk) pairs are scored in one batched forward pass on
+    CPU. Scores are kept in an LRU so repeated queries skip the model. When
+    scoring does not finish within the latency budget, the candidates keep the
+    order they were retrieved in (fused vector + BM25 order with hybrid
+    retrieval); a job that had already started still caches its scores for the
+    next time, one still queued is cancelled. With max_pending jobs already
+    queued or running, further requests fall back straight away.
+    """
+
+    def __init__(self, model_name: str = DEFAULT_MODEL, model=None, candidates: int = 30,
+                 latency_budget: Optional[float] = 0.25, cache_size: int = 10000, batch_size: int = 32,
+                 max_pending: int = 4):
+        """
+        Args:
+            model_name: sentence-transformers cross-encoder, loaded through model_registry on first use
+            model: Already loaded model with a predict(pairs) method
+            candidates: How many chunks to retrieve before reranking
+            latency_budget: Seconds to wait for scores, None to always wait
+            cache_size: Number of (query, chunk) scores to keep
+            batch_size: Pairs per forward pass inside predict
+            max_pending: Scoring jobs queued or running at once
+        """
+        self.model_name = model_name
+        self._model = model
+        self.candidates = candidates
+        self.latency_budget = latency_budget
+        self.cache_size = cache_size
+        self.batch_size = batch_size
+        self.max_pending = max_pending
+        self._cache = OrderedDict()  # (query, chunk digest) -> score
+        self._lock = threading.Lock()
+        # One worker: scoring is CPU bound and torch already uses every core
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="reranker")
+        self._pending = 0
+
+        self.hits = 0
+        self.misses = 0
+        self.fallbacks = 0
+
+    @property
+    def model(self):
+        if self._model is None:
+            self._model = model_registry.cross_encoder(self.model_name)
+        return self._model
+
+    def warm(self):
+        """
+        Load the model ahead of the first request
+        """
+        self.model.predict([("warm up", "warm up")])
+
+    def score(self, query: str, docs: List[str], deadline: Optional[float] = None) -> Optional[List[float]]:
+        """
+        Cross-encoder scores of (query, doc) pairs; None, without running the
+        model, if the time.monotonic() deadline passed while the job was queued
+        """
+        if deadline is not None and time.monotonic() > deadline:
+            return None
+        keys = [_pair_key(query, doc) for doc in docs]
+        scores = [None] * len(docs)
+        with self._lock:
+            for i, key in enumerate(keys):
+                if key in self._cache:
+                    self._cache.move_to_end(key)
+                    scores[i] = self._cache[key]
+            missing = [i for i, s in enumerate(scores) if s is None]
+            self.hits += len(docs) - len(missing)
+            self.misses += len(missing)
+        if missing:
+            predicted = self.model.predict([(query, docs[i]) for i in missing], batch_size=self.batch_size)
+            with self._lock:
+                for i, value in zip(missing, predicted):
+                    scores[i] = float(value)
+                    self._cache[keys[i]] = scores[i]
+                while len(self._cache) > self.cache_size:
+                    self._cache.popitem(last=False)
+        return scores
+
+    def _fallback(self, retrieved, k, reason):
+        with self._lock:
+            self.fallbacks += 1
+        metrics.increment("rerank_total", result="fallback", reason=reason)
+        return retrieved[:k]
+
+    def _done(self, _):
+        with self._lock:
+            self._pending -= 1
+
+    def rerank(self, query: str, retrieved, k: int = 5, latency_budget: Optional[float] = ...):
+        """
+        Returns the k best of retrieved ((document, metadata, ...) tuples in
+        retrieval order), or the first k unchanged if the budget runs out
+        """
+        if latency_budget is ...:
+            latency_budget = self.latency_budget
+        retrieved = list(retrieved)
+        if len(retrieved) <= 1:
+            return retrieved[:k]
+
+        with span("rerank"):
+            with self._lock:
+                full = self._pending >= self.max_pending
+                if not full:
+                    self._pending += 1
+            if full:
+                logger.info("Reranker queue full, keeping retrieval order")
+                return self._fallback(retrieved, k, "queue_full")
+            deadline = None if latency_budget is None else time.monotonic() + latency_budget
+            future = self._executor.submit(self.score, query, [item[0] for item in retrieved], deadline)
+            future.add_done_callback(self._done)
+            try:
+                scores = future.result(timeout=latency_budget)
+            except TimeoutError:
+                # Drops the job if it has not started; a running one finishes and caches its scores
+                future.cancel()
+                logger.info("Reranking exceeded %.3fs, keeping retrieval order", latency_budget)
+                return self._fallback(retrieved, k, "timeout")
+            if scores is None:
+                return self._fallback(retrieved, k, "timeout")
+
+        metrics.increment("rerank_total", result="scored")
+        order = sorted(range(len(retrieved)), key=lambda i: -scores[i])
+        return [retrieved[i] for i in order[:k]]
+
+    def stats(self):
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "fallbacks": self.fallbacks,
+            "entries": len(self._cache),
+        }
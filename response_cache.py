@@ -0,0 +1,309 @@
+# response_cache.py
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, List, NamedTuple, Optional
+
+import numpy as np
+
+import model_registry
+
+
+class CacheEntry(NamedTuple):
+    key: int
+    query: str
+    embedding: np.ndarray
+    answer: str
+    created_at: float
+
+
+class InMemoryCacheBackend:
+    """
+    Entries kept in an OrderedDict in least- to most-recently-used order
+    """
+
+    def __init__(self):
+        self._entries = OrderedDict()
+        self._next_key = 0
+        self._version = None
+
+    def entries(self) -> List[CacheEntry]:
+        return list(self._entries.values())
+
+    def add(self, query, embedding, answer, created_at) -> int:
+        key = self._next_key
+        self._next_key += 1
+        self._entries[key] = CacheEntry(key, query, embedding, answer, created_at)
+        return key
+
+    def answer(self, key) -> Optional[str]:
+        entry = self._entries.get(key)
+        return entry.answer if entry else None
+
+    def touch(self, key):
+        self._entries.move_to_end(key)
+
+    def delete(self, keys):
+        for key in keys:
+            self._entries.pop(key, None)
+
+    def lru_keys(self, n) -> List[int]:
+        return list(self._entries)[:n]
+
+    def __len__(self):
+        return len(self._entries)
+
+    def clear(self):
+        self._entries.clear()
+
+    def data_version(self):
+        # Only written through the SemanticCache that owns it
+        return None
+
+    def get_version(self):
+        return self._version
+
+    def set_version(self, version):
+        self._version = version
+
+
+class SQLiteCacheBackend:
+    """
+    Entries persisted in a SQLite file, so they survive restarts and can be
+    shared by several worker processes
+    """
+
+    def __init__(self, path="response_cache.sqlite3"):
+        self.path = path
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS entries (
+                key INTEGER PRIMARY KEY AUTOINCREMENT,
+                query TEXT NOT NULL,
+                embedding BLOB NOT NULL,
+                answer TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                last_access REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS entries_last_access ON entries (last_access);
+            CREATE TABLE IF NOT EXISTS meta (name TEXT PRIMARY KEY, value TEXT);
+        """)
+        self._conn.commit()
+
+    def entries(self) -> List[CacheEntry]:
+        rows = self._conn.execute(
+            "SELECT key, query, embedding, answer, created_at FROM entries").fetchall()
+        return [CacheEntry(key, query, np.frombuffer(blob, dtype=np.float32), answer, created_at)
+                for key, query, blob, answer, created_at in rows]
+
+    def add(self, query, embedding, answer, created_at) -> int:
+        cursor = self._conn.execute(
+            "INSERT INTO entries (query, embedding, answer, created_at, last_access) VALUES (?, ?, ?, ?, ?)",
+            (query, np.asarray(embedding, dtype=np.float32).tobytes(), answer, created_at, time.time()))
+        self._conn.commit()
+        return cursor.lastrowid
+
+    def answer(self, key) -> Optional[str]:
+        row = self._conn.execute("SELECT answer FROM entries WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def touch(self, key):
+        self._conn.execute("UPDATE entries SET last_access = ? WHERE key = ?", (time.time(), key))
+        self._conn.commit()
+
+    def delete(self, keys):
+        self._conn.executemany("DELETE FROM entries WHERE key = ?", [(key,) for key in keys])
+        self._conn.commit()
+
+    def lru_keys(self, n) -> List[int]:
+        rows = self._conn.execute(
+            "SELECT key FROM entries ORDER BY last_access LIMIT ?", (n,)).fetchall()
+        return [key for key, in rows]
+
+    def __len__(self):
+        return self._conn.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+
+    def clear(self):
+        self._conn.execute("DELETE FROM entries")
+        self._conn.commit()
+
+    def data_version(self):
+        # Changes when another connection (e.g. another worker) commits
+        return self._conn.execute("PRAGMA data_version").fetchone()[0]
+
+    def get_version(self):
+        row = self._conn.execute("SELECT value FROM meta WHERE name = 'store_version'").fetchone()
+        return row[0] if row else None
+
+    def set_version(self, version):
+        self._conn.execute(
+            "INSERT OR REPLACE INTO meta (name, value) VALUES ('store_version', ?)", (version,))
+        self._conn.commit()
+
+
+class SemanticCache:
+    """
+    Cache of validated answers looked up by query-embedding similarity.
+
+    A query hits when its cosine similarity to a cached query is at or above the
+    threshold. Entries expire after ttl seconds and the least recently used ones
+    are evicted beyond max_entries. The whole cache is dropped when the vector
+    store fingerprint changes, since cached answers were grounded on the old
+    chunks.
+
+    The normalized query embeddings are kept in memory as one matrix, so a
+    lookup is a single matrix-vector product; it is reloaded from the backend
+    only when another process has written to it.
+    """
+
+    def __init__(
+            self,
+            backend=None,
+            embedding_function: Optional[Callable] = None,
+            threshold: float = 0.95,
+            ttl: Optional[float] = 24 * 3600,
+            max_entries: int = 1000,
+            db_path: Optional[str] = "vectorstore",
+            store_version: Optional[Callable] = None,
+    ):
+        """
+        Args:
+            backend: InMemoryCacheBackend (default) or SQLiteCacheBackend
+            embedding_function: Chroma-style callable mapping a list of texts to a list of vectors
+            threshold: Minimum cosine similarity for a hit
+            ttl: Seconds an entry stays valid, None for no expiry
+            max_entries: LRU capacity
+            db_path: Vector store whose changes invalidate the cache, None for none
+            store_version: Callable returning the vector store fingerprint;
+                           the ChromaStore for db_path by default (checked on a timer)
+        """
+        if embedding_function is None:
+            embedding_function = model_registry.embedding_function()
+        if store_version is None and db_path is not None:
+            import retriever
+            store_version = retriever.get_store(db_path).version
+
+        self.backend = backend if backend is not None else InMemoryCacheBackend()
+        self.embedding_function = embedding_function
+        self.threshold = threshold
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.store_version = store_version
+        self._lock = threading.Lock()
+        self._keys = np.zeros(0, dtype=np.int64)
+        self._matrix = None
+        self._created = np.zeros(0)
+        self._data_version = None
+        self._loaded = False
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+
+    def embed(self, query: str) -> np.ndarray:
+        embedding = np.asarray(self.embedding_function([query])[0], dtype=np.float32)
+        return embedding / max(float(np.linalg.norm(embedding)), 1e-12)
+
+    def _check_store_version(self):
+        if self.store_version is None:
+            return
+        version = repr(self.store_version())
+        if version != self.backend.get_version():
+            if len(self.backend):
+                self.invalidations += 1
+            self.backend.clear()
+            self.backend.set_version(version)
+            self._drop(self._keys)
+
+    def _sync(self):
+        # Reload the in-memory copy if another process wrote to the backend
+        data_version = self.backend.data_version()
+        if self._loaded and data_version == self._data_version:
+            return
+        entries = self.backend.entries()
+        self._keys = np.array([e.key for e in entries], dtype=np.int64)
+        self._matrix = np.stack([e.embedding for e in entries]) if entries else None
+        self._created = np.array([e.created_at for e in entries])
+        self._data_version = data_version
+        self._loaded = True
+
+    def _drop(self, keys):
+        keep = ~np.isin(self._keys, keys)
+        self._keys, self._created = self._keys[keep], self._created[keep]
+        self._matrix = self._matrix[keep] if self._matrix is not None and keep.any() else None
+
+    def invalidate(self):
+        """
+        Drop every cached answer
+        """
+        with self._lock:
+            self.backend.clear()
+            self._drop(self._keys)
+            self.invalidations += 1
+
+    def get(self, query: str, embedding: Optional[np.ndarray] = None) -> Optional[str]:
+        """
+        Returns the cached answer for the most similar query above the threshold, or None
+        """
+        if embedding is None:
+            embedding = self.embed(query)
+
+        with self._lock:
+            self._sync()
+            self._check_store_version()
+
+            if self.ttl is not None and len(self._keys):
+                expired = self._keys[time.time() - self._created > self.ttl].tolist()
+                if expired:
+                    self.backend.delete(expired)
+                    self._drop(expired)
+                    self.expirations += len(expired)
+
+            if self._matrix is not None:
+                scores = self._matrix @ embedding
+                best = int(np.argmax(scores))
+                if scores[best] >= self.threshold:
+                    key = int(self._keys[best])
+                    answer = self.backend.answer(key)
+                    if answer is not None:
+                        self.backend.touch(key)
+                        self.hits += 1
+                        return answer
+
+            self.misses += 1
+            return None
+
+    def put(self, query: str, answer: str, embedding: Optional[np.ndarray] = None):
+        if embedding is None:
+            embedding = self.embed(query)
+
+        embedding = np.asarray(embedding, dtype=np.float32)
+        with self._lock:
+            self._sync()
+            self._check_store_version()
+            created_at = time.time()
+            key = self.backend.add(query, embedding, answer, created_at)
+            self._keys = np.append(self._keys, key)
+            self._created = np.append(self._created, created_at)
+            self._matrix = embedding[None, :] if self._matrix is None else np.vstack([self._matrix, embedding])
+            overflow = len(self.backend) - self.max_entries
+            if overflow > 0:
+                evicted = self.backend.lru_keys(overflow)
+                self.backend.delete(evicted)
+                self._drop(evicted)
+                self.evictions += overflow
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "invalidations": self.invalidations,
+            "entries": len(self.backend),
+        }
@@ -3,28 +3,336 @@ __import__('pysqlite3')
 import sys
 sys.modules['sqlite3'] = sys.modules.pop('pysqlite3')
 
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
 import chromadb
 
-def retrieve(query, db_path="vectorstore", collection_name="faq", k=5):
-    client = chromadb.PersistentClient(path=db_path)
-    collection = client.get_collection(collection_name)
-    # results = collection.query(query_texts=[query], n_results=k)
-    # return results['documents'][0]
+import model_registry
+from lexical_index import BM25Index, index_path, reciprocal_rank_fusion
+from serving_index import ServingIndex, serving_path
+from telemetry import get_logger, span
+
+logger = get_logger(__name__)
+
+DEFAULT_INCLUDE = ("documents", "metadatas")
+
+# "chroma": the PersistentClient store; "serving": the quantized, memory-mapped
+# export under <db_path>/serving/ (see serving_index.py)
+RETRIEVAL_BACKEND = os.getenv("RETRIEVAL_BACKEND", "chroma")
+BACKENDS = ("chroma", "serving")
+
+
+def store_version(db_path):
+    """
+    Fingerprint of the persisted Chroma store; changes whenever chunks are
+    added, updated or deleted, or the store is recreated
+    """
+    path = os.path.join(db_path, "chroma.sqlite3")
+    try:
+        inode = os.stat(path).st_ino
+        # Not the file's mtime: Chroma touches the file on every read
+        conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+    except (FileNotFoundError, sqlite3.OperationalError):
+        return None
+    try:
+        (seq_id,) = conn.execute("SELECT MAX(seq_id) FROM embeddings_queue").fetchone()
+    except sqlite3.OperationalError:
+        # Not initialised yet
+        seq_id = None
+    finally:
+        conn.close()
+    return inode, seq_id
+
+
+# Seconds between checks of the persisted store for changes
+STORE_CHECK_INTERVAL = float(os.getenv("STORE_CHECK_INTERVAL", "5"))
+
 
-    results = collection.query(
-        query_texts=[query],
-        n_results=k,
-        include=["documents", "metadatas", "embeddings"]  # <-- include metadata
-    )
+class ChromaStore:
+    """
+    The PersistentClient for one store path, shared by every Retriever on it.
+
+    store_version() is read at most every check_interval seconds, not per
+    query. When it has changed the client is replaced: new queries wait while
+    the running ones finish on the old client, which is then closed. Chroma
+    keeps one system (and its loaded HNSW index) per path, so only a new client
+    sees the re-ingested files.
+    """
+
+    def __init__(self, db_path, check_interval=STORE_CHECK_INTERVAL):
+        self.db_path = db_path
+        self.check_interval = check_interval
+        self.client = None
+        self._version = None
+        self._latest = None
+        self._checked_at = None
+        self._cond = threading.Condition()
+        self._readers = 0
+        self._reloading = False
+
+    def version(self):
+        """
+        The store's fingerprint, re-read from disk at most every check_interval seconds
+        """
+        now = time.monotonic()
+        if self._checked_at is None or now - self._checked_at >= self.check_interval:
+            self._checked_at = now
+            self._latest = store_version(self.db_path)
+        return self._latest
+
+    @contextmanager
+    def reading(self):
+        """
+        Yields the client; it is not closed until the block exits. Not reentrant
+        """
+        self.version()
+        with self._cond:
+            while self._reloading:
+                self._cond.wait()
+            if self.client is None or self._latest != self._version:
+                self._reload(self._latest)
+            self._readers += 1
+            client = self.client
+        try:
+            yield client
+        finally:
+            with self._cond:
+                self._readers -= 1
+                if not self._readers:
+                    self._cond.notify_all()
+
+    def _reload(self, version):
+        # Called with self._cond held; wait() releases it while readers drain
+        self._reloading = True
+        try:
+            while self._readers:
+                self._cond.wait()
+            if self.client is not None:
+                self.client.close()
+            self.client = chromadb.PersistentClient(path=self.db_path)
+            self._version = version
+        finally:
+            self._reloading = False
+            self._cond.notify_all()
+
+
+_stores = {}
+_stores_lock = threading.Lock()
+
+
+def get_store(db_path="vectorstore"):
+    """
+    Returns the shared ChromaStore for db_path
+    """
+    key = os.path.abspath(db_path)
+    with _stores_lock:
+        if key not in _stores:
+            _stores[key] = ChromaStore(db_path)
+        return _stores[key]
+
+
+class Retriever:
+    """
+    Long-lived handle on one Chroma collection.
 
-    # Each of these is a list of lists (because query_texts could have multiple queries)
-    docs = results['documents'][0]
-    metadatas = results['metadatas'][0]
-    embeddings = results['embeddings'] [0]
+    The client and collection are opened once and reused across queries; they
+    are reopened only when the persisted store changes on disk (e.g. after
+    build-vector-db.py re-ingests, see ChromaStore). The same goes for the memory-mapped BM25
+    index under <db_path>/bm25/ that hybrid retrieval fuses in.
 
+    With backend="serving" queries go to the read-only ServingIndex exported
+    by build-vector-db.py instead of Chroma.
+    """
+
+    def __init__(self, db_path="vectorstore", collection_name="faq", embedding_function=None, backend=None):
+        backend = backend or RETRIEVAL_BACKEND
+        if backend not in BACKENDS:
+            raise ValueError(f"Unknown retrieval backend {backend!r}, expected one of {BACKENDS}")
+        self.db_path = db_path
+        self.collection_name = collection_name
+        self.backend = backend
+        # Same all-MiniLM-L6-v2 model the store was built with, shared process-wide
+        self.embedding_function = embedding_function or model_registry.embedding_function()
+        self._lock = threading.Lock()
+        self._client = None
+        self._collection = None
+        self._lexical = None
+        self._lexical_version = None
+        self._serving = None
+        self._serving_version = None
+
+    @property
+    def store(self):
+        return get_store(self.db_path)
+
+    @property
+    def collection(self):
+        with self._reading() as collection:
+            return collection
+
+    @property
+    def lexical(self):
+        """
+        The BM25 index written by build-vector-db.py, or None if there is none
+        """
+        path = index_path(self.db_path, self.collection_name)
+        try:
+            version = os.stat(os.path.join(path, "meta.json")).st_mtime_ns
+        except FileNotFoundError:
+            return self._lexical
+        if version != self._lexical_version:
+            with self._lock:
+                if version != self._lexical_version:
+                    try:
+                        self._lexical = BM25Index.load(path)
+                        self._lexical_version = version
+                    except (OSError, ValueError) as e:
+                        # Mid-rebuild; keep serving the previous index
+                        logger.warning("Could not load BM25 index from %s: %s", path, e)
+        return self._lexical
+
+    @property
+    def serving(self):
+        """
+        The serving index written by build-vector-db.py, reloaded when it is re-exported
+        """
+        path = serving_path(self.db_path, self.collection_name)
+        try:
+            version = os.stat(os.path.join(path, "meta.json")).st_mtime_ns
+        except FileNotFoundError:
+            version = None
+        if version is not None and version != self._serving_version:
+            with self._lock:
+                if version != self._serving_version:
+                    try:
+                        self._serving = ServingIndex.load(path)
+                        self._serving_version = version
+                    except (OSError, ValueError) as e:
+                        # Mid-export; keep serving the previous index
+                        logger.warning("Could not load serving index from %s: %s", path, e)
+        if self._serving is None:
+            raise FileNotFoundError(f"No serving index under {path}; run build-vector-db.py")
+        return self._serving
+
+    @contextmanager
+    def _reading(self):
+        # The collection to query; the store is not reloaded until the block exits
+        if self.backend == "serving":
+            yield self.serving
+            return
+        with self.store.reading() as client:
+            with self._lock:
+                if self._client is not client:
+                    # Queries are embedded by self.embedding_function, so the collection
+                    # keeps its persisted one and any EMBEDDING_BACKEND can read it
+                    self._collection = client.get_collection(self.collection_name)
+                    self._client = client
+                collection = self._collection
+            yield collection
+
+    def _query(self, collection, queries, k, include):
+        # Embedding and ANN search are timed separately
+        with span("retrieval.embedding"):
+            embeddings = self.embedding_function(list(queries))
+        with span("retrieval.ann"):
+            return collection.query(query_embeddings=embeddings, n_results=k, include=include)
+
+    def retrieve(self, query, k=5, include=DEFAULT_INCLUDE, hybrid=False, candidates=20, rrf_k=60):
+        """
+        Returns the top-k chunks for the query as tuples of the included fields,
+        in the order given by include, e.g. (document, metadata) by default.
+
+        With hybrid=True the top candidates of the vector search and of BM25 are
+        fused by reciprocal rank (falls back to vector search without a BM25
+        index). Chunks found only by BM25 have a distance of None.
+        """
+        include = list(include)
+        lexical = self.lexical if hybrid else None
+        with self._reading() as collection:
+            if lexical is None:
+                results = self._query(collection, [query], k, include)
+                # Each of these is a list of lists (because query_texts could have multiple queries)
+                return list(zip(*(results[field][0] for field in include)))
+
+            fields = [field for field in include if field != "distances"]
+            dense = self._query(collection, [query], max(k, candidates), fields + ["distances"])
+            with span("retrieval.bm25"):
+                sparse = lexical.search(query, candidates)
+            fused = reciprocal_rank_fusion([dense["ids"][0], [id_ for id_, _ in sparse]], k=rrf_k)[:k]
+
+            rows = {
+                id_: {field: dense[field][0][i] for field in fields + ["distances"]}
+                for i, id_ in enumerate(dense["ids"][0])
+            }
+            missing = [id_ for id_ in fused if id_ not in rows]
+            if missing:
+                found = collection.get(ids=missing, include=fields)
+                for i, id_ in enumerate(found["ids"]):
+                    rows[id_] = {field: found[field][i] for field in fields}
+        # Ids of chunks deleted since the BM25 index was built are dropped here
+        return [tuple(rows[id_].get(field) for field in include) for id_ in fused if id_ in rows]
+
+    def retrieve_many(self, queries, k=5, dedupe=False):
+        """
+        Retrieve for many queries with one batched embedding pass and one Chroma query.
+
+        Returns one list of (document, metadata, distance) tuples per query. With
+        dedupe=True a chunk is kept only for the query it is closest to.
+        """
+        if not queries:
+            return []
+        with self._reading() as collection:
+            results = self._query(collection, queries, k, ["documents", "metadatas", "distances"])
+        ids = results["ids"]
+
+        keep = None
+        if dedupe:
+            best = {}
+            for qi, row in enumerate(ids):
+                for ri, chunk_id in enumerate(row):
+                    distance = results["distances"][qi][ri]
+                    if chunk_id not in best or distance < best[chunk_id][0]:
+                        best[chunk_id] = (distance, qi)
+            keep = {chunk_id: qi for chunk_id, (_, qi) in best.items()}
+
+        batches = []
+        for qi, row in enumerate(ids):
+            batches.append([
+                (results["documents"][qi][ri], results["metadatas"][qi][ri], results["distances"][qi][ri])
+                for ri, chunk_id in enumerate(row)
+                if keep is None or keep[chunk_id] == qi
+            ])
+        return batches
+
+
+_retrievers = {}
+_retrievers_lock = threading.Lock()
+
+
+def get_retriever(db_path="vectorstore", collection_name="faq", backend=None):
+    """
+    Returns the shared Retriever for (db_path, collection_name, backend)
+    """
+    backend = backend or RETRIEVAL_BACKEND
+    key = (os.path.abspath(db_path), collection_name, backend)
+    with _retrievers_lock:
+        if key not in _retrievers:
+            _retrievers[key] = Retriever(db_path, collection_name, backend=backend)
+        return _retrievers[key]
+
+
+def retrieve(query, db_path="vectorstore", collection_name="faq", k=5, hybrid=True, backend=None):
     # Return list of (document, metadata) tuples
-    return list(zip(docs, metadatas)) # same as the return from "results"
-    # return results
+    return get_retriever(db_path, collection_name, backend).retrieve(query, k=k, hybrid=hybrid)
+
+
+def retrieve_many(queries, db_path="vectorstore", collection_name="faq", k=5, dedupe=False, backend=None):
+    # Return one list of (document, metadata, distance) tuples per query
+    return get_retriever(db_path, collection_name, backend).retrieve_many(queries, k=k, dedupe=dedupe)
 
 
 def get_sources_for_query(query, k=5):
@@ -33,4 +341,4 @@ def get_sources_for_query(query, k=5):
     Returns a list of strings.
     """
     sources = retrieve(query, k=k)
-    return sources
\ No newline at end of file
+    return sources
@@ -0,0 +1,283 @@
+# serving_index.py
+import json
+import math
+import os
+import shutil
+from typing import List, Optional
+
+import numpy as np
+
+DTYPES = ("int8", "float16")
+SPACES = ("l2", "cosine", "ip")
+
+# Below this many chunks a flat scan is exact and already fast; no IVF lists
+IVF_MIN_ROWS = 4096
+DEFAULT_NPROBE = 16
+
+
+def serving_path(db_path="vectorstore", collection_name="faq"):
+    return os.path.join(db_path, "serving", collection_name)
+
+
+def quantize(embeddings: np.ndarray, dtype: str = "int8"):
+    """
+    Returns (codes, scales) with embeddings ~= codes * scales[:, None]: int8
+    codes with one symmetric float32 scale per row, or float16 codes with unit scales
+    """
+    embeddings = np.asarray(embeddings, dtype=np.float32)
+    if dtype == "float16":
+        return embeddings.astype(np.float16), np.ones(len(embeddings), dtype=np.float32)
+    if dtype != "int8":
+        raise ValueError(f"Unknown serving dtype {dtype!r}, expected one of {DTYPES}")
+    scales = np.abs(embeddings).max(axis=1) / 127 if len(embeddings) else np.zeros(0, dtype=np.float32)
+    scales = np.where(scales > 0, scales, 1.0).astype(np.float32)
+    codes = np.clip(np.rint(embeddings / scales[:, None]), -127, 127).astype(np.int8)
+    return codes, scales
+
+
+def kmeans(vectors: np.ndarray, n_clusters: int, iterations: int = 10, sample: int = 256, seed: int = 0):
+    """
+    Lloyd's k-means on at most sample points per cluster; returns float32 centroids
+    """
+    rng = np.random.default_rng(seed)
+    if len(vectors) > n_clusters * sample:
+        vectors = vectors[rng.choice(len(vectors), n_clusters * sample, replace=False)]
+    centroids = vectors[rng.choice(len(vectors), n_clusters, replace=False)].copy()
+    for _ in range(iterations):
+        assignment = nearest_centroids(vectors, centroids)
+        counts = np.bincount(assignment, minlength=n_clusters)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assignment, vectors)
+        empty = counts == 0
+        centroids[~empty] = sums[~empty] / counts[~empty, None]
+        # Restart empty clusters from random points
+        centroids[empty] = vectors[rng.choice(len(vectors), int(empty.sum()))]
+    return centroids
+
+
+def nearest_centroids(vectors: np.ndarray, centroids: np.ndarray, n: int = 1):
+    # Squared L2 up to the per-vector constant: |c|^2 - 2 v.c
+    scores = (centroids * centroids).sum(axis=1) - 2 * vectors @ centroids.T
+    if n == 1:
+        return scores.argmin(axis=1)
+    n = min(n, centroids.shape[0])
+    return np.argpartition(scores, n - 1, axis=1)[:, :n]
+
+
+class ServingIndex:
+    """
+    Read-only export of a Chroma collection for serving workers.
+
+    Embeddings are stored quantized (int8 or float16) and grouped by IVF list,
+    so each probed list is one contiguous slice; documents and metadata are
+    packed into one file addressed through an offsets table. Everything is
+    memory-mapped on load, so worker processes share one copy in the page cache.
+
+    Offers the part of the Chroma Collection API the Retriever uses (query,
+    get, count), with distances in the collection's own space.
+    """
+
+    FILES = ("codes.npy", "scales.npy", "sq_norms.npy", "centroids.npy", "list_offsets.npy",
+             "record_offsets.npy")
+    RECORDS = "records.bin"
+
+    def __init__(self, ids, codes, scales, sq_norms, centroids, list_offsets, record_offsets, records,
+                 space="l2", nprobe=DEFAULT_NPROBE):
+        self.ids = ids
+        self.codes = codes
+        self.scales = scales
+        self.sq_norms = sq_norms
+        self.centroids = centroids
+        self.list_offsets = list_offsets
+        self.record_offsets = record_offsets
+        self.records = records
+        self.space = space
+        self.nprobe = nprobe
+        self._rows = {id_: row for row, id_ in enumerate(ids)}
+
+    @classmethod
+    def build(cls, ids: List[str], embeddings, documents: List[str], metadatas: List[Optional[dict]],
+              space: str = "l2", dtype: str = "int8", nlist: Optional[int] = None,
+              nprobe: int = DEFAULT_NPROBE) -> "ServingIndex":
+        """
+        Args:
+            space: Distance of the source collection (Chroma's hnsw:space)
+            dtype: "int8" or "float16" storage for the embeddings
+            nlist: IVF lists; by default 1 (flat scan) below IVF_MIN_ROWS chunks, else ~sqrt(chunks)
+            nprobe: Lists scanned per query by default
+        """
+        if space not in SPACES:
+            raise ValueError(f"Unknown space {space!r}, expected one of {SPACES}")
+        if not len(ids):
+            raise ValueError("Cannot build a serving index without chunks")
+        embeddings = np.asarray(embeddings, dtype=np.float32)
+        if nlist is None:
+            nlist = 1 if len(ids) < IVF_MIN_ROWS else int(math.sqrt(len(ids)))
+        nlist = max(1, min(nlist, len(ids)))
+
+        #1. IVF lists (on unit vectors for cosine, so they cluster by angle)
+        train = embeddings
+        if space == "cosine":
+            norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+            train = embeddings / np.where(norms > 0, norms, 1.0)
+        if nlist == 1:
+            centroids = train.mean(axis=0, keepdims=True)
+            assignment = np.zeros(len(ids), dtype=np.int64)
+        else:
+            centroids = kmeans(train, nlist)
+            assignment = nearest_centroids(train, centroids)
+        order = np.argsort(assignment, kind="stable")
+        list_offsets = np.zeros(nlist + 1, dtype=np.int64)
+        list_offsets[1:] = np.cumsum(np.bincount(assignment, minlength=nlist))
+
+        #2. Rows in list order, quantized
+        embeddings = embeddings[order]
+        codes, scales = quantize(embeddings, dtype)
+        sq_norms = (embeddings * embeddings).sum(axis=1).astype(np.float32)
+
+        #3. Packed records: document bytes, then metadata JSON, per row
+        pieces = []
+        record_offsets = np.zeros(2 * len(ids) + 1, dtype=np.int64)
+        position = 0
+        for i, row in enumerate(order):
+            for j, piece in enumerate(((documents[row] or "").encode("utf-8"),
+                                       json.dumps(metadatas[row]).encode("utf-8"))):
+                pieces.append(piece)
+                position += len(piece)
+                record_offsets[2 * i + j + 1] = position
+        records = b"".join(pieces)
+
+        return cls([ids[row] for row in order], codes, scales, sq_norms, centroids.astype(np.float32),
+                   list_offsets, record_offsets, records, space=space, nprobe=nprobe)
+
+    def save(self, path):
+        """
+        Write the index to path, replacing any previous index there
+        """
+        tmp_path = path + ".tmp"
+        shutil.rmtree(tmp_path, ignore_errors=True)
+        os.makedirs(tmp_path)
+        for name, array in zip(self.FILES, (self.codes, self.scales, self.sq_norms, self.centroids,
+                                            self.list_offsets, self.record_offsets)):
+            np.save(os.path.join(tmp_path, name), array)
+        with open(os.path.join(tmp_path, self.RECORDS), "wb") as f:
+            f.write(bytes(self.records))
+        with open(os.path.join(tmp_path, "meta.json"), "w") as f:
+            json.dump({"space": self.space, "nprobe": self.nprobe, "dtype": str(self.codes.dtype),
+                       "ids": self.ids}, f)
+
+        # Open readers keep their memory maps of the old files
+        old_path = path + ".old"
+        shutil.rmtree(old_path, ignore_errors=True)
+        if os.path.exists(path):
+            os.replace(path, old_path)
+        os.replace(tmp_path, path)
+        shutil.rmtree(old_path, ignore_errors=True)
+
+    @classmethod
+    def load(cls, path) -> "ServingIndex":
+        with open(os.path.join(path, "meta.json")) as f:
+            meta = json.load(f)
+        arrays = [np.load(os.path.join(path, name), mmap_mode="r") for name in cls.FILES]
+        records_path = os.path.join(path, cls.RECORDS)
+        # An empty file cannot be memory-mapped
+        records = np.memmap(records_path, dtype=np.uint8, mode="r") if os.path.getsize(records_path) else b""
+        return cls(meta["ids"], *arrays, records, space=meta["space"], nprobe=meta["nprobe"])
+
+    def count(self):
+        return len(self.ids)
+
+    def _distances(self, query, rows: slice):
+        dots = (self.codes[rows].astype(np.float32) @ query) * self.scales[rows]
+        if self.space == "ip":
+            return 1.0 - dots
+        if self.space == "cosine":
+            norms = np.sqrt(self.sq_norms[rows]) * np.linalg.norm(query)
+            return 1.0 - dots / np.where(norms > 0, norms, 1.0)
+        return self.sq_norms[rows] + float(query @ query) - 2 * dots
+
+    def search(self, query, k: int = 5, nprobe: Optional[int] = None):
+        """
+        Returns (rows, distances) of the k nearest chunks, nearest first
+        """
+        query = np.asarray(query, dtype=np.float32)
+        probe = query
+        if self.space == "cosine":
+            norm = np.linalg.norm(query)
+            probe = query / norm if norm > 0 else query
+        lists = nearest_centroids(probe[None, :], np.asarray(self.centroids), nprobe or self.nprobe)
+        lists = np.atleast_1d(lists[0])
+
+        rows, distances = [], []
+        for lst in lists:
+            start, end = int(self.list_offsets[lst]), int(self.list_offsets[lst + 1])
+            if start < end:
+                rows.append(np.arange(start, end))
+                distances.append(self._distances(query, slice(start, end)))
+        if not rows:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32)
+        rows, distances = np.concatenate(rows), np.concatenate(distances)
+        if len(rows) > k:
+            top = np.argpartition(distances, k)[:k]
+            rows, distances = rows[top], distances[top]
+        best = np.argsort(distances, kind="stable")
+        return rows[best], distances[best]
+
+    def _field(self, row, field):
+        if field == "documents":
+            start, end = self.record_offsets[2 * row], self.record_offsets[2 * row + 1]
+            return bytes(self.records[start:end]).decode("utf-8")
+        if field == "metadatas":
+            start, end = self.record_offsets[2 * row + 1], self.record_offsets[2 * row + 2]
+            return json.loads(bytes(self.records[start:end]))
+        if field == "embeddings":
+            return self.codes[row].astype(np.float32) * self.scales[row]
+        raise ValueError(f"Unsupported include field {field!r}")
+
+    def query(self, query_embeddings, n_results: int = 5, include=("documents", "metadatas", "distances"),
+              nprobe: Optional[int] = None):
+        """
+        Chroma-style results: {"ids": [[...]], <field>: [[...]]} with one inner list per query
+        """
+        results = {"ids": []}
+        results.update({field: [] for field in include})
+        for query in query_embeddings:
+            rows, distances = self.search(query, n_results, nprobe)
+            results["ids"].append([self.ids[row] for row in rows])
+            for field in include:
+                if field == "distances":
+                    results[field].append([float(d) for d in distances])
+                else:
+                    results[field].append([self._field(row, field) for row in rows])
+        return results
+
+    def get(self, ids: List[str], include=("documents", "metadatas")):
+        """
+        Chroma-style results for the given ids; unknown ids are skipped
+        """
+        rows = [self._rows[id_] for id_ in ids if id_ in self._rows]
+        results = {"ids": [self.ids[row] for row in rows]}
+        for field in include:
+            results[field] = [self._field(row, field) for row in rows]
+        return results
+
+
+def collection_space(collection):
+    configuration = getattr(collection, "configuration", None) or {}
+    space = (configuration.get("hnsw") or {}).get("space")
+    return space or (collection.metadata or {}).get("hnsw:space", "l2")
+
+
+def export_serving_index(collection, db_path="vectorstore", collection_name="faq", dtype="int8",
+                         nlist: Optional[int] = None):
+    """
+    Rebuild the serving index from every chunk currently in the Chroma
+    collection; returns None (and leaves any previous index) if it is empty
+    """
+    chunks = collection.get(include=["embeddings", "documents", "metadatas"])
+    if not chunks["ids"]:
+        return None
+    index = ServingIndex.build(chunks["ids"], chunks["embeddings"], chunks["documents"], chunks["metadatas"],
+                               space=collection_space(collection), dtype=dtype, nlist=nlist)
+    index.save(serving_path(db_path, collection_name))
+    return index
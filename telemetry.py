@@ -0,0 +1,215 @@
+# telemetry.py
+import json
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict
+
+# Seconds; wide enough for both the keyword matcher and the LLM-backed guards
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+_configured = False
+
+
+def configure_logging(level=None):
+    """
+    Set up root logging once; the level comes from LOG_LEVEL (default WARNING).
+    Called by entry points (main.py, build-vector-db.py, the benchmarks), not on
+    import, so applications embedding these modules keep their own logging setup
+    """
+    global _configured
+    if _configured:
+        return
+    logging.basicConfig(
+        level=(level or os.getenv("LOG_LEVEL", "WARNING")).upper(),
+        format="%(asctime)s %(levelname)s %(name)s: %(message)s",
+    )
+    _configured = True
+
+
+def get_logger(name):
+    return logging.getLogger(name)
+
+
+def _label_key(labels):
+    return tuple(sorted(labels.items()))
+
+
+def _escape_label(value):
+    # Prometheus text format: backslash, double quote and newline are escaped
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+class MetricsRegistry:
+    """
+    Thread-safe in-process counters and histograms with Prometheus-text and
+    JSON-lines exporters
+    """
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        self._lock = threading.Lock()
+        self._counters = {}  # name -> {label_key: value}
+        self._histograms = {}  # name -> {label_key: [bucket_counts, sum, count]}
+        self._histogram_buckets = {}  # name -> buckets, where not the default
+        self._gauge_sources = {}  # name -> callable returning {field: number}
+
+    def increment(self, name, value=1, **labels):
+        key = _label_key(labels)
+        with self._lock:
+            series = self._counters.setdefault(name, {})
+            series[key] = series.get(key, 0) + value
+
+    def define_histogram(self, name, buckets):
+        """
+        Use buckets instead of the default (seconds) ones for histogram name
+        """
+        with self._lock:
+            self._histogram_buckets[name] = tuple(buckets)
+
+    def buckets_for(self, name):
+        return self._histogram_buckets.get(name, self.buckets)
+
+    def observe(self, name, value, **labels):
+        key = _label_key(labels)
+        with self._lock:
+            buckets = self.buckets_for(name)
+            series = self._histograms.setdefault(name, {})
+            state = series.get(key)
+            if state is None:
+                state = series[key] = [[0] * len(buckets), 0.0, 0]
+            for i, bound in enumerate(buckets):
+                if value <= bound:
+                    state[0][i] += 1
+            state[1] += value
+            state[2] += 1
+
+    def register_gauges(self, name, source: Callable[[], Dict[str, float]]):
+        """
+        Report the numeric fields of source() (e.g. a cache's stats) as gauges name_<field>
+        """
+        with self._lock:
+            self._gauge_sources[name] = source
+
+    def reset(self):
+        with self._lock:
+            self._counters.clear()
+            self._histograms.clear()
+
+    def snapshot(self):
+        with self._lock:
+            counters = {name: dict(series) for name, series in self._counters.items()}
+            histograms = {name: {key: [list(s[0]), s[1], s[2]] for key, s in series.items()}
+                          for name, series in self._histograms.items()}
+            gauge_sources = dict(self._gauge_sources)
+        gauges = {}
+        for name, source in gauge_sources.items():
+            for field, value in source().items():
+                if isinstance(value, (int, float)):
+                    gauges[f"{name}_{field}"] = value
+        return counters, histograms, gauges
+
+    def export_prometheus(self) -> str:
+        counters, histograms, gauges = self.snapshot()
+
+        def fmt(labels):
+            if not labels:
+                return ""
+            return "{" + ",".join(f'{k}="{_escape_label(v)}"' for k, v in labels) + "}"
+
+        lines = []
+        for name, series in sorted(counters.items()):
+            lines.append(f"# TYPE {name} counter")
+            for key, value in series.items():
+                lines.append(f"{name}{fmt(key)} {value}")
+        for name, series in sorted(histograms.items()):
+            lines.append(f"# TYPE {name} histogram")
+            for key, (bucket_counts, total, count) in series.items():
+                for bound, bucket_count in zip(self.buckets_for(name), bucket_counts):
+                    lines.append(f"{name}_bucket{fmt(key + (('le', bound),))} {bucket_count}")
+                lines.append(f"{name}_bucket{fmt(key + (('le', '+Inf'),))} {count}")
+                lines.append(f"{name}_sum{fmt(key)} {total}")
+                lines.append(f"{name}_count{fmt(key)} {count}")
+        for name, value in sorted(gauges.items()):
+            lines.append(f"# TYPE {name} gauge")
+            lines.append(f"{name} {value}")
+        return "\n".join(lines) + "\n"
+
+    def export_json_lines(self) -> str:
+        counters, histograms, gauges = self.snapshot()
+        now = time.time()
+        records = []
+        for name, series in counters.items():
+            for key, value in series.items():
+                records.append({"ts": now, "type": "counter", "name": name, "labels": dict(key), "value": value})
+        for name, series in histograms.items():
+            for key, (bucket_counts, total, count) in series.items():
+                records.append({"ts": now, "type": "histogram", "name": name, "labels": dict(key),
+                                "buckets": dict(zip(map(str, self.buckets_for(name)), bucket_counts)),
+                                "sum": total, "count": count})
+        for name, value in gauges.items():
+            records.append({"ts": now, "type": "gauge", "name": name, "labels": {}, "value": value})
+        return "".join(json.dumps(record) + "\n" for record in records)
+
+    def write(self, path, fmt="prometheus"):
+        """
+        Write a snapshot to path atomically (prometheus text, or jsonl appended)
+        """
+        if fmt == "jsonl":
+            with open(path, "a") as f:
+                f.write(self.export_json_lines())
+            return
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w") as f:
+            f.write(self.export_prometheus())
+        os.replace(tmp_path, path)
+
+
+metrics = MetricsRegistry()
+_logger = get_logger("telemetry")
+_span_file = os.getenv("TRACE_SPANS_PATH")
+_span_lock = threading.Lock()
+
+
+@contextmanager
+def span(name, **labels):
+    """
+    Time a pipeline stage into the stage_duration_seconds histogram.
+    With TRACE_SPANS_PATH set, each span is also appended there as a JSON line.
+    """
+    start_wall = time.time()
+    start = time.perf_counter()
+    status = "ok"
+    try:
+        yield
+    except BaseException:
+        status = "error"
+        raise
+    finally:
+        duration = time.perf_counter() - start
+        metrics.observe("stage_duration_seconds", duration, stage=name, **labels)
+        _logger.debug("span %s %.1fms %s", name, duration * 1e3, status)
+        if _span_file:
+            record = {"ts": start_wall, "span": name, "duration_s": duration, "status": status, **labels}
+            with _span_lock, open(_span_file, "a") as f:
+                f.write(json.dumps(record) + "\n")
+
+
+def start_exporter(path, interval=15.0, fmt="prometheus"):
+    """
+    Periodically write metrics to path from a daemon thread, e.g. for the
+    node_exporter textfile collector
+    """
+    def _loop():
+        while True:
+            time.sleep(interval)
+            try:
+                metrics.write(path, fmt)
+            except OSError as e:
+                _logger.warning("Metrics export to %s failed: %s", path, e)
+
+    thread = threading.Thread(target=_loop, name="metrics-exporter", daemon=True)
+    thread.start()
+    return thread
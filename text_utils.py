@@ -0,0 +1,71 @@
+# text_utils.py
+import re
+from typing import List, Tuple
+
+# End of sentence: terminal punctuation, optional closing quotes/brackets, then whitespace
+_SENTENCE_END = re.compile(r'[.!?]["\'”’)\]]*(\s+)')
+# Short abbreviations that should not end a sentence
+_ABBREVIATIONS = {"e.g.", "i.e.", "etc.", "mr.", "mrs.", "ms.", "dr.", "no.", "approx.", "vs."}
+
+
+def _sentence_ends(text):
+    for m in _SENTENCE_END.finditer(text):
+        last_word = text[:m.start(1)].rsplit(None, 1)[-1].lower()
+        if last_word not in _ABBREVIATIONS:
+            yield m
+
+
+def _add_span(spans, text, start, end):
+    # Trim surrounding whitespace; skip empty segments
+    segment = text[start:end]
+    stripped = segment.strip()
+    if stripped:
+        start += len(segment) - len(segment.lstrip())
+        spans.append((start, start + len(stripped)))
+
+
+def sentence_spans(text: str) -> List[Tuple[int, int]]:
+    """
+    (start, end) offsets of the sentences split_sentences returns
+    """
+    spans = []
+    start = 0
+    for m in _sentence_ends(text):
+        _add_span(spans, text, start, m.start(1))
+        start = m.end()
+    _add_span(spans, text, start, len(text))
+    return spans
+
+
+def split_sentences(text: str) -> List[str]:
+    """
+    Split text into sentences on ., ! or ? followed by whitespace
+    """
+    return [text[start:end] for start, end in sentence_spans(text)]
+
+
+class SentenceBuffer:
+    """
+    Accumulates streamed text and hands back each sentence once it is complete.
+    Sentences keep the whitespace that followed them, so joining them gives back
+    the streamed text.
+    """
+
+    def __init__(self):
+        self._buffer = ""
+
+    def feed(self, text: str) -> List[str]:
+        self._buffer += text
+        sentences = []
+        start = 0
+        for m in _sentence_ends(self._buffer):
+            sentence = self._buffer[start:m.end()]
+            if sentence.strip():
+                sentences.append(sentence)
+            start = m.end()
+        self._buffer = self._buffer[start:]
+        return sentences
+
+    def flush(self) -> List[str]:
+        tail, self._buffer = self._buffer, ""
+        return [tail] if tail.strip() else []
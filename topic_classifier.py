@@ -0,0 +1,83 @@
+# topic_classifier.py
+from typing import Callable, Dict, List, NamedTuple, Optional
+
+import numpy as np
+
+import model_registry
+
+ACCEPT = "accept"
+REJECT = "reject"
+AMBIGUOUS = "ambiguous"
+
+
+class TopicClassification(NamedTuple):
+    topic: Optional[str]
+    score: float
+    decision: str
+
+
+class SemanticTopicClassifier:
+    """
+    Classify text against topics by cosine similarity of sentence embeddings.
+
+    The topic names and their example phrasings are embedded once at startup into
+    a row-normalized matrix; each query then costs one embedding and one
+    matrix-vector product.
+    """
+
+    def __init__(
+            self,
+            topics: List[str],
+            examples: Optional[Dict[str, List[str]]] = None,
+            embedding_function: Optional[Callable] = None,
+            accept_threshold: float = 0.6,
+            reject_threshold: float = 0.3,
+    ):
+        """
+        Args:
+            topics: All topics to classify against (valid and invalid)
+            examples: Optional extra phrasings per topic, e.g. {"baggage allowance": ["how much luggage can I take"]}
+            embedding_function: Chroma-style callable mapping a list of texts to a list of vectors
+            accept_threshold: Best similarity at or above which the topic is accepted
+            reject_threshold: Best similarity below which no topic is assigned
+        """
+        if reject_threshold > accept_threshold:
+            raise ValueError("reject_threshold must not exceed accept_threshold")
+
+        if embedding_function is None:
+            embedding_function = model_registry.embedding_function()
+
+        self.embedding_function = embedding_function
+        self.accept_threshold = accept_threshold
+        self.reject_threshold = reject_threshold
+
+        # One row per phrasing, each pointing back at its topic
+        phrases = []
+        self.row_topics = []
+        for topic in topics:
+            for phrase in [topic] + list((examples or {}).get(topic, [])):
+                phrases.append(phrase)
+                self.row_topics.append(topic)
+
+        self.matrix = self._normalize(np.asarray(embedding_function(phrases), dtype=np.float32))
+
+    @staticmethod
+    def _normalize(vectors: np.ndarray) -> np.ndarray:
+        norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+        return vectors / np.maximum(norms, 1e-12)
+
+    def classify(self, text: str) -> TopicClassification:
+        """
+        Returns the closest topic with its similarity and a decision:
+        accept (confident), reject (no topic) or ambiguous (ask the LLM)
+        """
+        query = self._normalize(np.asarray(self.embedding_function([text])[0], dtype=np.float32))
+        scores = self.matrix @ query
+        best = int(np.argmax(scores))
+        score = float(scores[best])
+
+        if score >= self.accept_threshold:
+            return TopicClassification(self.row_topics[best], score, ACCEPT)
+        if score < self.reject_threshold:
+            return TopicClassification(None, score, REJECT)
+        return TopicClassification(self.row_topics[best], score, AMBIGUOUS)
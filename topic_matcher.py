@@ -0,0 +1,91 @@
+# topic_matcher.py
+import re
+from typing import Dict, Iterable, List, NamedTuple, Optional
+
+
+class TopicMatch(NamedTuple):
+    topic: str
+    start: int
+    end: int
+    invalid: bool
+
+
+def build_trie_pattern(phrases: Iterable[str]) -> str:
+    """
+    Build a regex alternation from phrases, factored as a character trie so the
+    regex engine never re-tries a shared prefix. Longer phrases are tried first.
+    """
+    trie: Dict = {}
+    for phrase in phrases:
+        if not phrase:
+            continue
+        node = trie
+        for char in phrase:
+            node = node.setdefault(char, {})
+        node[""] = True
+
+    def _emit(node: Dict) -> str:
+        terminal = "" in node
+        branches = [re.escape(char) + _emit(child)
+                    for char, child in sorted(node.items()) if char]
+        if not branches:
+            return ""
+        if len(branches) == 1 and not terminal:
+            return branches[0]
+        body = "(?:" + "|".join(branches) + ")"
+        return body + "?" if terminal else body
+
+    return _emit(trie)
+
+
+class TopicMatcher:
+    """
+    Match text against valid/invalid topics in a single scan.
+
+    All topics are compiled once into one trie-factored regex wrapped in a
+    lookahead, so every start position is tried exactly once and overlapping
+    matches are still seen. Invalid topics win over valid ones, as in the
+    original per-topic loop.
+    """
+
+    def __init__(self, valid_topics: List[str], invalid_topics: List[str]):
+        self.valid_topics = {t.lower() for t in valid_topics if t}
+        self.invalid_topics = {t.lower() for t in invalid_topics if t}
+        topics = self.valid_topics | self.invalid_topics
+
+        # The regex only reports the longest topic at a position; any shorter
+        # topic that is a prefix of it (ending on a word boundary) matched too.
+        self._prefix_topics = {
+            topic: [t for t in self._word_prefixes(topic) if t in topics]
+            for topic in topics
+        }
+        self._pattern = re.compile(
+            r"(?=\b(" + build_trie_pattern(topics) + r")\b)") if topics else None
+
+    @staticmethod
+    def _word_prefixes(topic: str) -> List[str]:
+        prefixes = []
+        for i in range(1, len(topic)):
+            left, right = topic[i - 1], topic[i]
+            if (left.isalnum() or left == "_") != (right.isalnum() or right == "_"):
+                prefixes.append(topic[:i])
+        return prefixes
+
+    def match(self, text: str) -> Optional[TopicMatch]:
+        """
+        Returns the first invalid topic match in the text, otherwise the first
+        valid one, otherwise None
+        """
+        if self._pattern is None:
+            return None
+
+        first_valid = None
+        for m in self._pattern.finditer(text.lower()):
+            start = m.start(1)
+            longest = m.group(1)
+            for topic in [longest] + self._prefix_topics[longest]:
+                if topic in self.invalid_topics:
+                    return TopicMatch(topic, start, start + len(topic), True)
+            if first_valid is None:
+                first_valid = TopicMatch(longest, start, m.end(1), False)
+        return first_valid